@@ -0,0 +1,138 @@
+"""
+Guillotine排列性能测试
+
+生成随机矩形，在总面积1.15倍的正方形画布上执行guillotine_packing，
+输出find_position耗时、总耗时和排列结果的校验值。
+
+对比修改前后的性能时，用git worktree检出旧版本，再通过--root指定：
+
+    git worktree add ../kr_tools_before <旧版本>
+    python benchmarks/bench_packing.py --root ../kr_tools_before
+    python benchmarks/bench_packing.py
+"""
+
+import argparse, hashlib, importlib, os, random, sys, time
+from functools import wraps
+from pathlib import Path
+
+# 随机矩形的边长范围
+RECT_SIDE_RANGE = (8, 64)
+
+# 画布面积相对矩形总面积的倍数
+CANVAS_AREA_FACTOR = 1.15
+
+SORT_KEYS = {
+    "width": lambda size: size.w,
+    "area": lambda size: size.area(),
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Guillotine排列性能测试")
+    parser.add_argument(
+        "--root",
+        default=Path(__file__).resolve().parent.parent,
+        type=Path,
+        help="被测试的KR_Tools目录，默认为当前仓库",
+    )
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        type=int,
+        default=[2000, 10000, 50000],
+        help="矩形数量",
+    )
+    parser.add_argument(
+        "--orders",
+        nargs="+",
+        choices=SORT_KEYS,
+        default=list(SORT_KEYS),
+        help="矩形排序方式（降序）",
+    )
+    parser.add_argument("--seed", type=int, default=1, help="随机数种子")
+    return parser.parse_args()
+
+
+def load_generate_atlas(root):
+    """从指定目录导入generate_atlas模块，lib.config按工作目录读取设置"""
+    root = root.resolve()
+    os.chdir(root)
+    sys.path.insert(0, str(root))
+    module = importlib.import_module("tools.generate_atlas")
+
+    # 旧版本只用到其中的一部分参数
+    module.setting_var = {
+        "border_var": 0,
+        "allow_rotation_var": False,
+        "max_size_var": 1 << 20,
+    }
+    return module
+
+
+def make_rectangles(module, count, order, seed):
+    rng = random.Random(seed)
+    rectangles = [
+        (
+            i,
+            f"rect_{i}",
+            module.Size(rng.randint(*RECT_SIDE_RANGE), rng.randint(*RECT_SIDE_RANGE)),
+        )
+        for i in range(count)
+    ]
+    rectangles.sort(key=lambda r: SORT_KEYS[order](r[2]), reverse=True)
+    return rectangles
+
+
+def time_find_position(module):
+    """统计find_position的累计耗时，guillotine_packing按模块全局名调用它"""
+    elapsed = [0.0]
+    find_position = module.find_position
+
+    @wraps(find_position)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return find_position(*args, **kwargs)
+        finally:
+            elapsed[0] += time.perf_counter() - start
+
+    module.find_position = wrapper
+    return elapsed
+
+
+def get_layout_digest(result):
+    digest = hashlib.md5()
+    for rect_id, _, rect in sorted(result, key=lambda r: r[0]):
+        digest.update(f"{rect_id}:{rect.x},{rect.y},{rect.w},{rect.h};".encode())
+    return digest.hexdigest()[:12]
+
+
+def main():
+    args = parse_args()
+    module = load_generate_atlas(args.root)
+    find_elapsed = time_find_position(module)
+
+    print(f"root: {args.root.resolve()}")
+    print(
+        f"{'order':<6} {'rects':>6} {'find_position':>14} {'total':>9} {'placed':>7}  layout"
+    )
+
+    for order in args.orders:
+        for count in args.sizes:
+            rectangles = make_rectangles(module, count, order, args.seed)
+            total_area = sum(rect.area() for _, _, rect in rectangles)
+            side = int((total_area * CANVAS_AREA_FACTOR) ** 0.5)
+
+            find_elapsed[0] = 0.0
+            start = time.perf_counter()
+            result = module.guillotine_packing(rectangles, module.Size(side, side))
+            total = time.perf_counter() - start
+
+            print(
+                f"{order:<6} {count:>6} {find_elapsed[0] * 1000:>11.0f} ms "
+                f"{total:>7.2f} s {len(result):>7}  {get_layout_digest(result)}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -72,6 +72,42 @@ class WriteLua:
     # def generate_lua_content(self):
 
 
+class StreamWriteLua:
+    """
+    流式写入Lua表
+
+    直接写入文件对象，不在内存中拼接整个文件。
+    逗号在写入下一项时补在上一项之后，结束时无需回头删除上一行末尾的逗号
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.indent_char = "\t"
+        self.item_counts = []  # 每层未结束的表已写入的项数
+
+    def write_item(self, text):
+        """写入当前表的一项，text为已缩进的完整内容，可包含多行"""
+        if self.item_counts:
+            self.file.write(",\n" if self.item_counts[-1] else "\n")
+            self.item_counts[-1] += 1
+        self.file.write(text)
+        return self  # 支持链式调用
+
+    def start(self, indent_level=0, key=None, head=None):
+        """开始一个表，head指定时直接作为开头，如"return {" """
+        if head is None:
+            head = f"{key_to_lua(key)} = {{" if key else "{"
+        self.write_item(self.indent_char * indent_level + head)
+        self.item_counts.append(0)
+        return self
+
+    def end(self, indent_level=0):
+        """结束当前表"""
+        self.item_counts.pop()
+        self.file.write("\n" + self.indent_char * indent_level + "}")
+        return self
+
+
 class FieldMeta(ABCMeta):
     """元类，自动生成__init__方法"""
 
@@ -0,0 +1,548 @@
+import struct
+import numpy as np
+from PIL import Image
+import lib.log as log
+
+log = log.setup_logging()
+
+# 每批编码的4x4块数量，限制求最近调色板时的临时数组大小
+CHUNK_BLOCKS = 16384
+
+# DDS文件头常量
+DDSD_CAPS = 0x1
+DDSD_HEIGHT = 0x2
+DDSD_WIDTH = 0x4
+DDSD_PIXELFORMAT = 0x1000
+DDSD_MIPMAPCOUNT = 0x20000
+DDSD_LINEARSIZE = 0x80000
+DDPF_FOURCC = 0x4
+DDSCAPS_COMPLEX = 0x8
+DDSCAPS_TEXTURE = 0x1000
+DDSCAPS_MIPMAP = 0x400000
+DXGI_FORMAT_BC7_UNORM = 98
+D3D10_RESOURCE_DIMENSION_TEXTURE2D = 3
+
+# BC7 4位索引的插值权重
+BC7_WEIGHTS = np.array(
+    [0, 4, 9, 13, 17, 21, 26, 30, 34, 38, 43, 47, 51, 55, 60, 64], dtype=np.int32
+)
+
+# BC7端点量化时RGBA各通道的误差权重
+ENDPOINT_ERROR_WEIGHTS = np.array([1, 1, 1, 4], dtype=np.float32)
+
+# 各格式每个4x4块的字节数
+BLOCK_BYTES = {"bc1": 8, "bc3": 16, "bc7": 16}
+
+# 生成mipmap时可选的缩小滤波器
+MIPMAP_FILTERS = {"box": Image.Resampling.BOX, "lanczos": Image.Resampling.LANCZOS}
+
+# 上下左右四个方向的(目标切片, 来源切片)，用于取每个像素的相邻像素
+NEIGHBOR_SLICES = (
+    ((slice(1, None), slice(None)), (slice(None, -1), slice(None))),
+    ((slice(None, -1), slice(None)), (slice(1, None), slice(None))),
+    ((slice(None), slice(1, None)), (slice(None), slice(None, -1))),
+    ((slice(None), slice(None, -1)), (slice(None), slice(1, None))),
+)
+
+
+def image_to_blocks(rgba):
+    """
+    将RGBA像素数组切分为4x4块
+
+    宽高不是4的倍数时复制边缘像素补齐
+
+    Args:
+        rgba: 形状为(高, 宽, 4)的uint8数组
+
+    Returns:
+        ndarray: 形状为(块数, 16, 4)的int32数组，块按行优先排列
+    """
+    height, width = rgba.shape[:2]
+    pad_h = -height % 4
+    pad_w = -width % 4
+    if pad_h or pad_w:
+        rgba = np.pad(rgba, ((0, pad_h), (0, pad_w), (0, 0)), mode="edge")
+
+    blocks_y = rgba.shape[0] // 4
+    blocks_x = rgba.shape[1] // 4
+    blocks = rgba.reshape(blocks_y, 4, blocks_x, 4, 4).swapaxes(1, 2)
+
+    return blocks.reshape(-1, 16, 4).astype(np.int32)
+
+
+def principal_endpoints(pixels):
+    """
+    沿主成分方向取像素投影的两端作为初始端点
+
+    Args:
+        pixels: 形状为(块数, 16, 通道数)的像素数组
+
+    Returns:
+        tuple: (端点0, 端点1)，形状均为(块数, 通道数)的float数组
+    """
+    pixels = pixels.astype(np.float32)
+    mean = pixels.mean(axis=1, keepdims=True)
+    centered = pixels - mean
+    cov = np.einsum("nki,nkj->nij", centered, centered)
+
+    # 幂迭代求协方差矩阵的主特征向量
+    axis = np.ones(pixels.shape[::2], dtype=np.float32)
+    for _ in range(8):
+        axis = np.einsum("nij,nj->ni", cov, axis)
+        norm = np.abs(axis).max(axis=1, keepdims=True)
+        axis /= np.where(norm > 0, norm, 1)
+
+    proj = np.einsum("nki,ni->nk", centered, axis)
+    rows = np.arange(len(pixels))
+    low = pixels[rows, proj.argmin(axis=1)]
+    high = pixels[rows, proj.argmax(axis=1)]
+
+    return low, high
+
+
+def refine_endpoints(pixels, weights, low, high):
+    """
+    固定插值权重，用最小二乘重新拟合端点
+
+    Args:
+        pixels: 形状为(块数, 16, 通道数)的像素数组
+        weights: 形状为(块数, 16)的插值权重，取值0到1
+        low: 原端点0，行列式接近0时保留
+        high: 原端点1，行列式接近0时保留
+
+    Returns:
+        tuple: (端点0, 端点1)
+    """
+    pixels = pixels.astype(np.float32)
+    w1 = weights.astype(np.float32)
+    w0 = 1 - w1
+
+    a = (w0 * w0).sum(axis=1)
+    b = (w0 * w1).sum(axis=1)
+    d = (w1 * w1).sum(axis=1)
+    x = np.einsum("nk,nkc->nc", w0, pixels)
+    y = np.einsum("nk,nkc->nc", w1, pixels)
+
+    det = a * d - b * b
+    valid = (np.abs(det) > 1e-3)[:, None]
+    safe_det = np.where(valid[:, 0], det, 1)[:, None]
+
+    new_low = (d[:, None] * x - b[:, None] * y) / safe_det
+    new_high = (a[:, None] * y - b[:, None] * x) / safe_det
+
+    return np.where(valid, new_low, low), np.where(valid, new_high, high)
+
+
+def nearest_index(pixels, palette):
+    """
+    求每个像素在调色板中最接近的颜色索引
+
+    Args:
+        pixels: 形状为(块数, 16, 通道数)
+        palette: 形状为(块数, 调色板大小, 通道数)
+
+    Returns:
+        ndarray: 形状为(块数, 16)的索引
+    """
+    diff = pixels[:, :, None, :] - palette[:, None, :, :]
+    return (diff * diff).sum(axis=3).argmin(axis=2)
+
+
+def pack_index_bits(indices, bits):
+    """将每块16个索引按位打包为整数，第i个像素位于第bits*i位"""
+    shifts = np.arange(16, dtype=np.uint64) * np.uint64(bits)
+    return (indices.astype(np.uint64) << shifts).sum(axis=1, dtype=np.uint64)
+
+
+def to_rgb565(color):
+    """将RGB端点量化为565格式"""
+    color = np.clip(np.rint(color), 0, 255).astype(np.int32)
+    r = (color[:, 0] * 31 + 127) // 255
+    g = (color[:, 1] * 63 + 127) // 255
+    b = (color[:, 2] * 31 + 127) // 255
+
+    return (r << 11) | (g << 5) | b
+
+
+def from_rgb565(value):
+    """将565格式还原为8位RGB"""
+    r = (value >> 11) & 31
+    g = (value >> 5) & 63
+    b = value & 31
+
+    return np.stack([(r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)], 1)
+
+
+def encode_color_blocks(pixels):
+    """
+    编码BC1颜色块（四色模式）
+
+    端点0大于端点1，BC1和BC3均按四色插值解码
+
+    Args:
+        pixels: 形状为(块数, 16, 3)的RGB像素
+
+    Returns:
+        ndarray: 形状为(块数, 8)的uint8数组
+    """
+    low, high = principal_endpoints(pixels)
+
+    # 先按初始端点求索引，再用最小二乘修正端点
+    steps = np.array([0, 1 / 3, 2 / 3, 1], dtype=np.float32)
+    palette = low[:, None, :] + steps[None, :, None] * (high - low)[:, None, :]
+    weights = steps[nearest_index(pixels, palette)]
+    low, high = refine_endpoints(pixels, weights, low, high)
+
+    c0 = to_rgb565(high)
+    c1 = to_rgb565(low)
+
+    # 保证端点0大于端点1，相等时所有像素取端点0
+    swap = c0 < c1
+    c0, c1 = np.where(swap, c1, c0), np.where(swap, c0, c1)
+
+    e0 = from_rgb565(c0)
+    e1 = from_rgb565(c1)
+    palette = np.stack([e0, e1, (2 * e0 + e1) // 3, (e0 + 2 * e1) // 3], axis=1).astype(
+        np.int32
+    )
+    indices = nearest_index(pixels, palette)
+    indices[c0 == c1] = 0
+
+    out = np.empty((len(pixels), 8), dtype=np.uint8)
+    out[:, 0:2] = c0.astype("<u2").view(np.uint8).reshape(-1, 2)
+    out[:, 2:4] = c1.astype("<u2").view(np.uint8).reshape(-1, 2)
+    out[:, 4:8] = (
+        pack_index_bits(indices, 2).astype("<u4").view(np.uint8).reshape(-1, 4)
+    )
+
+    return out
+
+
+def encode_alpha_blocks(alpha):
+    """
+    编码BC3透明度块（八值插值模式）
+
+    Args:
+        alpha: 形状为(块数, 16)的透明度
+
+    Returns:
+        ndarray: 形状为(块数, 8)的uint8数组
+    """
+    a0 = alpha.max(axis=1)
+    a1 = alpha.min(axis=1)
+
+    # 索引0、1为端点，2-7为端点间6个插值
+    weights = np.array([0, 7, 1, 2, 3, 4, 5, 6], dtype=np.int32)
+    palette = ((7 - weights) * a0[:, None] + weights * a1[:, None]) // 7
+    diff = np.abs(alpha[:, :, None] - palette[:, None, :])
+    indices = diff.argmin(axis=2)
+
+    out = np.empty((len(alpha), 8), dtype=np.uint8)
+    out[:, 0] = a0
+    out[:, 1] = a1
+    bits = pack_index_bits(indices, 3)
+    out[:, 2:8] = bits.astype("<u8").view(np.uint8).reshape(-1, 8)[:, :6]
+
+    return out
+
+
+def put_bits(lo, hi, value, offset, width):
+    """将字段写入由两个uint64组成的128位块"""
+    value = value.astype(np.uint64) & np.uint64((1 << width) - 1)
+
+    if offset >= 64:
+        hi |= value << np.uint64(offset - 64)
+    elif offset + width <= 64:
+        lo |= value << np.uint64(offset)
+    else:
+        low_width = 64 - offset
+        lo |= (value & np.uint64((1 << low_width) - 1)) << np.uint64(offset)
+        hi |= value >> np.uint64(low_width)
+
+
+def quantize_bc7_endpoint(endpoint):
+    """
+    将RGBA端点量化为BC7模式6的7位值和P位
+
+    分别尝试P位为0和1，取误差较小者。透明度误差加权，使不透明像素尽量保持255
+
+    Returns:
+        tuple: (7位值数组, P位数组, 还原后的8位端点)
+    """
+    endpoint = np.clip(endpoint, 0, 255)
+    best = None
+
+    for p_bit in (0, 1):
+        value = np.clip(np.rint((endpoint - p_bit) / 2), 0, 127).astype(np.int32)
+        restored = value * 2 + p_bit
+        error = ((restored - endpoint) ** 2 * ENDPOINT_ERROR_WEIGHTS).sum(axis=1)
+
+        if best is None:
+            best = [value, np.zeros(len(endpoint), np.int32), restored, error]
+            continue
+
+        better = error < best[3]
+        best[0] = np.where(better[:, None], value, best[0])
+        best[1] = np.where(better, 1, best[1])
+        best[2] = np.where(better[:, None], restored, best[2])
+        best[3] = np.where(better, error, best[3])
+
+    return best[0], best[1], best[2]
+
+
+def bc7_palette(e0, e1):
+    """按BC7 4位权重在两个端点间插值"""
+    w = BC7_WEIGHTS[None, :, None]
+    return ((64 - w) * e0[:, None, :] + w * e1[:, None, :] + 32) >> 6
+
+
+def encode_bc7_mode6_blocks(pixels):
+    """
+    编码BC7模式6的块
+
+    模式6为单子集RGBA，端点7777加每端点1个P位，4位索引
+
+    Args:
+        pixels: 形状为(块数, 16, 4)的RGBA像素
+
+    Returns:
+        ndarray: 形状为(块数, 16)的uint8数组
+    """
+    low, high = principal_endpoints(pixels)
+
+    steps = BC7_WEIGHTS.astype(np.float32) / 64
+    palette = low[:, None, :] + steps[None, :, None] * (high - low)[:, None, :]
+    weights = steps[nearest_index(pixels, palette)]
+    low, high = refine_endpoints(pixels, weights, low, high)
+
+    v0, p0, e0 = quantize_bc7_endpoint(low)
+    v1, p1, e1 = quantize_bc7_endpoint(high)
+    indices = nearest_index(pixels, bc7_palette(e0, e1))
+
+    # 第一个像素的索引最高位须为0，否则交换端点并反转索引
+    swap = indices[:, 0] >= 8
+    v0, v1 = np.where(swap[:, None], v1, v0), np.where(swap[:, None], v0, v1)
+    p0, p1 = np.where(swap, p1, p0), np.where(swap, p0, p1)
+    indices = np.where(swap[:, None], 15 - indices, indices)
+
+    count = len(pixels)
+    lo = np.zeros(count, dtype=np.uint64)
+    hi = np.zeros(count, dtype=np.uint64)
+
+    put_bits(lo, hi, np.full(count, 1 << 6), 0, 7)
+    offset = 7
+    for channel in range(4):
+        put_bits(lo, hi, v0[:, channel], offset, 7)
+        put_bits(lo, hi, v1[:, channel], offset + 7, 7)
+        offset += 14
+
+    put_bits(lo, hi, p0, 63, 1)
+    put_bits(lo, hi, p1, 64, 1)
+
+    put_bits(lo, hi, indices[:, 0], 65, 3)
+    for i in range(1, 16):
+        put_bits(lo, hi, indices[:, i], 64 + 4 * i, 4)
+
+    out = np.empty((count, 16), dtype=np.uint8)
+    out[:, 0:8] = lo.astype("<u8").view(np.uint8).reshape(-1, 8)
+    out[:, 8:16] = hi.astype("<u8").view(np.uint8).reshape(-1, 8)
+
+    return out
+
+
+def encode_blocks(blocks, bc):
+    """
+    按格式编码4x4块
+
+    Args:
+        blocks: 形状为(块数, 16, 4)的RGBA像素
+        bc: 压缩格式，支持"bc1"、"bc3"、"bc7"
+
+    Returns:
+        ndarray: 形状为(块数, 每块字节数)的uint8数组
+    """
+    if bc == "bc1":
+        return encode_color_blocks(blocks[:, :, :3])
+    elif bc == "bc3":
+        return np.concatenate(
+            [
+                encode_alpha_blocks(blocks[:, :, 3]),
+                encode_color_blocks(blocks[:, :, :3]),
+            ],
+            axis=1,
+        )
+    elif bc == "bc7":
+        return encode_bc7_mode6_blocks(blocks)
+
+    raise KeyError(bc)
+
+
+def encode_image(img, bc):
+    """
+    将PIL图片编码为BC压缩数据
+
+    Args:
+        img: PIL图片
+        bc: 压缩格式，支持"bc1"、"bc3"、"bc7"
+
+    Returns:
+        bytes: 按行优先排列的压缩块数据
+    """
+    rgba = np.asarray(img.convert("RGBA"), dtype=np.uint8)
+    blocks = image_to_blocks(rgba)
+
+    encoded = np.empty((len(blocks), BLOCK_BYTES[bc]), dtype=np.uint8)
+    for start in range(0, len(blocks), CHUNK_BLOCKS):
+        chunk = blocks[start : start + CHUNK_BLOCKS]
+        encoded[start : start + CHUNK_BLOCKS] = encode_blocks(chunk, bc)
+
+    return encoded.tobytes()
+
+
+def dds_header(width, height, bc, mipmap_count=1):
+    """
+    生成DDS文件头
+
+    BC1、BC3使用DXT1、DXT5四字符码，BC7使用DX10扩展头
+
+    Args:
+        width: 图片宽度
+        height: 图片高度
+        bc: 压缩格式
+        mipmap_count: 包含的mipmap层数
+
+    Returns:
+        bytes: 包含"DDS "标识的文件头
+    """
+    linear_size = max(1, (width + 3) // 4) * max(1, (height + 3) // 4) * BLOCK_BYTES[bc]
+    fourcc = {"bc1": b"DXT1", "bc3": b"DXT5", "bc7": b"DX10"}[bc]
+
+    flags = DDSD_CAPS | DDSD_HEIGHT | DDSD_WIDTH | DDSD_PIXELFORMAT | DDSD_LINEARSIZE
+    caps = DDSCAPS_TEXTURE
+    if mipmap_count > 1:
+        flags |= DDSD_MIPMAPCOUNT
+        caps |= DDSCAPS_COMPLEX | DDSCAPS_MIPMAP
+
+    header = struct.pack(
+        "<4s7I44x2I4s20x5I",
+        b"DDS ",
+        124,
+        flags,
+        height,
+        width,
+        linear_size,
+        0,
+        mipmap_count if mipmap_count > 1 else 0,
+        32,
+        DDPF_FOURCC,
+        fourcc,
+        caps,
+        0,
+        0,
+        0,
+        0,
+    )
+
+    if bc == "bc7":
+        header += struct.pack(
+            "<5I", DXGI_FORMAT_BC7_UNORM, D3D10_RESOURCE_DIMENSION_TEXTURE2D, 0, 1, 0
+        )
+
+    return header
+
+
+def dilate_edges(img, radius):
+    """
+    将不透明像素的颜色向相邻的全透明像素扩展
+
+    全透明像素只填充颜色，透明度不变，显示效果不变；
+    不预乘透明度的采样和滤波在图片边缘不会混入透明像素的黑色。
+    每圈取已填充的上下左右相邻像素的平均色，共扩展radius圈
+
+    Args:
+        img: PIL图片
+        radius: 扩展圈数
+
+    Returns:
+        Image: 扩展后的RGBA图片
+    """
+    rgba = np.array(img.convert("RGBA"), dtype=np.uint8)
+    filled = rgba[..., 3] > 0
+    color = rgba[..., :3]
+
+    for _ in range(radius):
+        if filled.all():
+            break
+
+        total = np.zeros(color.shape, dtype=np.uint16)
+        count = np.zeros(filled.shape, dtype=np.uint8)
+        for target, source in NEIGHBOR_SLICES:
+            total[target] += color[source] * filled[source][..., None]
+            count[target] += filled[source]
+
+        grown = ~filled & (count > 0)
+        color[grown] = total[grown] // count[grown][:, None]
+        filled |= grown
+
+    return Image.fromarray(rgba)
+
+
+def generate_mipmaps(img, mipmap_filter="box", dilate_radius=0):
+    """
+    生成完整的mipmap链
+
+    在预乘透明度的RGBa模式下缩小，半透明边缘不会混入透明像素的颜色。
+    每层缩小后再扩展边缘颜色，扩展圈数随层级减半，不会越过图集中图片间的间距
+
+    Args:
+        img: PIL图片
+        mipmap_filter (str): 缩小滤波器，支持"box"、"lanczos"
+        dilate_radius (int): 原图的边缘扩展圈数，0表示不扩展
+
+    Returns:
+        list: 从原图开始、宽高逐层减半直到1x1的RGBA图片列表
+    """
+    resample = MIPMAP_FILTERS[mipmap_filter]
+
+    level = img.convert("RGBa")
+    premultiplied = [level]
+    while level.width > 1 or level.height > 1:
+        size = (max(1, level.width // 2), max(1, level.height // 2))
+        level = level.resize(size, resample)
+        premultiplied.append(level)
+
+    levels = []
+    for index, level in enumerate(premultiplied):
+        level = img.convert("RGBA") if index == 0 else level.convert("RGBA")
+        if dilate_radius:
+            level = dilate_edges(level, max(1, dilate_radius >> index))
+        levels.append(level)
+
+    return levels
+
+
+def save_dds(img, output_file, bc, mipmaps=False, mipmap_filter="box", dilate_radius=0):
+    """
+    使用内置编码器将PIL图片直接保存为DDS
+
+    不需要临时PNG文件和texconv，可在任意平台运行
+
+    Args:
+        img: PIL图片
+        output_file (Path): DDS文件路径
+        bc (str): 压缩格式，支持"bc1"、"bc3"、"bc7"
+        mipmaps (bool): 是否写入完整的mipmap链
+        mipmap_filter (str): 生成mipmap的缩小滤波器，见generate_mipmaps
+        dilate_radius (int): 生成mipmap时原图的边缘扩展圈数
+    """
+    log.info(f"✅ 保存为DDS {bc.upper()}格式: {output_file.name}...")
+
+    if mipmaps:
+        levels = generate_mipmaps(img, mipmap_filter, dilate_radius)
+    else:
+        levels = [img]
+
+    with open(output_file, "wb") as f:
+        f.write(dds_header(img.width, img.height, bc, len(levels)))
+        for level in levels:
+            f.write(encode_image(level, bc))
@@ -1,14 +1,27 @@
-import traceback, subprocess, time, re
+import traceback, subprocess, time, re, os
+from concurrent.futures import (
+    ThreadPoolExecutor,
+    ProcessPoolExecutor,
+    wait,
+    FIRST_COMPLETED,
+)
 from pathlib import Path
 import tkinter as tk
 import lib.config as config
 import lib.log as log
+import lib.dds as dds
 
 log = log.setup_logging()
 
 input_path = config.input_path
 output_path = config.output_path
 
+# 每次texconv调用转换的文件数量
+TEXCONV_BATCH_SIZE = 16
+
+# mipmap滤波器对应的texconv滤波器，texconv没有Lanczos，使用三次插值代替
+TEXCONV_FILTERS = {"box": "BOX", "lanczos": "CUBIC"}
+
 
 def indent(level):
     """
@@ -118,65 +131,243 @@ def run_decompiler(file_path, output_path="output"):
     return result
 
 
-def save_to_dds(target_file, output_path, bc, delete_temporary_png=False):
+def run_texconv(target_files, output_path, bc, mipmaps=False, mipmap_filter="box"):
     """
-    使用texconv工具将PNG图片转换为DDS格式
+    调用一次texconv转换多个PNG图片
 
     Args:
-        target_file (Path/str): 要转换的PNG图片文件路径
+        target_files (list): PNG图片文件路径列表
         output_path (Path/str): DDS文件输出目录
-        bc (str): BC压缩格式，支持"bc3"或"bc7"
-            - "bc3": DXT5压缩，支持Alpha通道
-            - "bc7": 高质量的BC压缩格式，支持更好的质量
-        delete_temporary_png (bool, optional): 转换后是否删除临时PNG文件，默认为False
+        bc (str): BC压缩格式字符串，如"BC3"、"BC7"
+        mipmaps (bool): 是否生成完整的mipmap链，否则只输出一层
+        mipmap_filter (str): 生成mipmap的缩小滤波器，见TEXCONV_FILTERS
 
     Returns:
         subprocess.CompletedProcess: 包含转换执行结果的CompletedProcess对象
-
-    Raises:
-        KeyError: 如果传入的bc参数不是有效的压缩格式
-
-    Note:
-        需要确保texconv.exe在系统路径中或当前目录下可用
-        此函数主要用于游戏资源处理中纹理格式转换
     """
-    # BC格式映射表
-    all_bc = {
-        "bc3": "BC3",  # 对应DXT5格式
-        "bc7": "BC7",  # 高质量压缩格式
-    }
-
-    # 获取对应的BC格式字符串
-    bc = all_bc[bc]
-
-    log.info(f"✅ 保存为DDS {bc}格式: {target_file.stem}.dds...")
-
     # 设置输出格式
     output_format = f"{bc}_UNORM"  # 无符号归一化格式
 
+    # mipmap层数，0表示完整的mipmap链
+    if mipmaps:
+        mipmap_args = ["-m", "0", "-if", TEXCONV_FILTERS[mipmap_filter]]
+    else:
+        mipmap_args = ["-m", "1"]
+
     # 执行texconv转换命令
-    result = subprocess.run(
+    return subprocess.run(
         [
             "bin/texconv.exe",  # DirectX纹理转换工具
             "-f",
             output_format,  # 指定输出格式
             "-y",  # 覆盖已存在的文件
+            *mipmap_args,
             "-o",
             output_path,  # 输出目录
-            target_file,  # 输入文件
+            *target_files,  # 输入文件
         ],
         capture_output=True,  # 捕获输出
         text=True,  # 以文本模式处理输出
     )
 
-    # 可选：删除临时PNG文件
-    if delete_temporary_png:
-        png_file = Path(target_file)
-        if png_file.exists():
-            png_file.unlink()
-            log.info(f"🗑️ 已删除临时PNG文件: {png_file.name}")
 
-    return result
+def run_timed(func, *args):
+    """
+    执行函数并计时，可提交到进程池
+
+    Returns:
+        tuple: (函数返回值, 耗时秒数)
+    """
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def use_texconv(encoder):
+    """
+    判断是否使用texconv转换DDS
+
+    Args:
+        encoder (str): DDS编码器设置
+            - "texconv": 使用bin/texconv.exe
+            - "builtin": 使用内置NumPy编码器
+            - "auto": Windows且存在texconv.exe时使用texconv，否则使用内置编码器
+
+    Returns:
+        bool: 是否使用texconv
+    """
+    if encoder == "auto":
+        return os.name == "nt" and Path("bin/texconv.exe").exists()
+
+    return encoder == "texconv"
+
+
+class DDSConverter:
+    """
+    DDS转换队列
+
+    收集一次运行中所有待转换的图片，用有界的工作池并行转换：
+    texconv每次调用批量转换多个PNG，内置编码器每张图片一个进程任务。
+    未完成的任务超过上限时先等待，避免图片全部堆积在内存中。
+    finish时等待全部任务完成，并按文件汇总失败信息
+    """
+
+    def __init__(
+        self,
+        output_path,
+        bc,
+        encoder="auto",
+        delete_temporary_png=False,
+        max_workers=0,
+        mipmaps=False,
+        mipmap_filter="box",
+        dilate_radius=0,
+    ):
+        """
+        Args:
+            output_path (Path): DDS文件输出目录
+            bc (str): BC压缩格式，支持"bc3"或"bc7"
+            encoder (str): DDS编码器设置，见use_texconv
+            delete_temporary_png (bool): 是否删除（或不生成）PNG文件
+            max_workers (int): 最大并行任务数，0表示使用全部CPU核心
+            mipmaps (bool): 是否生成完整的mipmap链
+            mipmap_filter (str): 生成mipmap的缩小滤波器，"box"或"lanczos"
+            dilate_radius (int): 生成mipmap时透明边缘的颜色扩展圈数
+        """
+        self.output_path = Path(output_path)
+        self.bc = bc
+        self.use_texconv = use_texconv(encoder)
+        self.delete_temporary_png = delete_temporary_png
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.mipmaps = mipmaps
+        self.mipmap_filter = mipmap_filter
+        self.dilate_radius = dilate_radius if mipmaps else 0
+
+        # texconv为子进程，线程即可并行；内置编码器需要多进程
+        if self.use_texconv:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        else:
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+
+        self.batch = []  # 等待texconv批量转换的PNG文件
+        self.pending = {}  # future -> 该任务转换的文件列表
+        self.converted = 0
+        self.failures = {}  # 文件名 -> 失败信息
+        self.timings = {}  # 文件名 -> 转换耗时，批量转换时按文件数平分
+
+    def add(self, img, target_file):
+        """
+        加入一张待转换的图片
+
+        Args:
+            img (Image): 要保存的图片
+            target_file (Path): PNG图片文件路径，DDS文件使用相同的文件名
+        """
+        target_file = Path(target_file)
+
+        if self.use_texconv:
+            # texconv不预乘透明度，先扩展原图的边缘颜色再由其生成mipmap
+            if self.dilate_radius:
+                img = dds.dilate_edges(img, self.dilate_radius)
+            img.save(target_file)
+            self.batch.append(target_file)
+            if len(self.batch) >= TEXCONV_BATCH_SIZE:
+                self.submit_batch()
+            return
+
+        if not self.delete_temporary_png:
+            img.save(target_file)
+
+        dds_file = self.output_path / f"{target_file.stem}.dds"
+        self.wait_pending(self.max_workers * 2)
+        future = self.executor.submit(
+            run_timed,
+            dds.save_dds,
+            img,
+            dds_file,
+            self.bc,
+            self.mipmaps,
+            self.mipmap_filter,
+            self.dilate_radius,
+        )
+        self.pending[future] = [target_file]
+
+    def submit_batch(self):
+        """提交当前批次的PNG文件给texconv"""
+        if not self.batch:
+            return
+
+        batch, self.batch = self.batch, []
+        self.wait_pending(self.max_workers * 2)
+        future = self.executor.submit(run_timed, self.convert_batch, batch)
+        self.pending[future] = batch
+
+    def convert_batch(self, batch):
+        """
+        调用texconv转换一批文件，返回失败的文件及对应输出
+
+        texconv对单个文件失败不会中断整批，因此按输出文件是否生成判断每个文件的结果
+
+        Returns:
+            dict: 文件名 -> 失败信息
+        """
+        start_time = time.time()
+        result = run_texconv(
+            batch, self.output_path, self.bc.upper(), self.mipmaps, self.mipmap_filter
+        )
+        output = (result.stdout or "") + (result.stderr or "")
+
+        failures = {}
+        for target_file in batch:
+            dds_file = self.output_path / f"{target_file.stem}.dds"
+            if dds_file.exists() and dds_file.stat().st_mtime >= start_time - 1:
+                if self.delete_temporary_png and target_file.exists():
+                    target_file.unlink()
+                continue
+
+            # 只保留提到该文件的输出行，没有时保留全部输出
+            lines = [line for line in output.splitlines() if target_file.stem in line]
+            failures[target_file.name] = "\n".join(lines) or output.strip()
+
+        return failures
+
+    def wait_pending(self, limit):
+        """等待未完成的任务减少到limit个以下，并收集结果"""
+        while self.pending and len(self.pending) >= limit:
+            done, _ = wait(self.pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files = self.pending.pop(future)
+                try:
+                    failures, seconds = future.result()
+                    failures = failures or {}
+                    for file in files:
+                        self.timings[file.name] = seconds / len(files)
+                except Exception as e:
+                    failures = {file.name: str(e) for file in files}
+
+                self.failures.update(failures)
+                self.converted += len(files) - len(failures)
+
+    def finish(self):
+        """
+        等待全部转换完成并报告失败的文件
+
+        Returns:
+            dict: 文件名 -> 失败信息
+        """
+        self.submit_batch()
+        self.wait_pending(1)
+        self.executor.shutdown()
+
+        log.info(f"✅ DDS {self.bc.upper()}转换完成: {self.converted} 个文件")
+        for name, message in self.failures.items():
+            log.error(f"❌ DDS转换失败: {name}\n{message}")
+
+        return self.failures
+
+    def shutdown(self):
+        """出错时停止转换，取消尚未开始的任务；finish之后调用不做任何事"""
+        self.executor.shutdown(cancel_futures=True)
 
 
 def all_letters_uppercase(s):
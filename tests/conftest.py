@@ -0,0 +1,38 @@
+import os, sys
+from pathlib import Path
+import pytest
+
+# lib.config在导入时按工作目录读取setting.json
+ROOT = Path(__file__).resolve().parent.parent
+os.chdir(ROOT)
+sys.path.insert(0, str(ROOT))
+
+import lib.config as config
+import tools.generate_atlas as generate_atlas
+
+
+@pytest.fixture
+def io_paths(tmp_path, monkeypatch):
+    """
+    将输入、输出目录指向临时目录
+
+    生成图集会修改generate_atlas.setting_var，测试结束后一并恢复
+
+    Returns:
+        tuple: (输入目录, 输出目录)
+    """
+    input_path = tmp_path / "input"
+    output_path = tmp_path / "output"
+    input_path.mkdir()
+    output_path.mkdir()
+
+    monkeypatch.setattr(config, "input_path", input_path)
+    monkeypatch.setattr(config, "output_path", output_path)
+    monkeypatch.setattr(
+        generate_atlas,
+        "setting_var",
+        getattr(generate_atlas, "setting_var", None),
+        raising=False,
+    )
+
+    return input_path, output_path
@@ -0,0 +1,153 @@
+return {
+	hero_idle_0001 = {
+		a_name = "hero-1.png",
+		size = {
+			64,
+			80
+		},
+		trim = {
+			3,
+			5,
+			7,
+			2
+		},
+		a_size = {
+			96,
+			120
+		},
+		f_quad = {
+			3,
+			3,
+			54,
+			73
+		},
+		alias = {
+			"hero_idle_0002",
+			"hero idle 3"
+		}
+	},
+	["1_start"] = {
+		a_name = "hero-1.png",
+		size = {
+			32,
+			32
+		},
+		trim = {
+			0,
+			0,
+			0,
+			0
+		},
+		a_size = {
+			96,
+			120
+		},
+		f_quad = {
+			59,
+			3,
+			32,
+			32
+		},
+		alias = {}
+	},
+	[123] = {
+		a_name = "hero-1.png",
+		size = {
+			17,
+			9
+		},
+		trim = {
+			1,
+			2,
+			0,
+			1
+		},
+		a_size = {
+			96,
+			120
+		},
+		f_quad = {
+			59,
+			37,
+			16,
+			6
+		},
+		alias = {}
+	},
+	["with space"] = {
+		a_name = "hero-1.png",
+		size = {
+			20,
+			40
+		},
+		trim = {
+			2,
+			0,
+			2,
+			1
+		},
+		a_size = {
+			96,
+			120
+		},
+		f_quad = {
+			3,
+			78,
+			16,
+			39
+		},
+		alias = {
+			"中文别名"
+		}
+	},
+	中文名 = {
+		a_name = "hero-2.png",
+		size = {
+			8,
+			8
+		},
+		trim = {
+			0,
+			0,
+			1,
+			1
+		},
+		a_size = {
+			24,
+			12
+		},
+		f_quad = {
+			3,
+			3,
+			7,
+			7
+		},
+		alias = {}
+	},
+	["say \"hi\""] = {
+		a_name = "hero-2.png",
+		size = {
+			12,
+			6
+		},
+		trim = {
+			4,
+			0,
+			0,
+			0
+		},
+		a_size = {
+			24,
+			12
+		},
+		f_quad = {
+			12,
+			3,
+			8,
+			6
+		},
+		alias = {
+			"a\\b"
+		}
+	}
+}
\ No newline at end of file
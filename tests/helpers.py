@@ -0,0 +1,98 @@
+import random
+from pathlib import Path
+import numpy as np
+from PIL import Image
+import lib.config as config
+import tools.generate_atlas as generate_atlas
+import tools.split_atlas as split_atlas
+
+
+def random_sprite(rng, max_side=60):
+    """
+    随机尺寸的精灵图片
+
+    四周留有随机宽度的透明边缘，内容为随机颜色的不透明像素并夹杂全透明像素，
+    拆分图集时按透明度粘贴，半透明像素不能原样还原
+    """
+    width, height = rng.randint(5, max_side), rng.randint(5, max_side)
+    left, top = rng.randint(0, width // 3), rng.randint(0, height // 3)
+    right, bottom = rng.randint(left + 1, width), rng.randint(top + 1, height)
+
+    pixels = np.zeros((height, width, 4), dtype=np.uint8)
+    content = np.frombuffer(
+        rng.randbytes((bottom - top) * (right - left) * 4), dtype=np.uint8
+    ).reshape(bottom - top, right - left, 4)
+    pixels[top:bottom, left:right] = content
+    pixels[top:bottom, left:right, 3] = np.where(content[..., 3] > 64, 255, 0)
+    # 内容四角不透明，裁剪后的尺寸与内容区域一致
+    pixels[
+        [top, top, bottom - 1, bottom - 1], [left, right - 1, left, right - 1], 3
+    ] = 255
+
+    return pixels
+
+
+def make_sprites(directory, count, seed=0, max_side=60):
+    """
+    在目录中生成随机精灵图片
+
+    Returns:
+        dict: 图片名 -> 像素数组
+    """
+    rng = random.Random(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    sprites = {}
+    for i in range(count):
+        name = f"{directory.name}_{i:02d}"
+        sprites[name] = random_sprite(rng, max_side)
+        Image.fromarray(sprites[name]).save(directory / f"{name}.png")
+
+    return sprites
+
+
+def generate(**overrides):
+    """
+    按setting.json的设置生成图集，输出PNG，不添加白色矩形，在当前进程中生成
+
+    Args:
+        overrides: 覆盖的生成参数，见generate_atlas.get_setting_vars
+    """
+    settings = generate_atlas.get_setting_vars(config.setting["generate_atlas"])
+    settings.update(format_var="png", add_white_var=False, max_workers_var=1)
+    settings.update(overrides)
+    return generate_atlas.generate_atlases(settings)
+
+
+def assert_same_sprite(image_file, expected):
+    """拆分出的图片与原图的透明度一致，可见像素的颜色一致"""
+    with Image.open(image_file) as img:
+        pixels = np.asarray(img.convert("RGBA"))
+
+    assert pixels.shape == expected.shape
+    assert (pixels[..., 3] == expected[..., 3]).all()
+
+    visible = expected[..., 3] > 0
+    assert (pixels[visible] == expected[visible]).all()
+
+
+def split_lua(lua_file, atlas_dir, split_path, executor=None):
+    """
+    按Lua数据拆分atlas_dir中的图集，精灵输出到split_path
+
+    Returns:
+        dict: get_lua_data()返回的图集数据
+    """
+    atlases = split_atlas.get_lua_data(lua_file.read_text(encoding="utf-8"))
+    split_path.mkdir(parents=True, exist_ok=True)
+    config.output_path = split_path
+
+    for atlas_file_name, atlas_data in atlases.items():
+        split_atlas.gen_png_from_frames(
+            Path(atlas_file_name).stem,
+            atlas_data["images_data"],
+            atlas_dir / atlas_file_name,
+            executor,
+        )
+
+    return atlases
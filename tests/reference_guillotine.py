@@ -0,0 +1,245 @@
+"""
+改用FreeRectIndex之前的Guillotine排列实现（基于空闲区域列表），作为排列结果的对照
+
+除边框改为参数传入外，与原实现保持一致
+"""
+
+from bisect import bisect_left
+from lib.classes import Rectangle
+from tools.generate_atlas import MIN_AREA, SHOR_TSIDE, MAX_AREA
+
+
+def calculate_score(rect, strategy):
+    """
+    计算矩形区域的分数，用于选择最佳放置位置
+
+    Args:
+        rect: 待评估的矩形区域
+        strategy: 评分策略，目前仅支持最小面积策略
+
+    Returns:
+        float: 分数值，分数越小表示越优先选择
+    """
+    if strategy == MIN_AREA:
+        return rect.area()  # 使用面积作为评分
+    elif strategy == SHOR_TSIDE:
+        return min(rect.w, rect.h)  # 使用短边长度作为评分
+    elif strategy == MAX_AREA:
+        return -rect.area()  # 使用面积作为评分
+
+    return 0
+
+
+def find_position(free_rectangles, rect):
+    """
+    在空闲区域中寻找最佳放置位置
+
+    Args:
+        free_rectangles: 当前空闲区域列表
+        width: 待放置矩形的宽度
+        height: 待放置矩形的高度
+
+    Returns:
+        tuple: (更新后的空闲区域列表, (最佳矩形, 所在空闲区域, 空闲区域索引)) 或 None
+    """
+    best_score = float("inf")  # 最佳分数（越小越好）
+    best_rect = in_free_rect = in_free_rect_idx = None
+
+    # 遍历所有空闲区域
+    for i, free_rect in enumerate(free_rectangles):
+        # 跳过无法容纳当前矩形的区域
+        if free_rect.w < rect.w or free_rect.h < rect.h:
+            continue
+
+        # 计算当前空闲区域的分数
+        score = calculate_score(free_rect, MIN_AREA)
+
+        # 更新最佳位置
+        if score < best_score:
+            best_score = score
+            best_rect = Rectangle(free_rect.x, free_rect.y, rect.w, rect.h)
+            in_free_rect = free_rect
+            in_free_rect_idx = i
+
+    if best_rect:
+        return best_rect, in_free_rect, in_free_rect_idx
+
+    return None
+
+
+def split_free_rectangle(free_rectangles, free_rect, used_rect, free_rect_idx):
+    """
+    将空闲区域分割为剩余空间
+
+    当在一个空闲区域中放置矩形后，将剩余空间分割为右侧和下方的两个新空闲区域
+
+    Args:
+        free_rectangles: 当前空闲区域列表
+        free_rect: 被使用的空闲区域
+        used_rect: 已放置的矩形区域
+        free_rect_idx: 被使用的空闲区域在列表中的索引
+    """
+    new_rects = []
+
+    # 检查右侧是否还有剩余空间
+    if used_rect.x + used_rect.w != free_rect.x + free_rect.w:
+        new_rects.append(
+            Rectangle(
+                used_rect.x + used_rect.w,
+                free_rect.y,
+                free_rect.x + free_rect.w - (used_rect.x + used_rect.w),
+                free_rect.h,
+            )
+        )
+
+    # 检查下方是否还有剩余空间
+    if used_rect.y + used_rect.h != free_rect.y + free_rect.h:
+        new_rects.append(
+            Rectangle(
+                used_rect.x,
+                used_rect.y + used_rect.h,
+                used_rect.w,
+                free_rect.y + free_rect.h - (used_rect.y + used_rect.h),
+            )
+        )
+
+    if not new_rects:
+        # 如果空间完全被使用，标记为空矩形
+        free_rectangles[free_rect_idx] = Rectangle(0, 0, 0, 0)
+        return
+
+    free_rectangles[free_rect_idx] = new_rects[0]
+    free_rectangles.extend(new_rects[1:])
+
+
+def try_merge_rectangles(rect1, rect2):
+    """
+    尝试合并两个相邻的矩形
+
+    支持水平合并（左右相邻）和垂直合并（上下相邻）
+
+    Args:
+        rect1: 第一个矩形
+        rect2: 第二个矩形
+
+    Returns:
+        Rectangle: 合并后的矩形，如果无法合并则返回None
+    """
+    # 水平合并：Y坐标和高度相同，且rect1右侧紧邻rect2左侧
+    if rect1.y == rect2.y and rect1.h == rect2.h:
+        if rect1.x + rect1.w == rect2.x:
+            return Rectangle(rect1.x, rect1.y, rect1.w + rect2.w, rect1.h)
+
+        if rect2.x + rect2.w == rect1.x:
+            return Rectangle(rect2.x, rect2.y, rect1.w + rect2.w, rect1.h)
+
+    # 垂直合并：X坐标和宽度相同，且rect1下方紧邻rect2上方
+    if rect1.x == rect2.x and rect1.w == rect2.w:
+        if rect1.y + rect1.h == rect2.y:
+            return Rectangle(rect1.x, rect1.y, rect1.w, rect1.h + rect2.h)
+
+        if rect2.y + rect2.h == rect1.y:
+            return Rectangle(rect2.x, rect2.y, rect1.w, rect1.h + rect2.h)
+
+    return None
+
+
+def merge_single_free_rect(merged_idx, free_rect, sorted_by_x, x_coords):
+    merged_rect = None
+
+    # 使用二分查找找到可能可以合并的矩形
+    start_idx = bisect_left(x_coords, free_rect.x - free_rect.w)  # 调整搜索范围
+
+    for i in range(start_idx, len(sorted_by_x)):
+        if i in merged_idx:
+            continue
+        other_free_rect = sorted_by_x[i]
+
+        if other_free_rect.x > free_rect.x + free_rect.w:
+            break
+
+        merged_rect = try_merge_rectangles(free_rect, other_free_rect)
+        if not merged_rect:
+            continue
+
+        merged_idx.add(i)
+
+        other_merged_rect = merge_single_free_rect(
+            merged_idx, merged_rect, sorted_by_x, x_coords
+        )
+        if other_merged_rect:
+            merged_rect = other_merged_rect
+
+        break
+
+    return merged_rect
+
+
+def merge_free_rectangles(free_rectangles):
+    """
+    合并相邻的空闲矩形
+    """
+    if not free_rectangles:
+        return []
+
+    # 使用类似R-tree的空间索引优化
+    # 按x坐标排序并建立索引
+    sorted_by_x = sorted(free_rectangles, key=lambda r: r.x)
+    x_coords = [r.x for r in sorted_by_x]
+
+    merged_idx = set()
+    merged = []
+
+    for free_rect_idx in range(len(sorted_by_x)):
+        if free_rect_idx in merged_idx:
+            continue
+
+        free_rect = sorted_by_x[free_rect_idx]
+
+        merged_rect = merge_single_free_rect(
+            merged_idx, free_rect, sorted_by_x, x_coords
+        )
+
+        if merged_rect:
+            merged_idx.add(free_rect_idx)
+            merged.append(merged_rect)
+        else:
+            merged.append(free_rect)
+
+    return merged
+
+
+def guillotine_packing(rectangles, atlas_size, border=0):
+    """
+    使用Guillotine算法在指定尺寸的画布上排列矩形
+
+    Args:
+        rectangles: 待排列的矩形列表，格式为[(id, width, height), ...]
+        atlas_size: 画布尺寸
+        border: 图集边框宽度
+
+    Returns:
+        list: 排列结果列表，格式为[(rect_id, Rectangle), ...]
+    """
+    result_rectangles = []
+    # 初始化空闲区域为整个画布（考虑边框）
+    free_rectangles = [
+        Rectangle(border, border, atlas_size.w - border, atlas_size.h - border)
+    ]
+
+    # 遍历所有矩形进行排列
+    for rect_id, rect_name, rect in rectangles:
+        # 寻找最佳放置位置
+        rect_data = find_position(free_rectangles, rect)
+
+        if not rect_data:
+            continue
+
+        used_rect, in_free_rect, free_rect_idx = rect_data
+
+        split_free_rectangle(free_rectangles, in_free_rect, used_rect, free_rect_idx)
+        free_rectangles = merge_free_rectangles(free_rectangles)
+
+        result_rectangles.append((rect_id, rect_name, used_rect))
+
+    return result_rectangles
@@ -0,0 +1,157 @@
+import struct
+import numpy as np
+import pytest
+from PIL import Image
+import lib.dds as dds
+
+# 沿RGBA空间中一条直线变化的渐变，解码结果各通道允许的最大误差
+MAX_ERROR = {"bc1": 16, "bc3": 16, "bc7": 4}
+
+# 偏移: 字段名，对应DDS_HEADER（含"DDS "标识）及DX10扩展头
+HEADER_FIELDS = {
+    4: "size",
+    8: "flags",
+    12: "height",
+    16: "width",
+    20: "pitch_or_linear_size",
+    28: "mipmap_count",
+    76: "pixel_format_size",
+    80: "pixel_format_flags",
+    108: "caps",
+    128: "dxgi_format",
+    132: "resource_dimension",
+}
+
+
+def gradient(width, height):
+    y, x = np.mgrid[0:height, 0:width]
+    t = ((x + 2 * y) / (width + 2 * height))[..., None]
+    start = np.array([200, 30, 90, 255])
+    end = np.array([20, 220, 160, 40])
+    return Image.fromarray((start + t * (end - start)).round().astype(np.uint8))
+
+
+def round_trip(img, bc, tmp_path, **kwargs):
+    """保存为DDS后用Pillow解码，返回(解码的RGBA数组, 文件内容)"""
+    output_file = tmp_path / f"{bc}.dds"
+    dds.save_dds(img, output_file, bc, **kwargs)
+
+    with Image.open(output_file) as decoded:
+        rgba = np.asarray(decoded.convert("RGBA"))
+
+    return rgba, output_file.read_bytes()
+
+
+def read_header(data):
+    return {
+        name: struct.unpack_from("<I", data, offset)[0]
+        for offset, name in HEADER_FIELDS.items()
+        if offset + 4 <= len(data)
+    }
+
+
+def level_bytes(width, height, bc):
+    return -(-width // 4) * -(-height // 4) * dds.BLOCK_BYTES[bc]
+
+
+@pytest.mark.parametrize("bc", ["bc1", "bc3", "bc7"])
+@pytest.mark.parametrize("size", [(16, 16), (13, 7), (3, 2), (1, 1), (37, 21)])
+def test_round_trip_error(tmp_path, bc, size):
+    """宽高不是4的倍数时补齐的像素被裁掉，解码结果与原图的误差有界"""
+    img = gradient(*size)
+    rgba, _ = round_trip(img, bc, tmp_path)
+
+    assert rgba.shape == (size[1], size[0], 4)
+
+    channels = 3 if bc == "bc1" else 4
+    error = np.abs(rgba.astype(int) - np.asarray(img, dtype=int))[..., :channels]
+    assert error.max() <= MAX_ERROR[bc]
+    assert error.mean() <= MAX_ERROR[bc] / 2
+
+
+@pytest.mark.parametrize("bc", ["bc3", "bc7"])
+def test_alpha_endpoints_are_exact(tmp_path, bc):
+    """完全透明和完全不透明的像素解码后透明度不变"""
+    alpha = np.array([0, 255, 64, 192] * 4, dtype=np.uint8).reshape(4, 4)
+    rgba = np.zeros((4, 4, 4), dtype=np.uint8)
+    rgba[..., :3] = (90, 160, 30)
+    rgba[..., 3] = alpha
+
+    decoded, _ = round_trip(Image.fromarray(rgba), bc, tmp_path)
+
+    for value in (0, 255):
+        assert (decoded[..., 3][alpha == value] == value).all()
+
+
+def test_bc3_alpha_block():
+    """BC3透明度块以最大、最小值为端点，端点间6个插值"""
+    alpha = np.array([[0, 255] + [36] * 7 + [219] * 7, [128] * 16], dtype=np.int32)
+    encoded = dds.encode_alpha_blocks(alpha)
+
+    assert encoded[0, :2].tolist() == [255, 0]
+    assert encoded[1, :2].tolist() == [128, 128]
+
+    indices = int.from_bytes(encoded[0, 2:].tobytes(), "little")
+    assert [(indices >> (3 * i)) & 7 for i in range(4)] == [1, 0, 7, 7]
+
+
+def test_bc7_uses_mode_6(tmp_path):
+    img = gradient(13, 7)
+    _, data = round_trip(img, "bc7", tmp_path)
+
+    blocks = np.frombuffer(data[148:], dtype=np.uint8).reshape(-1, 16)
+    assert len(blocks) == 4 * 2
+    # 模式6的块以6个0位和1个1位开头
+    assert (blocks[:, 0] & 0x7F == 0x40).all()
+
+
+@pytest.mark.parametrize("bc", ["bc1", "bc3", "bc7"])
+def test_header_fields(tmp_path, bc):
+    _, data = round_trip(gradient(13, 7), bc, tmp_path)
+    header = read_header(data)
+
+    assert data[:4] == b"DDS "
+    assert header["size"] == 124
+    assert header["pixel_format_size"] == 32
+    assert (header["width"], header["height"]) == (13, 7)
+    assert header["pitch_or_linear_size"] == level_bytes(13, 7, bc)
+    assert header["mipmap_count"] == 0
+    assert header["caps"] == dds.DDSCAPS_TEXTURE
+    assert not header["flags"] & dds.DDSD_MIPMAPCOUNT
+
+    fourcc = data[84:88]
+    if bc == "bc7":
+        assert fourcc == b"DX10"
+        assert header["dxgi_format"] == dds.DXGI_FORMAT_BC7_UNORM
+        assert header["resource_dimension"] == dds.D3D10_RESOURCE_DIMENSION_TEXTURE2D
+        header_size = 148
+    else:
+        assert fourcc == {"bc1": b"DXT1", "bc3": b"DXT5"}[bc]
+        header_size = 128
+
+    assert len(data) == header_size + level_bytes(13, 7, bc)
+
+
+@pytest.mark.parametrize("bc", ["bc1", "bc3", "bc7"])
+@pytest.mark.parametrize("mipmap_filter", list(dds.MIPMAP_FILTERS))
+def test_mipmap_chain(tmp_path, bc, mipmap_filter):
+    """mipmap逐层减半直到1x1，文件头记录层数，文件依次包含每层数据"""
+    img = gradient(37, 21)
+    rgba, data = round_trip(
+        img, bc, tmp_path, mipmaps=True, mipmap_filter=mipmap_filter
+    )
+    header = read_header(data)
+
+    sizes = [(37, 21), (18, 10), (9, 5), (4, 2), (2, 1), (1, 1)]
+    assert header["mipmap_count"] == len(sizes)
+    assert header["flags"] & dds.DDSD_MIPMAPCOUNT
+    assert header["caps"] == (
+        dds.DDSCAPS_TEXTURE | dds.DDSCAPS_COMPLEX | dds.DDSCAPS_MIPMAP
+    )
+    assert header["pitch_or_linear_size"] == level_bytes(37, 21, bc)
+
+    header_size = 148 if bc == "bc7" else 128
+    assert len(data) == header_size + sum(level_bytes(w, h, bc) for w, h in sizes)
+
+    # Pillow只解码第一层
+    assert rgba.shape == (21, 37, 4)
@@ -0,0 +1,475 @@
+import concurrent.futures, json, random
+from pathlib import Path
+import numpy as np
+import pytest
+from PIL import Image
+from lib.classes import Point, Size
+import lib.config as config
+import tools.generate_atlas as generate_atlas
+import tools.split_atlas as split_atlas
+from tests.helpers import (
+    assert_same_sprite,
+    generate,
+    make_sprites,
+    random_sprite,
+    split_lua,
+)
+
+
+def save_sprite(path, color):
+    img = Image.new("RGBA", (8, 8), (0, 0, 0, 0))
+    img.paste(color, (2, 2, 6, 6))
+    img.save(path)
+
+
+def load_directory(image_files, hash_index):
+    """按生成图集的流程探测、加载并合并目录中的图片"""
+    used_index = {}
+    probes = generate_atlas.probe_directory(image_files, hash_index, used_index)
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        loaded_files, content_futures = generate_atlas.submit_directory(
+            executor, probes
+        )
+        result = generate_atlas.process_directory(loaded_files, content_futures, 0)
+
+    return result, used_index
+
+
+def test_cached_and_uncached_duplicates(tmp_path, monkeypatch):
+    """同内容图片部分有缓存的像素哈希时，不同内容的图片不能被判定为重复"""
+    setting_var = generate_atlas.get_setting_vars(config.setting["generate_atlas"])
+    monkeypatch.setattr(
+        generate_atlas,
+        "setting_var",
+        {**setting_var, "near_dedup_var": False, "trim_alpha_var": 0},
+        raising=False,
+    )
+
+    save_sprite(tmp_path / "a.png", (255, 0, 0, 255))
+    save_sprite(tmp_path / "c.png", (0, 0, 255, 255))
+    _, hash_index = load_directory([tmp_path / "a.png", tmp_path / "c.png"], {})
+
+    # 复制出的文件没有缓存的像素哈希，并排在有缓存的文件之后
+    (tmp_path / "b_copy_of_a.png").write_bytes((tmp_path / "a.png").read_bytes())
+    (tmp_path / "e_copy_of_c.png").write_bytes((tmp_path / "c.png").read_bytes())
+    image_files = generate_atlas.get_image_files(tmp_path)
+    result, used_index = load_directory(image_files, hash_index)
+
+    images = {img["name"]: img["samed_img"] for img in result["images"]}
+    assert images == {"a": ["b_copy_of_a"], "c": ["e_copy_of_c"]}
+    assert all(entry["pixel_hash"] for entry in used_index.values())
+
+
+def test_common_atlas(io_paths, tmp_path):
+    """多个目录中内容相同的图片移入公共图集，各目录的Lua数据引用其中的位置"""
+    input_path, output_path = io_paths
+    sprites = {
+        dir_name: make_sprites(input_path / dir_name, 5, seed=seed)
+        for seed, dir_name in enumerate(["a", "b", "c"])
+    }
+
+    # a、b目录中同名不同内容的图片分别与c目录中的图片重复，公共图集中需要改名
+    rng = random.Random(10)
+    for dir_name, name in [("a", "x"), ("b", "x")]:
+        pixels = random_sprite(rng)
+        Image.fromarray(pixels).save(input_path / dir_name / f"{name}.png")
+        Image.fromarray(pixels).save(input_path / "c" / f"{dir_name}_{name}.png")
+        sprites[dir_name][name] = sprites["c"][f"{dir_name}_{name}"] = pixels
+
+    result = generate(global_dedup_var=True, common_atlas_var="common")
+
+    assert not result["failed"]
+    assert [atlas["name"] for atlas in result["atlases"]] == ["common", "a", "b", "c"]
+    common_pages = result["atlases"][0]["pages"]
+    assert sum(page["sprites"] for page in common_pages) == 2
+
+    common_names = split_lua(
+        output_path / "common.lua", output_path, tmp_path / "common"
+    )["common-1.png"]["images_data"]
+    assert sorted(common_names) == ["x", "x_1"]
+
+    # 引用公共图集的图片保留各目录中的名称
+    references = {"a": ["x"], "b": ["x"], "c": ["a_x", "b_x"]}
+    for dir_name, dir_sprites in sprites.items():
+        split_path = tmp_path / "split" / dir_name
+        atlases = split_lua(output_path / f"{dir_name}.lua", output_path, split_path)
+        assert sorted(atlases["common-1.png"]["images_data"]) == references[dir_name]
+
+        split_files = {path.stem: path for path in split_path.rglob("*.png")}
+        assert sorted(split_files) == sorted(dir_sprites)
+        for name, pixels in dir_sprites.items():
+            assert_same_sprite(split_files[name], pixels)
+
+
+def test_near_duplicates_with_different_trim_boxes(io_paths):
+    """抗锯齿边缘使裁剪范围不同的近似图片合并为别名，位置或颜色不同的图片保留"""
+    input_path, output_path = io_paths
+    frame = np.zeros((48, 40, 4), dtype=np.uint8)
+    frame[10:30, 8:24] = (200, 60, 30, 255)
+    frame[14:20, 12:16] = (20, 20, 220, 255)
+
+    edge = frame.copy()
+    edge[10:30, 24] = (200, 60, 30, 8)
+    noise = frame.copy()
+    noise[12, 10] = (210, 66, 30, 255)
+    recolored = frame.copy()
+    recolored[10:30, 8:24, :3] = (60, 200, 30)
+
+    frames = {
+        "anim_01": frame,
+        "anim_02": edge,
+        "anim_03": noise,
+        "anim_04": np.roll(frame, 5, axis=1),
+        "anim_05": recolored,
+    }
+    (input_path / "anim").mkdir()
+    for name, pixels in frames.items():
+        Image.fromarray(pixels).save(input_path / "anim" / f"{name}.png")
+
+    result = generate(near_dedup_var=True, trim_alpha_var=0)
+
+    assert result["atlases"][0]["pages"][0]["sprites"] == 3
+    lua_data = split_atlas.get_lua_data(
+        (output_path / "anim.lua").read_text(encoding="utf-8")
+    )
+    images_data = lua_data["anim-1.png"]["images_data"]
+    assert images_data["anim_02"] is images_data["anim_01"]
+    assert images_data["anim_03"] is images_data["anim_01"]
+    assert images_data["anim_04"] is not images_data["anim_01"]
+    assert images_data["anim_05"] is not images_data["anim_01"]
+
+
+def paste_atlas(images, result, border):
+    """按原来的方式合成图集：逐张粘贴到整页画布，再按像素范围裁剪"""
+    atlas = Image.new("RGBA", tuple(result["atlas_size"]), (0, 0, 0, 0))
+    for rect_id, _, _ in result["rectangles"]:
+        img_info = images[rect_id]
+        image = img_info["image"]
+        if img_info["rotated"]:
+            image = image.transpose(Image.Transpose.ROTATE_270)
+        atlas.paste(image, tuple(img_info["pos"]))
+    atlas.paste((255, 255, 255, 255), (0, 0, 4, 4))
+
+    left, top, right, bottom = atlas.getbbox()
+    right_alignment = 4 - (right % 4)
+    bottom_alignment = 4 - (bottom % 4)
+    right_border = max(0, border - right_alignment)
+    bottom_border = max(0, border - bottom_alignment)
+    right_border += 4 - (right_border % 4)
+    bottom_border += 4 - (bottom_border % 4)
+
+    return atlas.crop(
+        (
+            left,
+            top,
+            right + right_alignment + right_border,
+            bottom + bottom_alignment + bottom_border,
+        )
+    )
+
+
+def test_compose_atlas_matches_paste(monkeypatch):
+    """数组切片合成的图集与逐张粘贴、裁剪的结果一致，包括旋转的图片"""
+    border = 3
+    monkeypatch.setattr(
+        generate_atlas,
+        "setting_var",
+        {"border_var": border, "allow_rotation_var": True, "add_white_var": True},
+        raising=False,
+    )
+
+    rng = random.Random(5)
+    images = {}
+    rectangles = []
+    for rect_id in range(60):
+        img = Image.fromarray(random_sprite(rng))
+        img = img.crop(img.getbbox())
+        images[rect_id] = {"image": img}
+        rectangles.append((rect_id, f"img_{rect_id}", Size(*img.size)))
+    rectangles.sort(key=lambda rect: rect[2].area(), reverse=True)
+
+    atlas_size = Size(256, 256)
+    placed = generate_atlas.pack_rectangles(
+        rectangles, atlas_size, generate_atlas.MAXRECTS, generate_atlas.BEST_AREA
+    )
+    assert len(placed) == len(rectangles)
+    for rect_id, _, rect in placed:
+        images[rect_id]["pos"] = Point(rect.x, rect.y)
+        images[rect_id]["rotated"] = rect.w != images[rect_id]["image"].width
+    assert any(img_info["rotated"] for img_info in images.values())
+
+    result = {"rectangles": placed, "atlas_size": atlas_size}
+    composed = generate_atlas.compose_atlas(images, result)
+    expected = paste_atlas(images, result, border)
+
+    assert composed.size == expected.size
+    assert composed.tobytes() == expected.tobytes()
+
+
+def get_frame_boxes(images_data):
+    """帧在图集中占用的范围，旋转的帧宽高互换"""
+    boxes = {}
+    for data in images_data.values():
+        rect = data["textureRect"]
+        width, height = (rect.h, rect.w) if data["textureRotated"] else (rect.w, rect.h)
+        boxes[(rect.x, rect.y)] = (rect.x, rect.y, rect.x + width, rect.y + height)
+
+    return list(boxes.values())
+
+
+def test_variant_scales(io_paths):
+    """各比例的图集变体沿用全分辨率的排列，帧互不重叠、不超出图集，尺寸按比例缩放"""
+    input_path, output_path = io_paths
+    sprites = make_sprites(input_path / "hero", 30, seed=7)
+
+    result = generate(
+        variant_scales_var=[1.0, 0.5, 0.25], allow_rotation_var=True, padding_var=2
+    )
+    assert not result["failed"]
+
+    full = split_atlas.get_lua_data(
+        (output_path / "hero.lua").read_text(encoding="utf-8")
+    )["hero-1.png"]["images_data"]
+
+    for scale in ("0.5", "0.25"):
+        lua_data = split_atlas.get_lua_data(
+            (output_path / f"hero@{scale}x.lua").read_text(encoding="utf-8")
+        )
+        assert list(lua_data) == [f"hero-1@{scale}x.png"]
+        images_data = lua_data[f"hero-1@{scale}x.png"]["images_data"]
+        assert sorted(images_data) == sorted(sprites)
+
+        with Image.open(output_path / f"hero-1@{scale}x.png") as atlas:
+            atlas_width, atlas_height = atlas.size
+
+        boxes = get_frame_boxes(images_data)
+        for i, (x1, y1, x2, y2) in enumerate(boxes):
+            assert 0 <= x1 and 0 <= y1 and x2 <= atlas_width and y2 <= atlas_height
+            for ox1, oy1, ox2, oy2 in boxes[i + 1 :]:
+                assert x2 <= ox1 or ox2 <= x1 or y2 <= oy1 or oy2 <= y1
+
+        for name, data in images_data.items():
+            origin = full[name]["spriteSourceSize"]
+            size = data["spriteSourceSize"]
+            assert data["textureRotated"] == full[name]["textureRotated"]
+            assert abs(size.w - origin.w * float(scale)) <= 1
+            assert abs(size.h - origin.h * float(scale)) <= 1
+            assert data["spriteSize"].w <= size.w and data["spriteSize"].h <= size.h
+
+
+def test_parse_args():
+    """未指定的参数为None，使用setting.json中的设置"""
+    args = generate_atlas.parse_args(["--headless"])
+    assert all(getattr(args, option) is None for option in generate_atlas.CLI_OPTIONS)
+    assert args.headless and not args.json
+
+    args = generate_atlas.parse_args(
+        ["--format", "bc7", "--jobs", "2", "--no-rotate", "--mipmaps"]
+        + ["--mipmap-filter", "lanczos", "--max-size", "1024", "--alpha-threshold", "8"]
+    )
+    assert args.format == "bc7" and args.jobs == 2 and args.max_size == 1024
+    assert args.rotate is False and args.mipmaps is True
+    assert args.mipmap_filter == "lanczos" and args.alpha_threshold == 8
+
+    for argv in (["--format", "dxt1"], ["--input", "does/not/exist"]):
+        with pytest.raises(SystemExit):
+            generate_atlas.parse_args(argv)
+
+
+def test_cli_json(io_paths, tmp_path, capsys):
+    """命令行生成的结果以JSON输出，无法排列的目录记录为失败并跳过，退出码为1"""
+    input_path, _ = io_paths
+    make_sprites(input_path / "hero", 6, seed=1, max_side=30)
+    make_sprites(input_path / "items", 4, seed=2, max_side=30)
+    # 超过最大尺寸的图片无法放入任何图集
+    (input_path / "big").mkdir()
+    Image.new("RGBA", (80, 80), (255, 0, 0, 255)).save(input_path / "big" / "big.png")
+
+    output_path = tmp_path / "cli_output"
+    argv = ["--headless", "--input", str(input_path), "--output", str(output_path)]
+    argv += ["--format", "png", "--jobs", "1", "--max-size", "64", "--json"]
+    assert generate_atlas.cli(argv) == 1
+
+    result = json.loads(capsys.readouterr().out)
+    assert set(result) == {"atlases", "skipped", "failed", "dds_failures", "seconds"}
+    assert list(result["failed"]) == ["big"]
+    assert [atlas["name"] for atlas in result["atlases"]] == ["hero", "items"]
+
+    for atlas in result["atlases"]:
+        assert set(atlas) == {"name", "pages", "occupancy", "seconds"}
+        for page in atlas["pages"]:
+            assert set(page) == {"name", "width", "height", "sprites", "occupancy"}
+            assert (output_path / f"{page['name']}.png").is_file()
+        assert (output_path / f"{atlas['name']}.lua").is_file()
+
+    assert sum(page["sprites"] for page in result["atlases"][1]["pages"]) == 4
+
+    # 去掉无法排列的目录后全部成功
+    (input_path / "big" / "big.png").unlink()
+    assert generate_atlas.cli(argv) == 0
+    assert json.loads(capsys.readouterr().out)["failed"] == {}
+
+
+def test_cli_without_images(io_paths, tmp_path):
+    input_path, _ = io_paths
+    argv = ["--headless", "--input", str(input_path), "--output", str(tmp_path)]
+    assert generate_atlas.cli(argv + ["--format", "png"]) == 1
+
+
+# 原来的gen_lua_content由make_lua_frames()的数据生成的Lua文件
+LUA_GOLDEN_FILE = Path(__file__).parent / "data" / "atlas_frames.lua"
+
+
+def make_lua_frames():
+    """
+    两页图集的Lua测试数据
+
+    包括需要转义或加括号的名称、多个别名和没有别名的图片
+    """
+    frames = [
+        # (名称, 原始尺寸, 裁剪, 位置, 图片尺寸, 别名, 页)
+        (
+            "hero_idle_0001",
+            (64, 80),
+            (3, 5, 7, 2),
+            (3, 3),
+            (54, 73),
+            ["hero_idle_0002", "hero idle 3"],
+            0,
+        ),
+        ("1_start", (32, 32), (0, 0, 0, 0), (59, 3), (32, 32), [], 0),
+        ("123", (17, 9), (1, 2, 0, 1), (59, 37), (16, 6), [], 0),
+        ("with space", (20, 40), (2, 0, 2, 1), (3, 78), (16, 39), ["中文别名"], 0),
+        ("中文名", (8, 8), (0, 0, 1, 1), (3, 3), (7, 7), [], 1),
+        ('say "hi"', (12, 6), (4, 0, 0, 0), (12, 3), (8, 6), ["a\\b"], 1),
+    ]
+
+    images = {}
+    results = [
+        {"name": "hero-1", "rectangles": [], "atlas_size": Size(96, 120)},
+        {"name": "hero-2", "rectangles": [], "atlas_size": Size(24, 12)},
+    ]
+    for rect_id, (name, origin, trim, pos, size, alias, page) in enumerate(frames):
+        images[rect_id] = {
+            "name": name,
+            "origin_size": Size(*origin),
+            "trim": trim,
+            "pos": Point(*pos),
+            "image": Image.new("RGBA", size),
+            "samed_img": alias,
+        }
+        results[page]["rectangles"].append((rect_id, name, None))
+
+    return images, results
+
+
+def test_lua_output_matches_golden(io_paths, monkeypatch):
+    """流式写入的Lua数据与原来的gen_lua_content逐字节一致"""
+    _, output_path = io_paths
+    monkeypatch.setattr(generate_atlas, "setting_var", {"format_var": "png"})
+    golden = LUA_GOLDEN_FILE.read_bytes()
+
+    images, results = make_lua_frames()
+    generate_atlas.write_lua_data(images, results, "hero")
+    assert (output_path / "hero.lua").read_bytes() == golden
+
+    # 旋转的图片只多出一行texture_rotated
+    images[3]["rotated"] = True
+    generate_atlas.write_lua_data(images, results, "hero")
+    content = (output_path / "hero.lua").read_text(encoding="utf-8")
+    assert content.count(generate_atlas.LUA_ROTATED_LINE) == 1
+    assert content.replace(generate_atlas.LUA_ROTATED_LINE, "").encode() == golden
+
+    frames = split_atlas.get_lua_data(content)["hero-1.png"]["images_data"]
+    assert [name for name, data in frames.items() if data["textureRotated"]] == [
+        "with space",
+        "中文别名",
+    ]
+
+
+def test_performance_report(io_paths):
+    """开启性能统计时记录各阶段耗时和热点函数调用，保存报告后移除装饰器"""
+    input_path, output_path = io_paths
+    sprite_counts = {"hero": 12, "items": 5}
+    for seed, (dir_name, count) in enumerate(sprite_counts.items()):
+        make_sprites(input_path / dir_name, count, seed=seed)
+
+    result = generate(
+        performance_monitor_var=True, packing_algorithm_var=generate_atlas.GUILLOTINE
+    )
+
+    for atlas in result["atlases"]:
+        assert set(atlas["stages"]) == set(generate_atlas.PROFILE_STAGES)
+        assert all(seconds >= 0 for seconds in atlas["stages"].values())
+        assert atlas["stages"]["pack"] > 0
+
+        calls = atlas["calls"]
+        assert calls["find_position"]["count"] >= sprite_counts[atlas["name"]]
+        assert calls["maxrects_find_position"]["count"] == 0
+
+    report = json.loads(
+        (output_path / generate_atlas.PERFORMANCE_REPORT_FILE).read_text(
+            encoding="utf-8"
+        )
+    )
+    assert set(report) == {"time", "seconds", "skipped", "atlases"}
+    assert [atlas["name"] for atlas in report["atlases"]] == ["hero", "items"]
+
+    assert not hasattr(generate_atlas.find_position, "__wrapped__")
+    assert not hasattr(generate_atlas.merge_free_rectangles, "__wrapped__")
+
+    # 关闭时不统计
+    result = generate(performance_monitor_var=False)
+    assert all("stages" not in atlas for atlas in result["atlases"])
+
+
+def test_trim_matches_getbbox():
+    """阈值为0时与原来按getbbox裁剪的结果一致"""
+    rng = random.Random(11)
+    for _ in range(50):
+        pixels = random_sprite(rng)
+        # 加入淡边
+        pixels[rng.randrange(pixels.shape[0]), rng.randrange(pixels.shape[1]), 3] = 1
+        img = Image.fromarray(pixels)
+
+        trimmed, trim = generate_atlas.process_img(img)
+        bbox = img.getbbox()
+        assert tuple(trim) == (
+            bbox[0],
+            bbox[1],
+            img.width - bbox[2],
+            img.height - bbox[3],
+        )
+        assert trimmed.tobytes() == img.crop(bbox).tobytes()
+
+
+def test_trim_alpha_threshold():
+    pixels = np.zeros((20, 30, 4), dtype=np.uint8)
+    pixels[5:15, 10:20] = (255, 0, 0, 255)
+    pixels[2, 3] = (255, 0, 0, 8)
+    pixels[18, 27] = (255, 0, 0, 9)
+    img = Image.fromarray(pixels)
+
+    _, trim = generate_atlas.process_img(img, 0)
+    assert tuple(trim) == (3, 2, 2, 1)
+
+    # 透明度不超过阈值的像素视为透明
+    trimmed, trim = generate_atlas.process_img(img, 8)
+    assert tuple(trim) == (10, 5, 2, 1)
+    assert trimmed.size == (18, 14)
+
+    trimmed, trim = generate_atlas.process_img(img, 9)
+    assert tuple(trim) == (10, 5, 10, 5)
+    assert trimmed.tobytes() == img.crop((10, 5, 20, 15)).tobytes()
+
+    # 全部透明时裁剪为空图片
+    trimmed, trim = generate_atlas.process_img(img, 255)
+    assert tuple(trim) == (0, 0, 30, 20)
+    assert trimmed.size == (0, 0)
+
+    # 没有透明通道的图片按像素值裁剪
+    rgb = Image.fromarray(pixels[..., :3])
+    _, trim = generate_atlas.process_img(rgb, 8)
+    assert tuple(trim) == tuple(generate_atlas.process_img(rgb, 0)[1])
+    bbox = rgb.getbbox()
+    assert tuple(trim) == (bbox[0], bbox[1], 30 - bbox[2], 20 - bbox[3])
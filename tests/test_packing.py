@@ -0,0 +1,211 @@
+import random
+import numpy as np
+import pytest
+from lib.classes import Size
+from tests import reference_guillotine
+import tools.generate_atlas as generate_atlas
+
+# 随机矩形的边长范围
+RECT_SIDE_RANGE = (4, 48)
+
+
+def use_settings(monkeypatch, border=0, allow_rotation=False, **settings):
+    monkeypatch.setattr(
+        generate_atlas,
+        "setting_var",
+        {"border_var": border, "allow_rotation_var": allow_rotation, **settings},
+        raising=False,
+    )
+
+
+def make_rectangles(seed, count):
+    """生成随机矩形，按面积降序排列，画布面积为矩形总面积的1~3倍，部分矩形可能放不下"""
+    rng = random.Random(seed)
+    rectangles = [
+        (
+            i,
+            f"rect_{i}",
+            Size(rng.randint(*RECT_SIDE_RANGE), rng.randint(*RECT_SIDE_RANGE)),
+        )
+        for i in range(count)
+    ]
+    rectangles.sort(key=lambda r: r[2].area(), reverse=True)
+
+    total_area = sum(rect.area() for _, _, rect in rectangles)
+    side = int((total_area * rng.uniform(1.0, 3.0)) ** 0.5)
+    return rectangles, Size(side, side)
+
+
+def assert_valid_layout(rectangles, result, atlas_size, border, allow_rotation):
+    """排列结果中的矩形互不重叠、不超出画布，且宽高与输入一致（允许旋转时可以交换）"""
+    sizes = {rect_id: rect for rect_id, _, rect in rectangles}
+    ids = [rect_id for rect_id, _, _ in result]
+    assert len(ids) == len(set(ids))
+
+    for rect_id, _, rect in result:
+        size = sizes[rect_id]
+        assert (rect.w, rect.h) == (size.w, size.h) or (
+            allow_rotation and (rect.w, rect.h) == (size.h, size.w)
+        )
+
+    if not result:
+        return
+
+    boxes = np.array([(r.x, r.y, r.x + r.w, r.y + r.h) for _, _, r in result])
+    x1, y1, x2, y2 = boxes.T
+    assert x1.min() >= border and y1.min() >= border
+    assert x2.max() <= atlas_size.w and y2.max() <= atlas_size.h
+
+    overlap = (
+        (x1[:, None] < x2[None, :])
+        & (x1[None, :] < x2[:, None])
+        & (y1[:, None] < y2[None, :])
+        & (y1[None, :] < y2[:, None])
+    )
+    np.fill_diagonal(overlap, False)
+    assert not overlap.any()
+
+
+@pytest.mark.parametrize("border", [0, 2])
+def test_guillotine_matches_reference(monkeypatch, border):
+    """FreeRectIndex版本与原空闲区域列表版本的排列结果完全一致"""
+    use_settings(monkeypatch, border)
+
+    for seed in range(200):
+        rectangles, atlas_size = make_rectangles(seed, 10 + seed % 90)
+        result = generate_atlas.guillotine_packing(rectangles, atlas_size)
+        expected = reference_guillotine.guillotine_packing(
+            rectangles, atlas_size, border
+        )
+        assert result == expected, f"seed={seed}"
+
+
+@pytest.mark.parametrize("allow_rotation", [False, True])
+@pytest.mark.parametrize(
+    "algorithm, rule",
+    [
+        (generate_atlas.GUILLOTINE, generate_atlas.MIN_AREA),
+        (generate_atlas.GUILLOTINE, generate_atlas.SHOR_TSIDE),
+        (generate_atlas.GUILLOTINE, generate_atlas.MAX_AREA),
+        (generate_atlas.MAXRECTS, generate_atlas.BEST_SHORT_SIDE),
+        (generate_atlas.MAXRECTS, generate_atlas.BEST_AREA),
+        (generate_atlas.MAXRECTS, generate_atlas.BOTTOM_LEFT),
+    ],
+)
+def test_packing_layout_is_valid(monkeypatch, algorithm, rule, allow_rotation):
+    border = 1
+    use_settings(monkeypatch, border, allow_rotation)
+
+    for seed in range(40):
+        rectangles, atlas_size = make_rectangles(seed, 20 + seed * 3)
+        result = generate_atlas.pack_rectangles(rectangles, atlas_size, algorithm, rule)
+        assert result
+        assert_valid_layout(rectangles, result, atlas_size, border, allow_rotation)
+
+
+def make_groups(areas):
+    return [(area, [(i, f"rect_{i}", Size(area, 1))]) for i, area in enumerate(areas)]
+
+
+def get_bin_areas(bins):
+    return [[sum(rect[2].area() for rect in group) for group in page] for page in bins]
+
+
+def test_first_fit_decreasing():
+    groups = make_groups([3, 7, 1, 5, 4, 12])
+    bins = generate_atlas.first_fit_decreasing(groups, 10)
+
+    # 超过容量的矩形组单独一页
+    assert get_bin_areas(bins) == [[12], [7, 3], [5, 4, 1]]
+
+
+def test_balance_bins():
+    groups = make_groups([2, 8, 3, 5, 2, 4])
+    bins = generate_atlas.balance_bins(groups, 3)
+    assert get_bin_areas(bins) == [[8], [5, 2, 2], [4, 3]]
+
+    # 页数多于矩形组时不输出空页
+    assert get_bin_areas(generate_atlas.balance_bins(groups[:2], 4)) == [[8], [2]]
+
+
+def test_bins_keep_every_group_once():
+    rng = random.Random(2)
+    for _ in range(50):
+        areas = [rng.randint(1, 100) for _ in range(rng.randint(1, 40))]
+        groups = make_groups(areas)
+        capacity = rng.randint(100, 400)
+
+        first_fit = generate_atlas.first_fit_decreasing(groups, capacity)
+        balanced = generate_atlas.balance_bins(groups, len(first_fit))
+
+        for bins in (first_fit, balanced):
+            assert sorted(sum(get_bin_areas(bins), [])) == sorted(areas)
+        assert all(sum(page) <= capacity for page in get_bin_areas(first_fit))
+
+        # 从大到小放入面积最小的页，各页面积之差不超过最大的矩形组
+        totals = [sum(page) for page in get_bin_areas(balanced)]
+        if len(totals) == len(first_fit):
+            assert max(totals) - min(totals) <= max(areas)
+
+
+def test_group_rectangles(monkeypatch):
+    names = ["walk_0001", "walk_0002", "walk-3", "idle01", "idle02", "icon"]
+    rectangles = [(i, name, Size(2, i + 1)) for i, name in enumerate(names)]
+
+    use_settings(monkeypatch, keep_animations_var=True)
+    groups = generate_atlas.group_rectangles(rectangles)
+    assert [[rect[1] for rect in group] for _, group in groups] == [
+        ["walk_0001", "walk_0002", "walk-3"],
+        ["idle01", "idle02"],
+        ["icon"],
+    ]
+    assert [area for area, _ in groups] == [12, 18, 12]
+
+    use_settings(monkeypatch, keep_animations_var=False)
+    assert len(generate_atlas.group_rectangles(rectangles)) == len(names)
+
+
+@pytest.mark.parametrize("keep_animations", [True, False])
+def test_multi_bin_pages(monkeypatch, keep_animations):
+    """多页统一分配的每页排列有效，所有矩形恰好放入一次，不比贪心排列差"""
+    border = 2
+    use_settings(
+        monkeypatch,
+        border,
+        max_size_var=128,
+        packing_algorithm_var=generate_atlas.GUILLOTINE,
+        trigger_several_efficiency_var=0.35,
+        keep_animations_var=keep_animations,
+    )
+
+    for seed in range(10):
+        rng = random.Random(seed)
+        rectangles = [
+            (
+                i,
+                f"anim{i // 6}_{i % 6:02d}",
+                Size(rng.randint(*RECT_SIDE_RANGE), rng.randint(*RECT_SIDE_RANGE)),
+            )
+            for i in range(rng.randint(20, 60))
+        ]
+        rectangles.sort(key=lambda r: r[2].area(), reverse=True)
+
+        pages = generate_atlas.pack_pages_multi_bin(rectangles)
+        greedy = generate_atlas.pack_pages(rectangles)
+
+        placed = [rect_id for _, result in pages for rect_id, _, _ in result]
+        assert sorted(placed) == list(range(len(rectangles)))
+        for atlas_size, result in pages:
+            assert atlas_size.w <= 128 and atlas_size.h <= 128
+            assert_valid_layout(rectangles, result, atlas_size, border, False)
+
+        groups = generate_atlas.group_rectangles(rectangles)
+
+        def page_key(candidate):
+            return (
+                generate_atlas.count_split_groups(candidate, groups),
+                sum(atlas_size.area() for atlas_size, _ in candidate),
+                len(candidate),
+            )
+
+        assert page_key(pages) <= page_key(greedy)
@@ -0,0 +1,110 @@
+import concurrent.futures
+import pytest
+import lib.config as config
+import tools.split_atlas as split_atlas
+from tests.helpers import assert_same_sprite, generate, make_sprites, split_lua
+
+
+@pytest.fixture
+def split_setting(monkeypatch):
+    setting = {"delete_temporary_plist": True, "max_workers": 1}
+    monkeypatch.setattr(split_atlas, "setting", setting, raising=False)
+    return setting
+
+
+@pytest.mark.parametrize("max_size", [4096, 96])
+def test_rotated_atlas_round_trip(io_paths, tmp_path, split_setting, max_size):
+    """允许旋转时生成的图集按Lua数据拆分后与原图一致，包括重复图片和多页图集"""
+    input_path, output_path = io_paths
+    sprites = make_sprites(input_path / "hero", 40, seed=3)
+
+    # 重复的图片只存放一次，在Lua中作为别名
+    (input_path / "hero" / "hero_copy.png").write_bytes(
+        (input_path / "hero" / "hero_00.png").read_bytes()
+    )
+    sprites["hero_copy"] = sprites["hero_00"]
+
+    result = generate(allow_rotation_var=True, max_size_var=max_size)
+    assert not result["failed"]
+    if max_size == 96:
+        assert len(result["atlases"][0]["pages"]) > 1
+
+    split_path = tmp_path / "split"
+    atlases = split_lua(output_path / "hero.lua", output_path, split_path)
+
+    frames = [
+        frame for atlas in atlases.values() for frame in atlas["images_data"].values()
+    ]
+    assert any(frame["textureRotated"] for frame in frames)
+
+    assert sorted(path.stem for path in (split_path / "hero").iterdir()) == sorted(
+        sprites
+    )
+    for name, pixels in sprites.items():
+        assert_same_sprite(split_path / "hero" / f"{name}.png", pixels)
+
+
+def read_split_files(split_path):
+    return {
+        path.relative_to(split_path): path.read_bytes()
+        for path in split_path.rglob("*.png")
+    }
+
+
+def test_parallel_split_matches_serial(io_paths, tmp_path, split_setting):
+    """子进程从共享内存中的图集提取的精灵与在主进程中提取的逐字节一致"""
+    input_path, output_path = io_paths
+    make_sprites(input_path / "hero", 40, seed=4)
+    generate(allow_rotation_var=True, max_size_var=128)
+    lua_file = output_path / "hero.lua"
+
+    split_lua(lua_file, output_path, tmp_path / "serial")
+
+    split_setting["max_workers"] = 2
+    with concurrent.futures.ProcessPoolExecutor(max_workers=2) as executor:
+        split_lua(lua_file, output_path, tmp_path / "parallel", executor)
+
+    serial = read_split_files(tmp_path / "serial")
+    assert len(serial) == 40
+    assert read_split_files(tmp_path / "parallel") == serial
+
+
+def split_item_atlases(item_atlases, atlas_dir, split_path):
+    """拆分get_item_atlases()返回的图集，精灵输出到split_path"""
+    split_path.mkdir()
+    config.output_path = split_path
+    for atlas_name, atlas_file_name, frames in item_atlases:
+        split_atlas.gen_png_from_frames(atlas_name, frames, atlas_dir / atlas_file_name)
+
+    return read_split_files(split_path)
+
+
+def test_lua_frames_match_plist(io_paths, tmp_path, split_setting, monkeypatch):
+    """直接使用Lua解析出的帧数据与经过导出的Plist拆分出相同的精灵"""
+    input_path, output_path = io_paths
+    make_sprites(input_path / "hero", 40, seed=3)
+    generate(allow_rotation_var=True, max_size_var=96)
+
+    # 生成的Lua是明文，不需要反编译
+    monkeypatch.setattr(split_atlas, "run_decompiler", lambda *args: None)
+    split_setting["delete_temporary_plist"] = False
+    plist_path = tmp_path / "plist"
+    plist_path.mkdir()
+    config.output_path = plist_path
+
+    lua_atlases = split_atlas.get_item_atlases(output_path / "hero.lua")
+    assert len(lua_atlases) > 1
+
+    plist_files = sorted(plist_path.glob("*.plist"))
+    assert [path.stem for path in plist_files] == sorted(
+        atlas_name for atlas_name, _, _ in lua_atlases
+    )
+    plist_atlases = [
+        atlas for path in plist_files for atlas in split_atlas.get_item_atlases(path)
+    ]
+
+    from_lua = split_item_atlases(lua_atlases, output_path, tmp_path / "lua")
+    assert len(from_lua) == 40
+    assert split_item_atlases(plist_atlases, output_path, tmp_path / "plist_split") == (
+        from_lua
+    )
@@ -1,12 +1,20 @@
-import traceback, hashlib, time, concurrent.futures, os
-from PIL import Image, ImageDraw
+import traceback, hashlib, time, concurrent.futures, os, io, json, zlib, math, sys, re
+import argparse
+import logging
+import numpy as np
+from PIL import Image
 from functools import wraps
-from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from fractions import Fraction
+from pathlib import Path
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict, deque
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, filedialog
 import lib.config as config
-from lib.utils import run_app, save_to_dds
-from lib.classes import WriteLua, Point, Size, Rectangle, Bounds
+from lib.utils import run_app, DDSConverter, key_to_lua, value_to_lua
+from lib.dds import MIPMAP_FILTERS
+from lib.classes import StreamWriteLua, Point, Size, Rectangle, Bounds
 import lib.log as log
 
 log = log.setup_logging()
@@ -19,12 +27,132 @@ SHOR_TSIDE = "short_side"
 TYPE_RECT = "rect"
 TYPE_FREE_RECT = "free_rect"
 
+# 图片哈希索引文件名（位于输出目录）
+HASH_INDEX_FILE = "image_hash_index.json"
+
+# 图集构建清单文件名（位于输出目录）
+BUILD_MANIFEST_FILE = "atlas_build_manifest.json"
+
+# Lua中单张图片的数据：原始尺寸、裁剪信息、所在图集及其尺寸、在图集中的位置和尺寸、别名
+LUA_FRAME_FORMAT = (
+    "\t{name} = {{\n"
+    "\t\ta_name = {a_name},\n"
+    "\t\tsize = {{\n"
+    "\t\t\t{origin_size.w},\n"
+    "\t\t\t{origin_size.h}\n"
+    "\t\t}},\n"
+    "\t\ttrim = {{\n"
+    "\t\t\t{tleft},\n"
+    "\t\t\t{ttop},\n"
+    "\t\t\t{tright},\n"
+    "\t\t\t{tbottom}\n"
+    "\t\t}},\n"
+    "\t\ta_size = {{\n"
+    "\t\t\t{atlas_size.w},\n"
+    "\t\t\t{atlas_size.h}\n"
+    "\t\t}},\n"
+    "\t\tf_quad = {{\n"
+    "\t\t\t{pos.x},\n"
+    "\t\t\t{pos.y},\n"
+    "\t\t\t{width},\n"
+    "\t\t\t{height}\n"
+    "\t\t}},\n"
+    "{rotated}"
+    "\t\talias = {alias}\n"
+    "\t}}"
+).format
+
+# 旋转图片额外写入的一行
+LUA_ROTATED_LINE = "\t\ttexture_rotated = true,\n"
+
+# 近似图片合并报告文件名（位于输出目录）
+NEAR_DEDUP_REPORT_FILE = "near_duplicate_report.json"
+
+# 近似图片粗略签名的缩略尺寸
+SIGNATURE_SIZE = 8
+
+# 近似图片初筛使用的粗签名边长，SIGNATURE_SIZE需为其整数倍
+COARSE_SIGNATURE_SIZE = 2
+
+# 性能统计报告文件名（位于输出目录）
+PERFORMANCE_REPORT_FILE = "atlas_performance.json"
+
+# 性能统计的阶段及其显示名称
+PROFILE_STAGES = {
+    "decode": "解码",
+    "hash": "哈希",
+    "trim": "裁剪",
+    "pack": "排列",
+    "compose": "合成",
+    "encode": "编码",
+    "lua": "Lua",
+}
+
+# 不影响输出结果、不计入构建指纹的参数
+NON_BUILD_SETTINGS = (
+    "max_workers_var",
+    "portfolio_time_budget_var",
+    "incremental_var",
+    "prefetch_var",
+    "performance_monitor_var",
+    "parallel_atlases_var",
+    "parallel_memory_var",
+)
+
+# 生成图集时每个像素的预估内存：主进程和子进程中的图片、传输数据及图集缓冲区
+BUILD_BYTES_PER_PIXEL = 16
+
+# 当前图集各阶段的耗时，未开启性能统计时为None
+stage_times = None
+
+# 排列热点函数的统计：函数名 -> [调用次数, 总耗时]
+function_stats = {}
+
+# 生成图集的子进程中缓存日志的处理器
+build_log = None
+
+# 排列算法
+GUILLOTINE = "guillotine"
+MAXRECTS = "maxrects"
+
+# MaxRects放置规则
+BEST_SHORT_SIDE = "best_short_side"
+BEST_AREA = "best_area"
+BOTTOM_LEFT = "bottom_left"
+
+# 自动计算图集尺寸时长边与短边的最大比例，避免只为省面积而生成细长的图集
+MAX_ATLAS_ASPECT_RATIO = 4
+
+# 组合搜索时尝试的排序方式（均为降序）
+SORT_KEYS = {
+    "width": lambda size: size.w,
+    "height": lambda size: size.h,
+    "area": lambda size: size.area(),
+    "perimeter": lambda size: size.perimeter(),
+    "max_side": lambda size: max(size.w, size.h),
+}
+
+# 组合搜索时尝试的算法及其评分规则
+PORTFOLIO_HEURISTICS = (
+    (GUILLOTINE, (MIN_AREA, SHOR_TSIDE, MAX_AREA)),
+    (MAXRECTS, (BEST_SHORT_SIDE, BEST_AREA, BOTTOM_LEFT)),
+)
+
+# 组合搜索子进程中候选方案的截止时间，为None时不限制
+search_deadline = None
+
+# 生成图集期间各图集共用的组合搜索进程池，由generate_atlases创建和关闭
+portfolio_executor = None
+
+# 动画帧名称末尾的序号，如walk_0001
+ANIMATION_FRAME_REGEX = re.compile(r"[_\-]?\d+$")
+
 
 class AtlasGeneratorApp:
     def __init__(self, root):
         self.root = root
         self.root.title("图集生成工具")
-        self.root.geometry("600x250")
+        self.root.geometry("600x380")
 
         # 创建界面
         self.create_widgets()
@@ -103,6 +231,48 @@ class AtlasGeneratorApp:
         )
         max_size_spin.grid(row=1, column=1, sticky=tk.W, pady=5, padx=(5, 0))
 
+        # 排列算法
+        ttk.Label(left_column, text="排列算法:").grid(
+            row=2, column=0, sticky=tk.W, pady=5
+        )
+        self.packing_algorithm_var = tk.StringVar(value=setting["packing_algorithm"])
+        packing_algorithm_combo = ttk.Combobox(
+            left_column,
+            textvariable=self.packing_algorithm_var,
+            values=[GUILLOTINE, MAXRECTS],
+            width=15,
+            state="readonly",
+        )
+        packing_algorithm_combo.grid(row=2, column=1, sticky=tk.W, pady=5, padx=(5, 0))
+
+        # MaxRects放置规则
+        ttk.Label(right_column, text="MaxRects规则:").grid(
+            row=2, column=0, sticky=tk.W, pady=5
+        )
+        self.maxrects_rule_var = tk.StringVar(value=setting["maxrects_rule"])
+        maxrects_rule_combo = ttk.Combobox(
+            right_column,
+            textvariable=self.maxrects_rule_var,
+            values=[BEST_SHORT_SIDE, BEST_AREA, BOTTOM_LEFT],
+            width=15,
+            state="readonly",
+        )
+        maxrects_rule_combo.grid(row=2, column=1, sticky=tk.W, pady=5, padx=(5, 0))
+
+        # mipmap缩小滤波器
+        ttk.Label(left_column, text="Mipmap滤波:").grid(
+            row=3, column=0, sticky=tk.W, pady=5
+        )
+        self.mipmap_filter_var = tk.StringVar(value=setting["mipmap_filter"])
+        mipmap_filter_combo = ttk.Combobox(
+            left_column,
+            textvariable=self.mipmap_filter_var,
+            values=list(MIPMAP_FILTERS),
+            width=15,
+            state="readonly",
+        )
+        mipmap_filter_combo.grid(row=3, column=1, sticky=tk.W, pady=5, padx=(5, 0))
+
         # 复选框参数
         check_frame = ttk.Frame(settings_frame)
         check_frame.grid(
@@ -117,7 +287,37 @@ class AtlasGeneratorApp:
         self.delete_temp_var = tk.BooleanVar(value=setting["delete_temporary_png"])
         ttk.Checkbutton(
             check_frame, text="删除临时PNG文件", variable=self.delete_temp_var
-        ).grid(row=0, column=1, sticky=tk.W)
+        ).grid(row=0, column=1, sticky=tk.W, padx=(0, 20))
+
+        self.portfolio_search_var = tk.BooleanVar(value=setting["portfolio_search"])
+        ttk.Checkbutton(
+            check_frame, text="组合搜索排列方案", variable=self.portfolio_search_var
+        ).grid(row=0, column=2, sticky=tk.W)
+
+        self.allow_rotation_var = tk.BooleanVar(value=setting["allow_rotation"])
+        ttk.Checkbutton(
+            check_frame, text="允许旋转图片", variable=self.allow_rotation_var
+        ).grid(row=1, column=0, sticky=tk.W, padx=(0, 20))
+
+        self.global_dedup_var = tk.BooleanVar(value=setting["global_dedup"])
+        ttk.Checkbutton(
+            check_frame, text="跨目录去重", variable=self.global_dedup_var
+        ).grid(row=1, column=1, sticky=tk.W, padx=(0, 20))
+
+        self.near_dedup_var = tk.BooleanVar(value=setting["near_dedup"])
+        ttk.Checkbutton(
+            check_frame, text="合并近似图片", variable=self.near_dedup_var
+        ).grid(row=1, column=2, sticky=tk.W)
+
+        self.multi_bin_var = tk.BooleanVar(value=setting["multi_bin"])
+        ttk.Checkbutton(
+            check_frame, text="多页统一分配", variable=self.multi_bin_var
+        ).grid(row=2, column=0, sticky=tk.W, padx=(0, 20))
+
+        self.mipmaps_var = tk.BooleanVar(value=setting["mipmaps"])
+        ttk.Checkbutton(check_frame, text="生成Mipmap", variable=self.mipmaps_var).grid(
+            row=2, column=1, sticky=tk.W, padx=(0, 20)
+        )
 
         # 控制按钮
         button_frame = ttk.Frame(main_frame)
@@ -130,488 +330,2708 @@ class AtlasGeneratorApp:
 
     def get_all_var(self):
         return {
+            **get_setting_vars(setting),
             "format_var": self.format_var.get(),
             "border_var": self.border_var.get(),
             "padding_var": self.padding_var.get(),
             "max_size_var": self.max_size_var.get(),
             "add_white_var": self.add_white_var.get(),
             "delete_temp_var": self.delete_temp_var.get(),
+            "packing_algorithm_var": self.packing_algorithm_var.get(),
+            "maxrects_rule_var": self.maxrects_rule_var.get(),
+            "portfolio_search_var": self.portfolio_search_var.get(),
+            "allow_rotation_var": self.allow_rotation_var.get(),
+            "global_dedup_var": self.global_dedup_var.get(),
+            "near_dedup_var": self.near_dedup_var.get(),
+            "multi_bin_var": self.multi_bin_var.get(),
+            "mipmaps_var": self.mipmaps_var.get(),
+            "mipmap_filter_var": self.mipmap_filter_var.get(),
         }
 
     def start_generation(self):
         """开始生成图集"""
-        global setting_var
-        setting_var = self.get_all_var()
-
         try:
-            # 加载并处理输入图片
-            input_subdir = get_input_subdir()
-
-            log.info("所有图像加载完毕\n")
+            result = generate_atlases(self.get_all_var())
+        except Exception as e:
+            messagebox.showerror("错误", f"生成图集时出错: {str(e)}")
+            log.error(traceback.format_exc())
+            return
 
-            if not input_subdir:
+        if result["failed"]:
+            messagebox.showwarning(
+                "完成", f"{len(result['failed'])} 个图集生成失败，详见日志"
+            )
+        elif not result["atlases"]:
+            if result["skipped"]:
+                messagebox.showinfo("完成", "所有图集均未变化，无需重新生成")
+            else:
                 messagebox.showerror("错误", "未找到任何图像")
-                return
+        elif result["dds_failures"]:
+            messagebox.showwarning("完成", "图集已生成，部分DDS转换失败，详见日志")
+        else:
+            messagebox.showinfo("完成", "所有图集已成功生成！")
 
-            total_dirs = len(input_subdir)
-            dir_count = 0
 
-            # 为每个子目录创建图集
-            for atlas_name, subdir in input_subdir.items():
-                dir_count += 1
-                atlas_stem_name = atlas_name.split("-")[0]
+def get_setting_vars(setting):
+    """
+    从配置文件的generate_atlas设置生成完整的生成参数
 
-                images = subdir["images"]
-                rectangles = subdir["rectangles"]
+    界面和命令行在此基础上覆盖各自提供的参数
+    """
+    return {
+        "format_var": setting["output_format"],
+        "border_var": setting["border"],
+        "padding_var": setting["padding"],
+        "max_size_var": setting["max_size"],
+        "add_white_var": setting["add_white_rect"],
+        "delete_temp_var": setting["delete_temporary_png"],
+        "packing_algorithm_var": setting["packing_algorithm"],
+        "maxrects_rule_var": setting["maxrects_rule"],
+        "portfolio_search_var": setting["portfolio_search"],
+        "portfolio_time_budget_var": setting["portfolio_time_budget"],
+        "max_workers_var": setting["max_workers"],
+        "trigger_several_efficiency_var": setting["trigger_several_efficiency"],
+        "dds_encoder_var": setting["dds_encoder"],
+        "incremental_var": setting["incremental_build"],
+        "prefetch_var": setting["prefetch_dirs"],
+        "variant_scales_var": setting["variant_scales"],
+        "mipmaps_var": setting["mipmaps"],
+        "mipmap_filter_var": setting["mipmap_filter"],
+        "allow_rotation_var": setting["allow_rotation"],
+        "global_dedup_var": setting["global_dedup"],
+        "common_atlas_var": setting["common_atlas_name"],
+        "near_dedup_var": setting["near_dedup"],
+        "near_dedup_tolerance_var": setting["near_dedup_tolerance"],
+        "near_dedup_ratio_var": setting["near_dedup_max_ratio"],
+        "performance_monitor_var": setting["performance_monitor_enabled"],
+        "trim_alpha_var": setting["trim_alpha_threshold"],
+        "parallel_atlases_var": setting["parallel_atlases"],
+        "parallel_memory_var": setting["parallel_memory_mb"],
+        "multi_bin_var": setting["multi_bin"],
+        "keep_animations_var": setting["keep_animations_together"],
+    }
+
+
+def get_page_summary(result):
+    """获取一页图集的摘要：名称、尺寸、图片数量和占用率"""
+    atlas_size = result["atlas_size"]
+    used_area = sum(rect.area() for _, _, rect in result["rectangles"])
+
+    return {
+        "name": result["name"],
+        "width": atlas_size.w,
+        "height": atlas_size.h,
+        "sprites": len(result["rectangles"]),
+        "occupancy": used_area / atlas_size.area() if atlas_size.area() else 0,
+    }
+
+
+class PageCollector:
+    """
+    在生成图集的子进程中代替DDS转换队列
 
-                # 执行图集创建流程
-                results = create_atlas(atlas_stem_name, rectangles, images)
+    只收集需要转换的图集，由主进程加入转换队列统一转换
+    """
 
-                # 输出图集文件
-                for result in results:
-                    result["atlas_size"] = write_atlas(images, result)
+    def __init__(self):
+        self.pages = []  # [(图集图片, 目标文件), ...]
 
-                # 生成Lua数据文件
-                write_lua_data(images, results, atlas_stem_name)
+    def add(self, img, target_file):
+        self.pages.append((img, target_file))
 
-                log.info(f"{atlas_stem_name}图集生成完毕\n")
 
-                # 释放图片资源
-                for img_info in images:
-                    img_info["image"].close()
+class LogCollector(logging.Handler):
+    """缓存生成图集的子进程中的日志，由主进程按提交顺序输出"""
 
-            messagebox.showinfo("完成", "所有图集已成功生成！")
+    def __init__(self):
+        super().__init__()
+        self.records = []  # [(日志级别, 日志内容), ...]
 
-        except Exception as e:
-            messagebox.showerror("错误", f"生成图集时出错: {str(e)}")
-            log.error(traceback.format_exc())
+    def emit(self, record):
+        self.records.append((record.levelno, record.getMessage()))
 
 
-def process_img(img):
+def build_atlas(atlas_stem_name, subdir, dds_converter):
     """
-    处理单张图片：裁剪透明区域并计算裁剪信息
+    生成单个目录的图集、Lua数据文件和各分辨率的图集变体
 
     Args:
-        img: PIL图片对象
+        atlas_stem_name: 图集名称
+        subdir: 目录的图片数据
+        dds_converter: DDS转换队列，输出DDS格式时使用
 
     Returns:
-        tuple: (裁剪后的图片, 裁剪信息元组)
+        tuple: (打包结果列表, 输出文件名列表, 包括变体在内的所有页面名称)
     """
-    origin_width = img.width
-    origin_height = img.height
+    images = subdir["images"]
+    rectangles = subdir["rectangles"]
 
-    left = top = right = bottom = 0
+    # 执行图集创建流程
+    with profile_stage("pack"):
+        results = create_atlas(atlas_stem_name, rectangles, images)
 
-    bbox = img.getbbox() or (0, 0, 0, 0)
+    # 输出图集文件
+    for result in results:
+        result["atlas_size"] = write_atlas(images, result, dds_converter)
+        for rect_id, _, _ in result["rectangles"]:
+            images[rect_id]["result"] = result
+
+    # 生成Lua数据文件
+    references = resolve_references(subdir)
+    write_lua_data(images, results, atlas_stem_name, references)
+    outputs = get_build_outputs(results, atlas_stem_name)
+    page_names = [result["name"] for result in results]
+
+    # 按全分辨率的排列结果输出其他分辨率的图集
+    for scale in get_variant_scales():
+        variant_results = write_variant(
+            images, results, atlas_stem_name, subdir, scale, dds_converter
+        )
+        outputs += get_build_outputs(
+            variant_results, get_variant_name(atlas_stem_name, scale)
+        )
+        page_names += [result["name"] for result in variant_results]
 
-    left, top, right, bottom = bbox
+    return results, outputs, page_names
 
-    # 计算裁剪信息（相对于原始图片）
-    right = origin_width - right
-    bottom = origin_height - bottom
 
-    # 裁剪图片
-    new_img = img.crop(bbox)
+def run_build(atlas_stem_name, subdir, dds_converter):
+    """
+    生成单个目录的图集，开启性能统计时记录各阶段耗时和排列热点函数的调用
 
-    trim_data = Bounds(left, top, right, bottom)
+    Returns:
+        dict: 生成结果
+            - results, outputs, page_names: 见build_atlas
+            - seconds: 生成耗时，不含图片加载
+            - stages, calls: 开启性能统计时才有
+    """
+    global stage_times
+    start_time = time.perf_counter()
+    profiling = setting_var["performance_monitor_var"]
 
-    return new_img, trim_data
+    if profiling:
+        stage_times = dict.fromkeys(PROFILE_STAGES, 0.0)
+        calls_before = {name: tuple(stats) for name, stats in function_stats.items()}
 
+    try:
+        results, outputs, page_names = build_atlas(
+            atlas_stem_name, subdir, dds_converter
+        )
+    finally:
+        stages, stage_times = stage_times, None
+
+    built = {
+        "results": results,
+        "outputs": outputs,
+        "page_names": page_names,
+        "seconds": time.perf_counter() - start_time,
+    }
+
+    if profiling:
+        built["stages"] = stages
+        built["calls"] = {
+            name: {
+                "count": stats[0] - calls_before[name][0],
+                "seconds": stats[1] - calls_before[name][1],
+            }
+            for name, stats in function_stats.items()
+        }
 
-def calculate_image_hash(img):
-    """
-    计算图片哈希值，支持多种策略
-    """
-    # 策略1：使用图片数据哈希（准确但较慢）
-    return hashlib.md5(img.tobytes()).hexdigest()
+    return built
 
 
-def process_single_image(image_file, hash_groups):
+def init_build_worker(worker_setting_var, output_path):
     """
-    处理单张图片
+    生成图集的进程池初始化函数
+
+    子进程中的组合搜索只使用一个进程，避免与其他图集争抢CPU；
+    日志先缓存，由主进程按提交顺序输出
     """
-    image_file_name = image_file.stem
+    global build_log
+    init_worker({**worker_setting_var, "max_workers_var": 1})
+    config.output_path = output_path
 
-    # 先检查文件大小再计算哈希（快速跳过）
-    file_size = image_file.stat().st_size
-    if file_size == 0:
-        log.warning(f"跳过空文件: {image_file.name}")
-        return None
+    build_log = LogCollector()
+    log.handlers.clear()
+    log.addHandler(build_log)
 
-    with Image.open(image_file) as img:
-        # 如果需要更快的速度，可以使用文件内容的哈希而不是图片数据的哈希
-        hash_key = calculate_image_hash(img)
-
-        # 跳过重复图片
-        if hash_key in hash_groups:
-            hash_group = hash_groups[hash_key]
-            hash_group["similar"].append(image_file_name)
-            log.info(f"跳过重复图片 {image_file.name}")
-            return None
+    # fork启动的子进程可能已经继承了主进程添加的装饰器
+    if worker_setting_var["performance_monitor_var"] and not hasattr(
+        find_position, "__wrapped__"
+    ):
+        add_performance_monitor_decorator()
 
-        # 处理图片：裁剪透明区域
-        new_img, trim = process_img(img)
 
-        # 构建图片数据字典
-        img_data = {
-            "name": image_file_name,
-            "image": new_img,
-            "origin_size": Size(img.width, img.height),
-            "samed_img": [],  # 相同图片列表
-            "trim": trim,  # 裁剪信息
-            "file_size": file_size,
-            "aspect_ratio": img.width / img.height if img.height > 0 else 0,
-        }
+def run_build_task(atlas_stem_name, subdir):
+    """
+    在子进程中生成单个目录的图集
 
-        # 更新哈希分组
-        hash_groups[hash_key] = {
-            "main": img_data,
-            "similar": img_data["samed_img"],
-        }
+    Returns:
+        dict: run_build的生成结果，另有需要转换的DDS图集dds_pages和缓存的日志logs；
+            生成失败时只有error、traceback和logs
+    """
+    build_log.records.clear()
+    collector = PageCollector()
+    dds_converter = collector if setting_var["format_var"] in ("bc3", "bc7") else None
 
-        log.debug(
-            f"加载图片 {image_file.name} "
-            f"({img.width}x{img.height} → {new_img.width}x{new_img.height}) "
-            f"大小: {file_size:,} bytes"
-        )
+    # 出错时也要带回已缓存的日志，错误交给主进程按目录记录
+    try:
+        built = run_build(atlas_stem_name, subdir, dds_converter)
+        built["dds_pages"] = collector.pages
+    except Exception as e:
+        built = {"error": str(e), "traceback": traceback.format_exc()}
+    built["logs"] = build_log.records[:]
 
-        return img_data
+    return built
 
 
-def process_directory(directory_path, padding):
-    """
-    处理单个目录的图片
+def get_worker_shares(max_workers):
     """
-    hash_groups = {}  # 用于检测重复图片
-    images = []
-
-    # 1. 预收集所有图片文件路径
-    image_files = list(directory_path.glob("*.*"))
-    image_files = [
-        f for f in image_files if f.suffix.lower() in {".png", ".jpg", ".jpeg"}
-    ]
+    并行生成图集时把进程数分给生成、加载和DDS转换三个进程池
 
-    # 2. 批量处理图片（减少IO操作）
-    for image_file in image_files:
-        log.info(f"📂 处理图片: {image_file.name}...")
-        try:
-            image_data = process_single_image(image_file, hash_groups)
-            if image_data:
-                images.append(image_data)
-        except Exception as e:
-            log.error(f"处理图片 {image_file.name} 失败: {e}")
-            continue
+    三个进程池会同时工作：多个图集在排列，后续目录在后台解码，完成的页面在转换，
+    各自按全部进程数创建会使CPU超额订阅。生成占一半，其余由加载和DDS转换平分
 
-    if not images:
-        return None
+    Returns:
+        tuple: (生成进程数, 加载进程数, DDS转换进程数)
+    """
+    build_workers = max(1, max_workers // 2)
+    load_workers = max(1, (max_workers - build_workers) // 2)
+    dds_workers = max(1, max_workers - build_workers - load_workers)
 
-    # 3. 准备矩形数据（使用生成器表达式）
-    rectangles = [
-        (
-            i,
-            img["name"],
-            Size(img["image"].width + padding, img["image"].height + padding),
-        )
-        for i, img in enumerate(images)
-    ]
+    return build_workers, load_workers, dds_workers
 
-    # 4. 使用更高效的排序
-    rectangles.sort(key=lambda r: r[2].w, reverse=True)
 
-    return {"images": images, "rectangles": rectangles}
+def estimate_build_memory(subdir):
+    """预估生成单个目录的图集时占用的内存"""
+    pixels = sum(img["image"].width * img["image"].height for img in subdir["images"])
+    return pixels * BUILD_BYTES_PER_PIXEL
 
 
-def get_input_subdir():
+def finish_atlas(atlas_name, subdir, built, dds_converter):
     """
-    加载输入目录中的所有图片并进行处理
+    汇总单个目录的生成结果
+
+    子进程生成的图集先输出其缓存的日志，再把DDS图集加入主进程的转换队列
+
+    Args:
+        atlas_name: 目录名
+        subdir: 目录的图片数据
+        built: run_build的生成结果
+        dds_converter: DDS转换队列
 
     Returns:
-        dict: 按子目录组织的图片数据字典
+        dict: 图集记录，见generate_atlases
     """
-    input_subdir = {}
-    padding = setting_var["padding_var"]
+    for levelno, message in built.get("logs", ()):
+        log.log(levelno, message)
+    for img, target_file in built.get("dds_pages", ()):
+        dds_converter.add(img, target_file)
+
+    atlas_stem_name = atlas_name.split("-")[0]
+    results = built["results"]
+    atlas = {
+        "name": atlas_stem_name,
+        "pages": [get_page_summary(result) for result in results],
+        "occupancy": calculate_occupancy(
+            [(result["atlas_size"], result["rectangles"]) for result in results]
+        ),
+        "seconds": built["seconds"],
+    }
+
+    if "stages" in built:
+        # 图片在加载进程中解码、裁剪，公共图集的图片已在各自目录加载
+        for stage, seconds in subdir.get("timings", {}).items():
+            built["stages"][stage] += seconds
+        atlas["stages"] = built["stages"]
+        atlas["calls"] = built["calls"]
+
+    log.info(f"{atlas_stem_name}图集生成完毕\n")
+
+    return atlas
+
+
+def release_images(images):
+    """释放图片及其各分辨率变体的资源"""
+    for img_info in images:
+        img_info["image"].close()
+        for variant in img_info.get("variants", {}).values():
+            variant["image"].close()
+
+
+def generate_atlases(settings):
+    """
+    为输入目录中的每个子目录生成图集，不依赖界面
 
-    # 1. 并行处理子目录
-    with concurrent.futures.ThreadPoolExecutor(
-        max_workers=min(4, (os.cpu_count() or 2))
-    ) as executor:
-        # 提交所有子目录处理任务
-        future_to_dir = {
-            executor.submit(process_directory, item, padding): item.name
-            for item in config.input_path.iterdir()
-            if item.is_dir()
-        }
+    开启并行生成时各目录的图集在进程池中排列、合成和写入，像素最多的目录最先加载和提交；
+    同时生成的图集受进程数和parallel_memory_mb限制，日志和结果仍按提交顺序收集，
+    生成、加载和DDS转换的进程池分享同一份进程数，见get_worker_shares。
+    开启性能统计时记录每个图集各阶段的耗时和排列热点函数的调用次数，
+    输出日志表格并保存到输出目录的PERFORMANCE_REPORT_FILE
 
-        # 收集结果
-        for future in concurrent.futures.as_completed(future_to_dir):
-            dir_name = future_to_dir[future]
-            result = future.result()
-            if result:
-                input_subdir[dir_name] = result
+    Args:
+        settings: 生成参数，见get_setting_vars
 
-    return input_subdir
+    Returns:
+        dict: 生成结果
+            - atlases: [{"name", "pages": [页面摘要, ...], "occupancy", "seconds"}, ...]，
+              按目录名排列，公共图集在最前；开启性能统计时还有"stages"和"calls"
+            - skipped: 未变化而跳过的目录数量
+            - failed: {目录名: 错误信息}，生成失败的目录跳过，不影响其他目录
+            - dds_failures: {文件名: 失败信息}
+            - seconds: 总耗时
+    """
+    global setting_var, portfolio_executor
+    setting_var = settings
+    start_time = time.perf_counter()
+    profiling = setting_var["performance_monitor_var"]
+
+    max_workers = get_max_workers()
+    build_workers, load_workers, dds_workers = get_worker_shares(max_workers)
+    if not setting_var["parallel_atlases_var"] or build_workers < 2:
+        # 不并行生成时图集在主进程中依次排列，加载和DDS转换不会同时占满CPU
+        build_workers = 0
+        load_workers = dds_workers = max_workers
+
+    # DDS格式收集所有图集后并行转换
+    dds_converter = None
+    if setting_var["format_var"] in ("bc3", "bc7"):
+        dds_converter = DDSConverter(
+            config.output_path,
+            setting_var["format_var"],
+            setting_var["dds_encoder_var"],
+            setting_var["delete_temp_var"],
+            dds_workers,
+            setting_var["mipmaps_var"],
+            setting_var["mipmap_filter_var"],
+            # 边缘颜色只扩展到间距的一半，不会染到相邻图片
+            setting_var["padding_var"] // 2,
+        )
 
+    manifest = load_output_json(BUILD_MANIFEST_FILE)
+    builds = []
+    atlases = []  # [(排序键, 图集记录), ...]
+    page_owners = {}  # 页面名称 -> 所属图集的记录，用于归入DDS编码耗时
+    skipped = 0
+    failed = {}
+
+    builder = None
+    if build_workers:
+        builder = concurrent.futures.ProcessPoolExecutor(
+            max_workers=build_workers,
+            initializer=init_build_worker,
+            initargs=(setting_var, config.output_path),
+        )
+    # 主进程中排列的图集共用一个组合搜索进程池，不再为每个图集创建
+    if setting_var["portfolio_search_var"] and max_workers > 1:
+        portfolio_executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=init_worker,
+            initargs=(setting_var,),
+        )
+    memory_budget = setting_var["parallel_memory_var"] * 1024 * 1024
+    building = deque()  # 按提交顺序：(目录名, 图片数据, 生成任务, 预估内存)
+    shared_images = []  # 被其他目录引用的公共图集图片，所有图集生成后释放
 
-def calculate_score(rect, strategy):
+    def collect_oldest():
+        """等待最早提交的图集完成并记录结果"""
+        atlas_name, subdir, future, _ = building.popleft()
+        try:
+            built = future.result()
+        except Exception as e:
+            built = {"error": str(e), "traceback": traceback.format_exc()}
+
+        if "error" in built:
+            for levelno, message in built.get("logs", ()):
+                log.log(levelno, message)
+            log.error(f"❌ {atlas_name} 图集生成失败，已跳过: {built['error']}")
+            log.debug(built["traceback"])
+            failed[atlas_name] = built["error"]
+            # 失败的目录下次不能按增量生成跳过
+            manifest.pop(atlas_name, None)
+            if not subdir.get("shared"):
+                release_images(subdir["images"])
+            return
+
+        atlas = finish_atlas(atlas_name, subdir, built, dds_converter)
+        atlases.append(((not subdir.get("shared"), atlas_name), atlas))
+
+        # 公共图集由多个目录共同决定，没有构建指纹，不记录
+        if subdir.get("fingerprint"):
+            builds.append((atlas_name, subdir["fingerprint"], built["outputs"]))
+
+        for page_name in built["page_names"]:
+            page_owners[page_name] = atlas
+
+        if subdir.get("shared"):
+            shared_images.extend(subdir["images"])
+        else:
+            release_images(subdir["images"])
+
+    if profiling:
+        add_performance_monitor_decorator()
+
+    try:
+        # 逐个目录加载并生成图集，后续目录在后台预读
+        for atlas_name, subdir in iter_input_subdir(
+            manifest, load_workers, largest_first=builder is not None
+        ):
+            if subdir is None:
+                skipped += 1
+                continue
+
+            atlas_stem_name = atlas_name.split("-")[0]
+            memory = estimate_build_memory(subdir)
+
+            # 公共图集的排列结果被其他目录引用，在主进程中生成
+            local = builder is None or subdir.get("shared")
+
+            # 进程都在忙或超出内存预算时，等待最早提交的图集完成，至少保留一个任务
+            while building and (
+                local
+                or len(building) >= build_workers
+                or sum(item[3] for item in building) + memory > memory_budget
+            ):
+                collect_oldest()
+
+            if local:
+                future = concurrent.futures.Future()
+                try:
+                    future.set_result(run_build(atlas_stem_name, subdir, dds_converter))
+                except Exception as e:
+                    future.set_exception(e)
+            else:
+                future = builder.submit(run_build_task, atlas_stem_name, subdir)
+            building.append((atlas_name, subdir, future, memory))
+
+        while building:
+            collect_oldest()
+
+        dds_failures = dds_converter.finish() if dds_converter else {}
+    finally:
+        release_images(shared_images)
+        if builder:
+            builder.shutdown(cancel_futures=True)
+        if portfolio_executor:
+            portfolio_executor.shutdown(cancel_futures=True)
+            portfolio_executor = None
+        if dds_converter:
+            dds_converter.shutdown()
+        if profiling:
+            remove_performance_monitor_decorator()
+
+    # DDS转换完成后记录构建清单
+    for atlas_name, fingerprint, outputs in builds:
+        record_build(manifest, atlas_name, fingerprint, outputs)
+    save_output_json(BUILD_MANIFEST_FILE, manifest)
+
+    result = {
+        # 结果与提交顺序无关：公共图集在最前，其余按目录名排列
+        "atlases": [atlas for _, atlas in sorted(atlases, key=lambda item: item[0])],
+        "skipped": skipped,
+        "failed": failed,
+        "dds_failures": dds_failures,
+        "seconds": time.perf_counter() - start_time,
+    }
+
+    if profiling:
+        # DDS在转换队列中并行编码，耗时按页面归入所属图集
+        if dds_converter:
+            for file_name, seconds in dds_converter.timings.items():
+                atlas = page_owners.get(Path(file_name).stem)
+                if atlas:
+                    atlas["stages"]["encode"] += seconds
+
+        report_performance(result)
+
+    return result
+
+
+def get_alpha_bbox(img, alpha_threshold):
     """
-    计算矩形区域的分数，用于选择最佳放置位置
+    按透明通道计算图片内容的边界
+
+    一次计算出不透明像素的掩码，再分别得到行和列的占用情况
 
     Args:
-        rect: 待评估的矩形区域
-        strategy: 评分策略，目前仅支持最小面积策略
+        img: 带透明通道的PIL图片对象
+        alpha_threshold: 透明度不超过该值的像素视为透明
 
     Returns:
-        float: 分数值，分数越小表示越优先选择
+        tuple: (left, top, right, bottom)，没有内容时返回None
     """
-    if strategy == MIN_AREA:
-        return rect.area()  # 使用面积作为评分
-    elif strategy == SHOR_TSIDE:
-        return min(rect.w, rect.h)  # 使用短边长度作为评分
-    elif strategy == MAX_AREA:
-        return -rect.area()  # 使用面积作为评分
+    mask = np.asarray(img.getchannel("A")) > alpha_threshold
 
-    return 0
+    rows = np.flatnonzero(mask.any(axis=1))
+    if not rows.size:
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+
+    return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
 
 
-def calculate_optimal_size(rectangles):
+def process_img(img, alpha_threshold=0):
     """
-    计算最优的图集尺寸
+    处理单张图片：裁剪透明区域并计算裁剪信息
 
-    通过尝试不同尺寸，找到空间利用率最高的图集尺寸
+    带透明通道的图片中透明度不超过alpha_threshold的像素也视为透明，
+    用于裁掉导出工具留下的淡边
 
     Args:
-        rectangles: 矩形数据列表
+        img: PIL图片对象
+        alpha_threshold: 透明判定阈值
 
     Returns:
-        tuple: 最佳尺寸 Vector(width, height)
+        tuple: (裁剪后的图片, 裁剪信息元组)
     """
-    total_area = sum(rect[2].area() for rect in rectangles)
-    sqrt_area = int(total_area**0.5 * 1.1)
+    origin_width = img.width
+    origin_height = img.height
 
-    size = 1 << sqrt_area.bit_length()
+    left = top = right = bottom = 0
 
-    if size > setting_var["max_size_var"]:
-        size = setting_var["max_size_var"]
+    if "A" in img.getbands():
+        bbox = get_alpha_bbox(img, alpha_threshold)
+    else:
+        bbox = img.getbbox()
 
-    size = Size(size, size)
+    bbox = bbox or (0, 0, 0, 0)
 
-    return size
+    left, top, right, bottom = bbox
 
+    # 计算裁剪信息（相对于原始图片）
+    right = origin_width - right
+    bottom = origin_height - bottom
 
-def find_position(free_rectangles, rect):
-    """
-    在空闲区域中寻找最佳放置位置
+    # 裁剪图片
+    new_img = img.crop(bbox)
 
-    Args:
-        free_rectangles: 当前空闲区域列表
-        width: 待放置矩形的宽度
-        height: 待放置矩形的高度
+    trim_data = Bounds(left, top, right, bottom)
 
-    Returns:
-        tuple: (更新后的空闲区域列表, (最佳矩形, 所在空闲区域, 空闲区域索引)) 或 None
+    return new_img, trim_data
+
+
+def calculate_image_hash(img):
+    """
+    计算图片哈希值，支持多种策略
     """
-    best_score = float("inf")  # 最佳分数（越小越好）
-    best_rect = in_free_rect = in_free_rect_idx = None
+    # 策略1：使用图片数据哈希（准确但较慢）
+    return hashlib.md5(img.tobytes()).hexdigest()
 
-    # 遍历所有空闲区域
-    for i, free_rect in enumerate(free_rectangles):
-        # 跳过无法容纳当前矩形的区域
-        if free_rect.w < rect.w or free_rect.h < rect.h:
-            continue
 
-        # 计算当前空闲区域的分数
-        score = calculate_score(free_rect, MIN_AREA)
+def load_output_json(file_name):
+    """
+    读取输出目录中的JSON记录文件
+
+    Returns:
+        dict: 文件内容，文件不存在或损坏时返回空字典
+    """
+    json_file = config.output_path / file_name
+    if not json_file.exists():
+        return {}
 
-        # 更新最佳位置
-        if score < best_score:
-            best_score = score
-            best_rect = Rectangle(free_rect.x, free_rect.y, rect.w, rect.h)
-            in_free_rect = free_rect
-            in_free_rect_idx = i
+    try:
+        with open(json_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        log.warning(f"读取{file_name}失败，将重新生成: {e}")
+        return {}
 
-    if best_rect:
-        return best_rect, in_free_rect, in_free_rect_idx
 
-    return None
+def save_output_json(file_name, data):
+    """保存输出目录中的JSON记录文件"""
+    with open(config.output_path / file_name, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
 
 
-def split_free_rectangle(free_rectangles, free_rect, used_rect, free_rect_idx):
+def get_build_fingerprint(probes):
     """
-    将空闲区域分割为剩余空间
+    计算图集的构建指纹
 
-    当在一个空闲区域中放置矩形后，将剩余空间分割为右侧和下方的两个新空闲区域
+    由影响输出的生成参数和输入文件的名称、大小、内容哈希组成，任一变化都会重新生成
 
     Args:
-        free_rectangles: 当前空闲区域列表
-        free_rect: 被使用的空闲区域
-        used_rect: 已放置的矩形区域
-        free_rect_idx: 被使用的空闲区域在列表中的索引
-    """
-    new_rects = []
-
-    # 检查右侧是否还有剩余空间
-    if used_rect.x + used_rect.w != free_rect.x + free_rect.w:
-        new_rects.append(
-            Rectangle(
-                used_rect.x + used_rect.w,
-                free_rect.y,
-                free_rect.x + free_rect.w - (used_rect.x + used_rect.w),
-                free_rect.h,
-            )
-        )
+        probes: [(图片文件路径, 索引记录), ...]
 
-    # 检查下方是否还有剩余空间
-    if used_rect.y + used_rect.h != free_rect.y + free_rect.h:
-        new_rects.append(
-            Rectangle(
-                used_rect.x,
-                used_rect.y + used_rect.h,
-                used_rect.w,
-                free_rect.y + free_rect.h - (used_rect.y + used_rect.h),
-            )
-        )
+    Returns:
+        str: 指纹
+    """
+    build_settings = {
+        key: value
+        for key, value in setting_var.items()
+        if key not in NON_BUILD_SETTINGS
+    }
 
-    if not new_rects:
-        # 如果空间完全被使用，标记为空矩形
-        free_rectangles[free_rect_idx] = Rectangle(0, 0, 0, 0)
-        return
+    digest = hashlib.sha1(json.dumps(build_settings, sort_keys=True).encode())
+    for image_file, entry in probes:
+        file_key = [image_file.name, entry and [entry["size"], entry["crc"]]]
+        digest.update(json.dumps(file_key).encode())
 
-    free_rectangles[free_rect_idx] = new_rects[0]
-    free_rectangles.extend(new_rects[1:])
+    return digest.hexdigest()
 
 
-def try_merge_rectangles(rect1, rect2):
+def is_build_current(build, fingerprint):
     """
-    尝试合并两个相邻的矩形
+    判断上次构建的输出是否仍然可用
 
-    支持水平合并（左右相邻）和垂直合并（上下相邻）
+    指纹相同，且记录的输出文件都存在、修改时间未变时可直接复用
 
     Args:
-        rect1: 第一个矩形
-        rect2: 第二个矩形
+        build: 构建清单中的记录
+        fingerprint: 本次的构建指纹
 
     Returns:
-        Rectangle: 合并后的矩形，如果无法合并则返回None
+        bool: 是否可以跳过生成
     """
-    # 水平合并：Y坐标和高度相同，且rect1右侧紧邻rect2左侧
-    if rect1.y == rect2.y and rect1.h == rect2.h:
-        if rect1.x + rect1.w == rect2.x:
-            return Rectangle(rect1.x, rect1.y, rect1.w + rect2.w, rect1.h)
+    if not build or build["fingerprint"] != fingerprint:
+        return False
 
-        if rect2.x + rect2.w == rect1.x:
-            return Rectangle(rect2.x, rect2.y, rect1.w + rect2.w, rect1.h)
+    for name, mtime in build["outputs"].items():
+        output_file = config.output_path / name
+        if not output_file.exists() or output_file.stat().st_mtime_ns != mtime:
+            return False
 
-    # 垂直合并：X坐标和宽度相同，且rect1下方紧邻rect2上方
-    if rect1.x == rect2.x and rect1.w == rect2.w:
-        if rect1.y + rect1.h == rect2.y:
-            return Rectangle(rect1.x, rect1.y, rect1.w, rect1.h + rect2.h)
+    return True
 
-        if rect2.y + rect2.h == rect1.y:
-            return Rectangle(rect2.x, rect2.y, rect1.w, rect1.h + rect2.h)
 
-    return None
+def get_build_outputs(results, atlas_stem_name):
+    """获取一个目录生成的所有输出文件名"""
+    output_format = setting_var["format_var"]
+    outputs = [f"{atlas_stem_name}.lua"]
 
+    for result in results:
+        if output_format == "png" or not setting_var["delete_temp_var"]:
+            outputs.append(f"{result['name']}.png")
+        if output_format == "bc3" or output_format == "bc7":
+            outputs.append(f"{result['name']}.dds")
 
-def merge_single_free_rect(merged_idx, free_rect, sorted_by_x, x_coords):
-    merged_rect = None
+    return outputs
 
-    # 使用二分查找找到可能可以合并的矩形
-    start_idx = bisect_left(x_coords, free_rect.x - free_rect.w)  # 调整搜索范围
 
-    for i in range(start_idx, len(sorted_by_x)):
-        if i in merged_idx:
-            continue
-        other_free_rect = sorted_by_x[i]
+def record_build(manifest, dir_name, fingerprint, output_names):
+    """
+    在构建清单中记录一个目录的输出
 
-        if other_free_rect.x > free_rect.x + free_rect.w:
-            break
+    输出文件不完整（如DDS转换失败）时不记录，下次重新生成
+    """
+    outputs = {}
+    for name in output_names:
+        output_file = config.output_path / name
+        if not output_file.exists():
+            manifest.pop(dir_name, None)
+            return
 
-        merged_rect = try_merge_rectangles(free_rect, other_free_rect)
-        if not merged_rect:
-            continue
+        outputs[name] = output_file.stat().st_mtime_ns
 
-        merged_idx.add(i)
+    manifest[dir_name] = {"fingerprint": fingerprint, "outputs": outputs}
 
-        other_merged_rect = merge_single_free_rect(
-            merged_idx, merged_rect, sorted_by_x, x_coords
-        )
-        if other_merged_rect:
-            merged_rect = other_merged_rect
 
-        break
+def probe_image_file(image_file, hash_index, used_index):
+    """
+    获取图片文件的尺寸和文件内容哈希
 
-    return merged_rect
+    只读取图片头获得尺寸，文件内容使用crc32快速哈希；索引中记录仍有效时直接复用
 
+    Args:
+        image_file: 图片文件路径
+        hash_index: 上次运行保存的图片哈希索引
+        used_index: 本次运行用到的索引，结束时保存
 
-def merge_free_rectangles(free_rectangles):
-    """
-    合并相邻的空闲矩形
+    Returns:
+        dict: 索引记录，空文件返回None
     """
-    if not free_rectangles:
-        return []
+    stat = image_file.stat()
+    if stat.st_size == 0:
+        return None
 
-    # 使用类似R-tree的空间索引优化
-    # 按x坐标排序并建立索引
-    sorted_by_x = sorted(free_rectangles, key=lambda r: r.x)
-    x_coords = [r.x for r in sorted_by_x]
+    key = image_file.as_posix()
+    entry = hash_index.get(key)
+
+    if not (
+        entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns
+    ):
+        data = image_file.read_bytes()
+        with Image.open(io.BytesIO(data)) as img:
+            width, height = img.size
+
+        entry = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "width": width,
+            "height": height,
+            "crc": zlib.crc32(data),
+            "pixel_hash": None,
+        }
 
-    merged_idx = set()
-    merged = []
+    used_index[key] = entry
+    return entry
 
-    for free_rect_idx in range(len(sorted_by_x)):
-        if free_rect_idx in merged_idx:
-            continue
 
-        free_rect = sorted_by_x[free_rect_idx]
+def load_image(image_file, need_hash, alpha_threshold):
+    """
+    在子进程中读取单张图片并裁剪透明区域
 
-        merged_rect = merge_single_free_rect(
-            merged_idx, free_rect, sorted_by_x, x_coords
-        )
+    只返回裁剪后的RGBA像素数据，避免在进程间传递PIL对象
 
-        if merged_rect:
-            merged_idx.add(free_rect_idx)
-            merged.append(merged_rect)
-        else:
-            merged.append(free_rect)
+    Args:
+        image_file: 图片文件路径
+        need_hash: 是否计算像素哈希
+        alpha_threshold: 裁剪透明区域的透明判定阈值
 
-    return merged
+    Returns:
+        dict: 图片加载结果，timings为解码、哈希、裁剪各自的耗时
+    """
+    timings = {}
+    start = time.perf_counter()
 
+    with Image.open(image_file) as img:
+        img.load()
+        timings["decode"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        hash_key = calculate_image_hash(img) if need_hash else None
+        timings["hash"] = time.perf_counter() - start
+
+        # 处理图片：裁剪透明区域
+        start = time.perf_counter()
+        new_img, trim = process_img(img, alpha_threshold)
+        new_img = new_img.convert("RGBA")
+        data = new_img.tobytes()
+        timings["trim"] = time.perf_counter() - start
+
+        return {
+            "hash": hash_key,
+            "size": (new_img.width, new_img.height),
+            "data": data,
+            "origin_size": Size(img.width, img.height),
+            "trim": trim,
+            "timings": timings,
+        }
+
+
+def process_single_image(image_file, hash_key, loaded, hash_groups):
+    """
+    处理单张图片的加载结果
+    """
+    image_file_name = image_file.stem
+
+    # 跳过重复图片
+    if hash_key in hash_groups:
+        hash_group = hash_groups[hash_key]
+        hash_group["similar"].append(image_file_name)
+        log.info(f"跳过重复图片 {image_file.name}")
+        return None
+
+    new_img = Image.frombytes("RGBA", loaded["size"], loaded["data"])
+    origin_size = loaded["origin_size"]
+    file_size = image_file.stat().st_size
+
+    # 构建图片数据字典
+    img_data = {
+        "name": image_file_name,
+        "image": new_img,
+        "origin_size": origin_size,
+        "samed_img": [],  # 相同图片列表
+        "trim": loaded["trim"],  # 裁剪信息
+        "file_size": file_size,
+        "aspect_ratio": origin_size.w / origin_size.h if origin_size.h > 0 else 0,
+    }
+
+    # 更新哈希分组
+    hash_groups[hash_key] = {
+        "main": img_data,
+        "similar": img_data["samed_img"],
+    }
+
+    log.debug(
+        f"加载图片 {image_file.name} "
+        f"({origin_size.w}x{origin_size.h} → {new_img.width}x{new_img.height}) "
+        f"大小: {file_size:,} bytes"
+    )
+
+    return img_data
+
+
+def get_image_files(directory_path):
+    """获取目录中的所有图片文件，按文件名排序"""
+    return sorted(
+        f
+        for f in directory_path.glob("*.*")
+        if f.suffix.lower() in {".png", ".jpg", ".jpeg"}
+    )
+
+
+def probe_directory(image_files, hash_index, used_index):
+    """
+    获取目录中所有图片文件的索引记录
+
+    Returns:
+        list: [(图片文件路径, 索引记录), ...]，空文件的记录为None
+    """
+    probes = []
+    for image_file in image_files:
+        try:
+            probes.append(
+                (image_file, probe_image_file(image_file, hash_index, used_index))
+            )
+        except Exception as e:
+            log.error(f"读取图片 {image_file.name} 失败: {e}")
+
+    return probes
+
+
+def get_probe_pixels(probes):
+    """获取目录中所有图片的像素总数，用于估计生成图集的工作量"""
+    return sum(entry["width"] * entry["height"] for _, entry in probes if entry)
+
+
+def submit_directory(executor, probes):
+    """
+    提交单个目录中图片的加载任务
+
+    两级重复检测：先按图片尺寸分组，尺寸唯一的图片不可能重复；
+    同尺寸的图片按文件内容哈希合并，文件内容相同的只加载一次；
+    同尺寸下存在不同文件内容时，才计算像素哈希以发现内容编码不同的重复图片。
+    文件内容相同的图片像素哈希也相同，组内已有索引记录的哈希时直接复用，否则在加载时计算
+
+    Args:
+        executor: 进程池
+        probes: probe_directory返回的索引记录列表
+
+    Returns:
+        list: [(图片文件路径, 索引记录, 文件内容键, 是否使用像素哈希), ...]
+            及 {文件内容键: 加载任务}
+    """
+    contents_by_size = defaultdict(set)
+    known_hashes = {}
+    for _, entry in probes:
+        if entry:
+            contents_by_size[(entry["width"], entry["height"])].add(
+                (entry["size"], entry["crc"])
+            )
+            if entry["pixel_hash"] is not None:
+                content_key = (
+                    entry["width"],
+                    entry["height"],
+                    entry["size"],
+                    entry["crc"],
+                )
+                known_hashes.setdefault(content_key, entry["pixel_hash"])
+
+    loaded_files = []
+    content_futures = {}
+
+    for image_file, entry in probes:
+        if entry is None:
+            loaded_files.append((image_file, None, None, False))
+            continue
+
+        dimension = (entry["width"], entry["height"])
+        content_key = (*dimension, entry["size"], entry["crc"])
+        use_pixel_hash = len(contents_by_size[dimension]) > 1
+        if entry["pixel_hash"] is None:
+            entry["pixel_hash"] = known_hashes.get(content_key)
+        loaded_files.append((image_file, entry, content_key, use_pixel_hash))
+
+        if content_key not in content_futures:
+            need_hash = use_pixel_hash and content_key not in known_hashes
+            content_futures[content_key] = executor.submit(
+                load_image, image_file, need_hash, setting_var["trim_alpha_var"]
+            )
+
+    return loaded_files, content_futures
+
+
+def process_directory(loaded_files, content_futures, padding):
+    """
+    处理单个目录的图片
+
+    Args:
+        loaded_files: submit_directory返回的图片列表，按文件顺序排列
+        content_futures: 文件内容键到加载任务的映射
+        padding: 图片间距
+
+    Returns:
+        dict: 目录的图片数据和矩形数据，没有图片时返回None
+    """
+    hash_groups = {}  # 用于检测重复图片
+    images = []
+
+    # 按文件顺序合并加载结果，重复图片的判定与逐个处理时一致
+    for image_file, entry, content_key, use_pixel_hash in loaded_files:
+        log.info(f"📂 处理图片: {image_file.name}...")
+
+        if entry is None:
+            log.warning(f"跳过空文件: {image_file.name}")
+            continue
+
+        try:
+            loaded = content_futures[content_key].result()
+
+            if use_pixel_hash:
+                if entry["pixel_hash"] is None:
+                    entry["pixel_hash"] = loaded["hash"]
+                hash_key = entry["pixel_hash"]
+                if hash_key is None:
+                    raise ValueError("缺少像素哈希")
+            else:
+                hash_key = "-".join(map(str, content_key))
+
+            image_data = process_single_image(image_file, hash_key, loaded, hash_groups)
+            if image_data:
+                image_data["content_key"] = "-".join(map(str, content_key))
+                images.append(image_data)
+        except Exception as e:
+            log.error(f"处理图片 {image_file.name} 失败: {e}")
+            continue
+
+    if not images:
+        return None
+
+    # 每个文件内容只加载一次，按加载任务累计各阶段耗时
+    timings = defaultdict(float)
+    for future in content_futures.values():
+        if future.exception() is None:
+            for stage, seconds in future.result()["timings"].items():
+                timings[stage] += seconds
+
+    merged = {}
+    if setting_var["near_dedup_var"]:
+        images, merged = merge_similar_images(images)
+
+    return {
+        "images": images,
+        "rectangles": build_rectangles(images, padding),
+        "merged": merged,
+        "timings": dict(timings),
+    }
+
+
+def get_origin_box(img):
+    """获取裁剪后的图片在原始图片中的范围 (left, top, right, bottom)"""
+    trim = img["trim"]
+    origin_size = img["origin_size"]
+
+    return (
+        trim.left,
+        trim.top,
+        origin_size.w - trim.right,
+        origin_size.h - trim.bottom,
+    )
+
+
+def get_image_signature(pixels, origin_size, box):
+    """
+    计算图片的粗略签名：原始图片分成SIGNATURE_SIZE×SIGNATURE_SIZE块后各块的平均像素值
+
+    裁剪掉的透明区域按0计入，裁剪范围略有不同的图片签名也接近。
+    签名各值的平均差不会超过原图逐像素的平均差，签名相差过大的图片不可能近似
+
+    Args:
+        pixels: 裁剪后图片的预乘透明度RGBa像素数组
+        origin_size: 原始图片尺寸
+        box: 裁剪后的图片在原始图片中的范围
+
+    Returns:
+        numpy.ndarray: 一维签名数组
+    """
+    height, width, channels = pixels.shape
+
+    # 积分图，任意矩形区域的像素和只需四次查表
+    integral = np.zeros((height + 1, width + 1, channels), dtype=np.int64)
+    integral[1:, 1:] = pixels.cumsum(axis=0, dtype=np.int64).cumsum(axis=1)
+
+    rows = np.linspace(0, origin_size.h, SIGNATURE_SIZE + 1).astype(int)
+    cols = np.linspace(0, origin_size.w, SIGNATURE_SIZE + 1).astype(int)
+    # 原始图片中的分块边界换算到裁剪后的图片中
+    r = np.clip(rows - box[1], 0, height)
+    c = np.clip(cols - box[0], 0, width)
+
+    sums = (
+        integral[r[1:]][:, c[1:]]
+        - integral[r[:-1]][:, c[1:]]
+        - integral[r[1:]][:, c[:-1]]
+        + integral[r[:-1]][:, c[:-1]]
+    )
+    areas = np.maximum(np.outer(np.diff(rows), np.diff(cols)), 1)
+
+    return (sums / areas[..., None]).astype(np.float32).ravel()
+
+
+def get_coarse_signature(signature):
+    """将签名的相邻分块合并为COARSE_SIGNATURE_SIZE×COARSE_SIGNATURE_SIZE块"""
+    step = SIGNATURE_SIZE // COARSE_SIGNATURE_SIZE
+
+    return (
+        signature.reshape(COARSE_SIGNATURE_SIZE, step, COARSE_SIGNATURE_SIZE, step, 4)
+        .mean(axis=(1, 3))
+        .ravel()
+    )
+
+
+def is_similar_image(pixels, box, other_pixels, other_box):
+    """
+    判断两张原始尺寸相同的图片是否近似
+
+    两张图片按裁剪位置放回原始图片，在两者裁剪范围的并集内逐像素比较。
+    任一通道差值超过容差的像素视为不同，不同像素的比例不超过阈值时视为近似
+
+    Args:
+        pixels: 图片像素数组
+        box: 图片在原始图片中的范围
+        other_pixels: 另一张图片的像素数组
+        other_box: 另一张图片在原始图片中的范围
+
+    Returns:
+        bool: 是否近似
+    """
+    left, top = min(box[0], other_box[0]), min(box[1], other_box[1])
+    right, bottom = max(box[2], other_box[2]), max(box[3], other_box[3])
+
+    canvases = []
+    for image_pixels, (x1, y1, x2, y2) in ((pixels, box), (other_pixels, other_box)):
+        canvas = np.zeros((bottom - top, right - left, 4), dtype=np.int16)
+        canvas[y1 - top : y2 - top, x1 - left : x2 - left] = image_pixels
+        canvases.append(canvas)
+
+    delta = np.abs(canvases[0] - canvases[1]).max(axis=2)
+    changed = np.count_nonzero(delta > setting_var["near_dedup_tolerance_var"])
+
+    return changed <= delta.size * setting_var["near_dedup_ratio_var"]
+
+
+class SimilarImageGroup:
+    """
+    原始尺寸相同的保留图片，用于查找近似图片
+
+    签名平均差不超过上限时，相邻分块合并后的粗签名平均差、签名均值之差也不超过上限：
+    按签名均值排序后只需比较均值接近的保留图片，先用粗签名筛选，再比较完整签名。
+    签名和范围保存在按需扩容的数组中，一次比较所有候选
+    """
+
+    def __init__(self, origin_size, max_delta):
+        self.origin_area = max(origin_size.area(), 1)
+        self.max_delta = max_delta
+        self.images = []
+        self.pixels = []
+        self.signatures = np.empty(
+            (16, SIGNATURE_SIZE * SIGNATURE_SIZE * 4), dtype=np.float32
+        )
+        self.coarse_signatures = np.empty(
+            (16, COARSE_SIGNATURE_SIZE * COARSE_SIGNATURE_SIZE * 4), dtype=np.float32
+        )
+        self.boxes = np.empty((16, 4), dtype=np.int64)
+        self.means = []  # 签名均值，升序
+        self.order = []  # 与means对应的图片序号
+
+    def find(self, pixels, box, signature):
+        """查找与图片近似的保留图片，有多张时返回最先保留的，没有时返回None"""
+        mean = signature.mean()
+        low = bisect_left(self.means, mean - self.max_delta)
+        high = bisect_right(self.means, mean + self.max_delta)
+        if low == high:
+            return None
+
+        candidates = np.sort(np.array(self.order[low:high]))
+
+        # 并集外两张图片都透明，签名平均差的上限按并集占原始图片的比例缩小
+        boxes = self.boxes[candidates]
+        union_areas = (
+            np.maximum(boxes[:, 2], box[2]) - np.minimum(boxes[:, 0], box[0])
+        ) * (np.maximum(boxes[:, 3], box[3]) - np.minimum(boxes[:, 1], box[1]))
+        limits = self.max_delta * union_areas / self.origin_area
+
+        deltas = np.abs(
+            self.coarse_signatures[candidates] - get_coarse_signature(signature)
+        ).mean(axis=1)
+        close = deltas <= limits
+        candidates, limits = candidates[close], limits[close]
+
+        deltas = np.abs(self.signatures[candidates] - signature).mean(axis=1)
+
+        for index in candidates[deltas <= limits]:
+            if is_similar_image(pixels, box, self.pixels[index], self.boxes[index]):
+                return self.images[index]
+
+        return None
+
+    def add(self, img, pixels, box, signature):
+        """添加保留图片"""
+        index = len(self.images)
+        if index == len(self.signatures):
+            self.signatures = np.concatenate([self.signatures, self.signatures])
+            self.coarse_signatures = np.concatenate(
+                [self.coarse_signatures, self.coarse_signatures]
+            )
+            self.boxes = np.concatenate([self.boxes, self.boxes])
+
+        self.signatures[index] = signature
+        self.coarse_signatures[index] = get_coarse_signature(signature)
+        self.boxes[index] = box
+        self.images.append(img)
+        self.pixels.append(pixels)
+
+        mean = signature.mean()
+        position = bisect_right(self.means, mean)
+        self.means.insert(position, mean)
+        self.order.insert(position, index)
+
+
+def merge_similar_images(images):
+    """
+    合并近似图片
+
+    原始尺寸相同的图片才可能合并，裁剪范围可以不同：
+    抗锯齿边缘的细微差别会改变裁剪范围，比较时把图片放回原始图片的位置。
+    先用粗略签名筛选，只对签名接近的逐像素比较。
+    合并的图片及其别名并入保留图片的samed_img
+
+    Args:
+        images: 目录的图片数据列表
+
+    Returns:
+        tuple: (保留的图片数据列表, {保留的图片名称: [合并的图片名称, ...]})
+    """
+    # 近似图片签名平均差的上限
+    max_signature_delta = (
+        setting_var["near_dedup_tolerance_var"]
+        + 255 * setting_var["near_dedup_ratio_var"]
+    )
+
+    kept = []
+    merged = defaultdict(list)
+    groups = {}  # (原始宽, 原始高) -> SimilarImageGroup
+
+    for img in images:
+        origin_size = img["origin_size"]
+        group = groups.get((origin_size.w, origin_size.h))
+        if group is None:
+            group = groups[(origin_size.w, origin_size.h)] = SimilarImageGroup(
+                origin_size, max_signature_delta
+            )
+
+        pixels = np.asarray(img["image"].convert("RGBa"))
+        box = get_origin_box(img)
+        signature = get_image_signature(pixels, origin_size, box)
+        main_img = group.find(pixels, box, signature)
+
+        if main_img:
+            main_img["samed_img"].append(img["name"])
+            main_img["samed_img"].extend(img["samed_img"])
+            merged[main_img["name"]].append(img["name"])
+            img["image"].close()
+        else:
+            group.add(img, pixels, box, signature)
+            kept.append(img)
+
+    return kept, dict(merged)
+
+
+def save_near_dedup_report(merged_by_dir, directories):
+    """
+    保存近似图片合并报告
+
+    本次生成的目录覆盖原有记录，跳过的目录保留上次的记录
+
+    Args:
+        merged_by_dir: {目录名: {保留的图片名称: [合并的图片名称, ...]}}
+        directories: 输入目录中的所有目录名
+    """
+    report = load_output_json(NEAR_DEDUP_REPORT_FILE)
+    report = {name: merged for name, merged in report.items() if name in directories}
+
+    for dir_name, merged in merged_by_dir.items():
+        count = sum(map(len, merged.values()))
+        if count:
+            log.info(f"🧩 {dir_name} 合并了 {count} 张近似图片")
+            report[dir_name] = merged
+        else:
+            report.pop(dir_name, None)
+
+    save_output_json(NEAR_DEDUP_REPORT_FILE, report)
+
+
+def build_rectangles(images, padding):
+    """
+    根据图片数据生成待排列的矩形列表
+
+    Args:
+        images: 图片数据列表
+        padding: 图片间距
+
+    Returns:
+        list: [(图片序号, 图片名称, 含间距的尺寸), ...]，已按排列顺序排序
+    """
+    # 输出其他分辨率时，矩形尺寸取整到各缩放比例都能整除的步长
+    grid = get_variant_grid()
+
+    # 准备矩形数据（使用生成器表达式）
+    rectangles = [
+        (
+            i,
+            img["name"],
+            Size(
+                math.ceil((img["image"].width + padding) / grid) * grid,
+                math.ceil((img["image"].height + padding) / grid) * grid,
+            ),
+        )
+        for i, img in enumerate(images)
+    ]
+
+    # 使用更高效的排序；允许旋转时按长边排序，朝向由排列算法决定
+    if setting_var["allow_rotation_var"]:
+        rectangles.sort(
+            key=lambda r: (max(r[2].w, r[2].h), min(r[2].w, r[2].h)), reverse=True
+        )
+    else:
+        rectangles.sort(key=lambda r: r[2].w, reverse=True)
+
+    return rectangles
+
+
+def extract_common_images(input_subdir, padding):
+    """
+    跨目录去重
+
+    多个目录中文件内容相同的图片移入公共图集，只排列一次；
+    原目录的Lua数据通过a_name引用公共图集中的位置，名称和别名保持不变
+
+    Args:
+        input_subdir: 按子目录组织的图片数据字典
+        padding: 图片间距
+
+    Returns:
+        dict: 公共图集在最前的新图片数据字典，没有跨目录重复时原样返回
+    """
+    common_name = setting_var["common_atlas_var"]
+    if common_name in input_subdir:
+        log.warning(f"已存在名为 {common_name} 的目录，跳过跨目录去重")
+        return input_subdir
+
+    owners = defaultdict(list)  # 文件内容键 -> [(目录名, 图片数据), ...]
+    for dir_name, subdir in input_subdir.items():
+        for img in subdir["images"]:
+            owners[img["content_key"]].append((dir_name, img))
+
+    common_images = []
+    common_names = set()
+    shared_ids = set()
+    references = defaultdict(list)  # 目录名 -> [(名称, 别名, 公共图片数据), ...]
+
+    for items in owners.values():
+        if len(items) < 2:
+            continue
+
+        main_img = items[0][1]
+
+        # 公共图集中的名称不能重复
+        name = main_img["name"]
+        suffix = len(common_images)
+        while name in common_names:
+            name = f"{main_img['name']}_{suffix}"
+            suffix += 1
+        common_names.add(name)
+        common_img = {**main_img, "name": name, "samed_img": []}
+        common_images.append(common_img)
+
+        for dir_name, img in items:
+            references[dir_name].append((img["name"], img["samed_img"], common_img))
+            shared_ids.add(id(img))
+
+    if not common_images:
+        return input_subdir
+
+    log.info(
+        f"🔗 {len(common_images)} 张图片在多个目录中重复，移入公共图集 {common_name}"
+    )
+
+    result = {
+        common_name: {
+            "images": common_images,
+            "rectangles": build_rectangles(common_images, padding),
+            "shared": True,
+        }
+    }
+
+    for dir_name, subdir in input_subdir.items():
+        images = [img for img in subdir["images"] if id(img) not in shared_ids]
+        subdir["images"] = images
+        subdir["rectangles"] = build_rectangles(images, padding)
+        subdir["references"] = references[dir_name]
+        result[dir_name] = subdir
+
+    return result
+
+
+def resolve_references(subdir, scale=None):
+    """
+    获取目录引用的公共图集图片，公共图集总是最先生成
+
+    Args:
+        subdir: 目录的图片数据
+        scale: 图集变体的缩放比例，None为全分辨率
+
+    Returns:
+        list: [(图片数据, 所在图集的打包结果), ...]，图片数据使用本目录中的名称和别名
+    """
+    references = []
+
+    for name, samed_img, common_img in subdir.get("references", ()):
+        if scale:
+            common_img = common_img["variants"][scale]
+        img = {**common_img, "name": name, "samed_img": samed_img}
+        references.append((img, common_img["result"]))
+
+    return references
+
+
+def iter_input_subdir(manifest, max_workers, largest_first=False):
+    """
+    逐个目录加载输入图片并进行处理
+
+    图片提交到进程池逐张解码、裁剪，单个大目录也能用满所有核心。
+    最多预读prefetch_dirs个目录，调用方生成当前目录的图集时后续目录在后台解码，
+    内存占用只与最大的几个目录有关，与目录总数无关。
+    跨目录去重需要所有目录的图片，开启时先加载全部目录再依次返回。
+    开启增量生成时，输入文件和生成参数都未变化的目录直接复用上次的输出，不再加载
+
+    Args:
+        manifest: 构建清单，目录名 -> 上次构建的指纹和输出
+        max_workers: 加载图片的进程数
+        largest_first: 按像素总数从多到少加载目录，否则按目录名顺序
+
+    Yields:
+        tuple: (目录名, 目录的图片数据)，跳过的目录图片数据为None
+    """
+    padding = setting_var["padding_var"]
+    global_dedup = setting_var["global_dedup_var"]
+    hash_index = load_output_json(HASH_INDEX_FILE)
+    used_index = {}
+    merged_by_dir = {}
+    collected = {}
+
+    # 跨目录去重时各目录的输出互相关联，不能单独跳过
+    incremental = setting_var["incremental_var"] and not global_dedup
+
+    directories = sorted(item for item in config.input_path.iterdir() if item.is_dir())
+    prefetch = len(directories) if global_dedup else max(1, setting_var["prefetch_var"])
+
+    # 已删除的目录不再留在构建清单中
+    for dir_name in set(manifest) - {directory.name for directory in directories}:
+        del manifest[dir_name]
+
+    # 1. 读取所有目录的图片文件头，跳过未变化的目录
+    probed = []  # [(目录名, 构建指纹, 索引记录), ...]
+    for directory in directories:
+        probes = probe_directory(get_image_files(directory), hash_index, used_index)
+        fingerprint = get_build_fingerprint(probes)
+
+        if incremental and is_build_current(manifest.get(directory.name), fingerprint):
+            log.info(f"⏭️ {directory.name} 输入和参数未变化，跳过生成")
+            yield directory.name, None
+        else:
+            probed.append((directory.name, fingerprint, probes))
+
+    # 并行生成时最大的图集最先开始，避免最后只剩一个大图集在排列
+    if largest_first:
+        probed.sort(key=lambda item: get_probe_pixels(item[2]), reverse=True)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()  # 已提交加载任务的目录：(目录名, 构建指纹, 加载任务)
+
+        for position, (dir_name, fingerprint, probes) in enumerate(probed, 1):
+            # 2. 提交目录的加载任务
+            pending.append((dir_name, fingerprint, submit_directory(executor, probes)))
+
+            # 3. 预读的目录超过上限或已提交所有目录时，按顺序收集最早提交的目录
+            while pending and (len(pending) > prefetch or position == len(probed)):
+                dir_name, fingerprint, loaded = pending.popleft()
+                result = process_directory(*loaded, padding)
+                if not result:
+                    continue
+
+                result["fingerprint"] = fingerprint
+                merged_by_dir[dir_name] = result.pop("merged")
+
+                if global_dedup:
+                    collected[dir_name] = result
+                else:
+                    yield dir_name, result
+
+    # 只保留本次用到的记录，已删除的文件不再留在索引中
+    save_output_json(HASH_INDEX_FILE, used_index)
+
+    if setting_var["near_dedup_var"]:
+        save_near_dedup_report(
+            merged_by_dir, {directory.name for directory in directories}
+        )
+
+    if global_dedup:
+        yield from extract_common_images(collected, padding).items()
+
+
+def calculate_score(rect, strategy):
+    """
+    计算矩形区域的分数，用于选择最佳放置位置
+
+    Args:
+        rect: 待评估的矩形区域
+        strategy: 评分策略，可选MIN_AREA、SHOR_TSIDE、MAX_AREA
+
+    Returns:
+        float: 分数值，分数越小表示越优先选择
+    """
+    if strategy == MIN_AREA:
+        return rect.area()  # 使用面积作为评分
+    elif strategy == SHOR_TSIDE:
+        return min(rect.w, rect.h)  # 使用短边长度作为评分
+    elif strategy == MAX_AREA:
+        return -rect.area()  # 使用面积作为评分
+
+    return 0
+
+
+def align_to_4(value):
+    """向上对齐到4的倍数"""
+    return (value + 3) // 4 * 4
+
+
+def get_layout_extent(result, border):
+    """获取排列结果占用的范围（含边框），不小于该范围的图集都能使用同样的排列"""
+    return Size(
+        max(rect.x + rect.w for _, _, rect in result) + border,
+        max(rect.y + rect.h for _, _, rect in result) + border,
+    )
+
+
+def calculate_optimal_size(rectangles, algorithm=None, rule=None):
+    """
+    计算最优的图集尺寸
+
+    通过尝试不同尺寸，找到能放下全部矩形且面积最小的图集尺寸。
+    宽或高之一取2的幂，另一边在4的倍数中二分查找能放下全部矩形的最小值，
+    因此会得到2048×1024、1024×1320这类非正方形尺寸。
+    长短边之比优先限制在MAX_ATLAS_ASPECT_RATIO以内，限制内放不下时才放开；
+    面积不可能小于当前最佳的尺寸不再尝试，已有排列结果能放下时直接复用
+
+    Args:
+        rectangles: 矩形数据列表
+        algorithm: 排列算法
+        rule: 评分规则
+
+    Returns:
+        tuple: (最佳尺寸, 排列结果列表)，最大尺寸也放不下全部矩形时返回None
+    """
+    max_size = setting_var["max_size_var"]
+    border = setting_var["border_var"]
+
+    total_area = sum(rect[2].area() for rect in rectangles)
+    if setting_var["allow_rotation_var"]:
+        # 允许旋转时每个矩形只要求短边能放下
+        min_w = min_h = max(min(rect[2].w, rect[2].h) for rect in rectangles) + border
+    else:
+        min_w = max(rect[2].w for rect in rectangles) + border
+        min_h = max(rect[2].h for rect in rectangles) + border
+
+    if min_w > max_size or min_h > max_size:
+        return None
+
+    layouts = []  # 已得到的完整排列结果及其占用范围
+
+    def try_size(atlas_size):
+        for extent, result in layouts:
+            if extent.w <= atlas_size.w and extent.h <= atlas_size.h:
+                return result
+
+        result = pack_rectangles(rectangles, atlas_size, algorithm, rule)
+        if len(result) != len(rectangles):
+            return None
+
+        layouts.append((get_layout_extent(result, border), result))
+        return result
+
+    # 2的幂边长，从接近总面积平方根的开始尝试，尽早得到较小的可行面积以便剪枝
+    powers = [1 << i for i in range(2, max_size.bit_length()) if 1 << i < max_size]
+    powers.append(max_size)
+    sqrt_area = total_area**0.5
+    powers.sort(key=lambda side: abs(side - sqrt_area))
+
+    best = None
+    best_key = None
+
+    for max_ratio in (MAX_ATLAS_ASPECT_RATIO, None):
+        for fixed in powers:
+            for transpose in (False, True):
+                min_fixed, min_other = (min_h, min_w) if transpose else (min_w, min_h)
+                if fixed < min_fixed:
+                    continue
+
+                def make_size(other):
+                    return Size(other, fixed) if transpose else Size(fixed, other)
+
+                # 另一边的取值范围：能容纳总面积，比例不超过限制，面积不大于当前最佳
+                lo = align_to_4(max(min_other, -(-total_area // fixed)))
+                hi = max_size
+                if max_ratio:
+                    lo = max(lo, align_to_4(-(-fixed // max_ratio)))
+                    hi = min(hi, fixed * max_ratio)
+                if best_key:
+                    hi = min(hi, best_key[0] // fixed)
+                if lo > hi:
+                    continue
+
+                # 另一边的候选值为lo起的4的倍数，最后一个为hi
+                count = (hi - lo + 3) // 4 + 1
+                found_size = make_size(hi)
+                found = try_size(found_size)
+                if found is None:
+                    continue
+
+                low, high = 0, count - 1
+                while low < high:
+                    mid = (low + high) // 2
+                    atlas_size = make_size(min(lo + mid * 4, hi))
+
+                    result = try_size(atlas_size)
+                    if result is None:
+                        low = mid + 1
+                    else:
+                        high = mid
+                        found, found_size = result, atlas_size
+
+                key = (found_size.area(), max(found_size.w, found_size.h))
+                if best_key is None or key < best_key:
+                    best, best_key = (found_size, found), key
+
+        if best:
+            break
+
+    return best
+
+
+class FreeRectIndex:
+    """
+    Guillotine空闲矩形索引
+
+    空闲矩形按宽、高的二进制位数分桶，桶内按(分数, x, 次序)排序，分数由评分策略计算。
+    查找时只检查宽高都不小于目标等级的桶：宽高等级都更大的桶中任意矩形都能容纳，
+    直接取桶内分数最小者；只有等级相同的边界桶需要逐个检查，无需遍历全部空闲矩形。
+
+    次序记录矩形在空闲列表中的先后：同一x坐标下次序越小越靠前，
+    因此按(x, 次序)排列即得到与原空闲列表相同的顺序，分数相同时据此取最靠前者。
+
+    同时按四条边记录矩形，用于合并时直接查找可合并的相邻矩形；
+    上次合并后新加入的矩形记录在dirty中，合并只需从这些矩形出发。
+    """
+
+    def __init__(self, free_rect, strategy=MIN_AREA):
+        self.strategy = strategy
+        self.buckets = {}  # (宽等级, 高等级) -> [(分数, x, 次序, 矩形), ...]
+        self.ranks = {}  # id(矩形) -> 次序
+        self.rank_range = {}  # x -> [最小次序, 最大次序]
+
+        # 边 -> 矩形，空闲矩形互不重叠，同一条边只属于一个矩形
+        self.left_edges = {}  # (x, y, h)
+        self.right_edges = {}  # (x + w, y, h)
+        self.top_edges = {}  # (y, x, w)
+        self.bottom_edges = {}  # (y + h, x, w)
+
+        self.dirty = []  # 上次合并后新加入的矩形
+
+        self.add_last(free_rect)
+
+    def __contains__(self, rect):
+        return id(rect) in self.ranks
+
+    def order_key(self, rect):
+        """矩形在空闲列表中的排序键"""
+        return (rect.x, self.ranks[id(rect)])
+
+    def score_key(self, rect):
+        """矩形在查找时的比较键，越小越优先"""
+        return (calculate_score(rect, self.strategy), *self.order_key(rect))
+
+    def add(self, rect, rank):
+        """以指定次序添加矩形"""
+        self.ranks[id(rect)] = rank
+
+        bucket_key = (rect.w.bit_length(), rect.h.bit_length())
+        bucket = self.buckets.get(bucket_key)
+        if bucket is None:
+            bucket = self.buckets[bucket_key] = []
+        insort(bucket, (calculate_score(rect, self.strategy), rect.x, rank, rect))
+
+        self.left_edges[(rect.x, rect.y, rect.h)] = rect
+        self.right_edges[(rect.x + rect.w, rect.y, rect.h)] = rect
+        self.top_edges[(rect.y, rect.x, rect.w)] = rect
+        self.bottom_edges[(rect.y + rect.h, rect.x, rect.w)] = rect
+
+        rank_range = self.rank_range.get(rect.x)
+        if rank_range is None:
+            self.rank_range[rect.x] = [rank, rank]
+        elif rank < rank_range[0]:
+            rank_range[0] = rank
+        elif rank > rank_range[1]:
+            rank_range[1] = rank
+
+        self.dirty.append(rect)
+
+    def add_first(self, rect):
+        """添加到同一x坐标的所有矩形之前"""
+        rank_range = self.rank_range.get(rect.x)
+        self.add(rect, rank_range[0] - 1 if rank_range else 0)
+
+    def add_last(self, rect):
+        """添加到同一x坐标的所有矩形之后"""
+        rank_range = self.rank_range.get(rect.x)
+        self.add(rect, rank_range[1] + 1 if rank_range else 0)
+
+    def remove(self, rect):
+        """
+        移除矩形
+
+        Returns:
+            int: 被移除矩形的次序
+        """
+        rank = self.ranks.pop(id(rect))
+
+        bucket_key = (rect.w.bit_length(), rect.h.bit_length())
+        bucket = self.buckets[bucket_key]
+        score = calculate_score(rect, self.strategy)
+        del bucket[bisect_left(bucket, (score, rect.x, rank))]
+        if not bucket:
+            del self.buckets[bucket_key]
+
+        del self.left_edges[(rect.x, rect.y, rect.h)]
+        del self.right_edges[(rect.x + rect.w, rect.y, rect.h)]
+        del self.top_edges[(rect.y, rect.x, rect.w)]
+        del self.bottom_edges[(rect.y + rect.h, rect.x, rect.w)]
+
+        return rank
+
+    def take_dirty(self):
+        """取出上次合并后新加入且仍然存在的矩形"""
+        dirty = [rect for rect in self.dirty if rect in self]
+        self.dirty = []
+        return dirty
+
+    def neighbors(self, rect):
+        """
+        查找能与矩形合并的相邻空闲矩形
+
+        Returns:
+            list: 右、左、下、上四个方向上边长相同且紧邻的矩形
+        """
+        neighbors = (
+            self.left_edges.get((rect.x + rect.w, rect.y, rect.h)),
+            self.right_edges.get((rect.x, rect.y, rect.h)),
+            self.top_edges.get((rect.y + rect.h, rect.x, rect.w)),
+            self.bottom_edges.get((rect.y, rect.x, rect.w)),
+        )
+        return [neighbor for neighbor in neighbors if neighbor is not None]
+
+    def replace(self, old_rect, new_rect):
+        """
+        用新矩形占据旧矩形在列表中的位置
+
+        x坐标不变时沿用旧次序，否则新矩形排在其x坐标的最前面
+        （旧位置之后不存在x更小的矩形）
+        """
+        rank = self.remove(old_rect)
+
+        if new_rect.x == old_rect.x:
+            self.add(new_rect, rank)
+        else:
+            self.add_first(new_rect)
+
+    def fit_score_range(self, rect):
+        """
+        能容纳指定尺寸的空闲矩形的分数范围
+
+        Returns:
+            tuple: (二分查找的起始键, 分数上限)
+        """
+        if self.strategy == SHOR_TSIDE:
+            return (min(rect.w, rect.h),), float("inf")
+        elif self.strategy == MAX_AREA:
+            return (), -rect.area()
+
+        return (rect.area(),), float("inf")
+
+    def find(self, rect):
+        """
+        查找能容纳指定尺寸且分数最小的空闲矩形
+
+        Args:
+            rect: 待放置矩形的尺寸
+
+        Returns:
+            Rectangle: 分数最小的空闲矩形，分数相同时取列表中最靠前者；没有则返回None
+        """
+        w_level = rect.w.bit_length()
+        h_level = rect.h.bit_length()
+        start_key, max_score = self.fit_score_range(rect)
+        best = None
+
+        for (bucket_w_level, bucket_h_level), bucket in self.buckets.items():
+            if bucket_w_level < w_level or bucket_h_level < h_level:
+                continue
+
+            # 桶内最小分数也不优于当前最佳，跳过
+            if best is not None and bucket[0] > best:
+                continue
+
+            if bucket_w_level > w_level and bucket_h_level > h_level:
+                # 宽高等级都更大，桶内任意矩形都能容纳
+                best = bucket[0]
+                continue
+
+            # 边界桶：从可能容纳的最小分数开始检查，第一个能容纳的即为桶内最优
+            for i in range(bisect_left(bucket, start_key), len(bucket)):
+                entry = bucket[i]
+                if entry[0] > max_score or (best is not None and entry > best):
+                    break
+
+                free_rect = entry[3]
+                if free_rect.w >= rect.w and free_rect.h >= rect.h:
+                    best = entry
+                    break
+
+        return best[3] if best else None
+
+
+def find_position(free_index, rect, allow_rotation=False):
+    """
+    在空闲区域中寻找最佳放置位置（使用索引的评分策略）
+
+    允许旋转时同时尝试旋转90°后的尺寸，旋转后的空闲区域更优时使用旋转后的尺寸
+
+    Args:
+        free_index: 空闲区域索引
+        rect: 待放置矩形的尺寸
+        allow_rotation: 是否允许旋转
+
+    Returns:
+        tuple: (最佳矩形, 所在空闲区域) 或 None
+    """
+    in_free_rect = free_index.find(rect)
+
+    if allow_rotation and rect.w != rect.h:
+        rotated = Size(rect.h, rect.w)
+        rotated_free_rect = free_index.find(rotated)
+
+        if rotated_free_rect and (
+            not in_free_rect
+            or free_index.score_key(rotated_free_rect)
+            < free_index.score_key(in_free_rect)
+        ):
+            in_free_rect, rect = rotated_free_rect, rotated
+
+    if in_free_rect:
+        best_rect = Rectangle(in_free_rect.x, in_free_rect.y, rect.w, rect.h)
+        return best_rect, in_free_rect
+
+    return None
+
+
+def split_free_rectangle(free_index, free_rect, used_rect):
+    """
+    将空闲区域分割为剩余空间
+
+    当在一个空闲区域中放置矩形后，将剩余空间分割为右侧和下方的两个新空闲区域
+
+    Args:
+        free_index: 空闲区域索引
+        free_rect: 被使用的空闲区域
+        used_rect: 已放置的矩形区域
+    """
+    new_rects = []
+
+    # 空图片不占用空间，不分割空闲区域
+    if not used_rect.area():
+        return
+
+    # 检查右侧是否还有剩余空间
+    if used_rect.x + used_rect.w != free_rect.x + free_rect.w:
+        new_rects.append(
+            Rectangle(
+                used_rect.x + used_rect.w,
+                free_rect.y,
+                free_rect.x + free_rect.w - (used_rect.x + used_rect.w),
+                free_rect.h,
+            )
+        )
+
+    # 检查下方是否还有剩余空间
+    if used_rect.y + used_rect.h != free_rect.y + free_rect.h:
+        new_rects.append(
+            Rectangle(
+                used_rect.x,
+                used_rect.y + used_rect.h,
+                used_rect.w,
+                free_rect.y + free_rect.h - (used_rect.y + used_rect.h),
+            )
+        )
+
+    if not new_rects:
+        # 空间完全被使用，直接移除，不再保留空矩形占位
+        free_index.remove(free_rect)
+        return
+
+    # 第一个新矩形占据原空闲区域的位置，其余追加到末尾
+    free_index.replace(free_rect, new_rects[0])
+    for new_rect in new_rects[1:]:
+        free_index.add_last(new_rect)
+
+
+def try_merge_rectangles(rect1, rect2):
+    """
+    尝试合并两个相邻的矩形
+
+    支持水平合并（左右相邻）和垂直合并（上下相邻）
+
+    Args:
+        rect1: 第一个矩形
+        rect2: 第二个矩形
+
+    Returns:
+        Rectangle: 合并后的矩形，如果无法合并则返回None
+    """
+    # 水平合并：Y坐标和高度相同，且rect1右侧紧邻rect2左侧
+    if rect1.y == rect2.y and rect1.h == rect2.h:
+        if rect1.x + rect1.w == rect2.x:
+            return Rectangle(rect1.x, rect1.y, rect1.w + rect2.w, rect1.h)
+
+        if rect2.x + rect2.w == rect1.x:
+            return Rectangle(rect2.x, rect2.y, rect1.w + rect2.w, rect1.h)
+
+    # 垂直合并：X坐标和宽度相同，且rect1下方紧邻rect2上方
+    if rect1.x == rect2.x and rect1.w == rect2.w:
+        if rect1.y + rect1.h == rect2.y:
+            return Rectangle(rect1.x, rect1.y, rect1.w, rect1.h + rect2.h)
+
+        if rect2.y + rect2.h == rect1.y:
+            return Rectangle(rect2.x, rect2.y, rect1.w, rect1.h + rect2.h)
+
+    return None
+
+
+def merge_single_free_rect(free_index, free_rect):
+    """
+    从一个空闲矩形出发，反复与相邻矩形合并
+
+    每次选择空闲列表中最靠前的可合并矩形；左侧矩形比当前矩形宽时不参与合并
+
+    Args:
+        free_index: 空闲区域索引
+        free_rect: 合并起点
+
+    Returns:
+        Rectangle: 合并后的矩形，无法合并时返回None
+    """
+    merged_rect = None
+    current_rect = free_rect
+
+    while True:
+        candidates = [
+            other_free_rect
+            for other_free_rect in free_index.neighbors(current_rect)
+            if other_free_rect.x >= current_rect.x - current_rect.w
+        ]
+
+        if not candidates:
+            break
+
+        other_free_rect = min(candidates, key=free_index.order_key)
+        free_index.remove(other_free_rect)
+
+        current_rect = merged_rect = try_merge_rectangles(current_rect, other_free_rect)
+
+    return merged_rect
+
+
+def merge_free_rectangles(free_index):
+    """
+    合并相邻的空闲矩形
+
+    上次合并后留下的矩形两两之间无法合并，因此只需从新加入的矩形
+    及与其相邻的矩形出发，按空闲列表顺序依次合并
+
+    Args:
+        free_index: 空闲区域索引
+    """
+    # 收集合并起点
+    start_rects = {}
+    for rect in free_index.take_dirty():
+        start_rects[id(rect)] = rect
+        for neighbor in free_index.neighbors(rect):
+            start_rects[id(neighbor)] = neighbor
+
+    merged = []
+
+    for free_rect in sorted(start_rects.values(), key=free_index.order_key):
+        # 已被之前的合并吸收
+        if free_rect not in free_index:
+            continue
+
+        merged_rect = merge_single_free_rect(free_index, free_rect)
+
+        if merged_rect:
+            merged.append((free_index.remove(free_rect), merged_rect))
+
+    # 合并结果占据合并起点的位置，本轮结束后才参与下一次合并
+    for rank, merged_rect in merged:
+        free_index.add(merged_rect, rank)
+
+
+def guillotine_packing(rectangles, atlas_size, strategy=MIN_AREA):
+    """
+    使用Guillotine算法在指定尺寸的画布上排列矩形
+
+    Args:
+        rectangles: 待排列的矩形列表，格式为[(id, width, height), ...]
+        atlas_size: 画布尺寸
+        strategy: 选择空闲区域的评分策略
+
+    Returns:
+        list: 排列结果列表，格式为[(rect_id, Rectangle), ...]，
+            矩形宽高与输入相反时表示旋转了90°
+    """
+    border = setting_var["border_var"]
+    allow_rotation = setting_var["allow_rotation_var"]
+    result_rectangles = []
+    # 初始化空闲区域为整个画布（考虑边框）
+    free_index = FreeRectIndex(
+        Rectangle(border, border, atlas_size.w - border, atlas_size.h - border),
+        strategy,
+    )
+
+    # 遍历所有矩形进行排列
+    for rect_id, rect_name, rect in rectangles:
+        check_deadline()
+
+        # 寻找最佳放置位置
+        rect_data = find_position(free_index, rect, allow_rotation)
+
+        if not rect_data:
+            continue
+
+        used_rect, in_free_rect = rect_data
+
+        split_free_rectangle(free_index, in_free_rect, used_rect)
+        merge_free_rectangles(free_index)
+
+        result_rectangles.append((rect_id, rect_name, used_rect))
+
+    return result_rectangles
+
+
+def maxrects_score(free_rect, rect, rule):
+    """
+    计算MaxRects算法中矩形放入空闲区域的分数
+
+    Args:
+        free_rect: 空闲区域
+        rect: 待放置矩形的尺寸
+        rule: 放置规则
+
+    Returns:
+        tuple: 分数元组，越小表示越优先选择
+    """
+    leftover_w = free_rect.w - rect.w
+    leftover_h = free_rect.h - rect.h
+    short_side = min(leftover_w, leftover_h)
+    long_side = max(leftover_w, leftover_h)
+
+    if rule == BEST_AREA:
+        # 剩余面积最小，短边剩余作为次要条件
+        return (free_rect.area() - rect.area(), short_side)
+    elif rule == BOTTOM_LEFT:
+        # 放置后的底边最靠上，其次最靠左
+        return (free_rect.y + rect.h, free_rect.x)
+
+    # 默认使用最短边剩余最小
+    return (short_side, long_side)
+
+
+def maxrects_find_position(free_rectangles, rect, rule, allow_rotation=False):
+    """
+    在MaxRects空闲区域中寻找最佳放置位置
+
+    Args:
+        free_rectangles: 当前空闲区域列表
+        rect: 待放置矩形的尺寸
+        rule: 放置规则
+        allow_rotation: 是否同时尝试旋转90°后的尺寸，分数相同时不旋转
+
+    Returns:
+        Rectangle: 最佳放置位置，无法放置时返回None
+    """
+    best_score = None
+    best_rect = None
+
+    sizes = [rect]
+    if allow_rotation and rect.w != rect.h:
+        sizes.append(Size(rect.h, rect.w))
+
+    for free_rect in free_rectangles:
+        for size in sizes:
+            if free_rect.w < size.w or free_rect.h < size.h:
+                continue
+
+            score = maxrects_score(free_rect, size, rule)
+
+            if best_score is None or score < best_score:
+                best_score = score
+                best_rect = Rectangle(free_rect.x, free_rect.y, size.w, size.h)
+
+    return best_rect
+
+
+def maxrects_split_free_rectangle(free_rect, used_rect):
+    """
+    计算空闲区域被占用后剩余的最大矩形
+
+    与Guillotine不同，剩余空间的四个方向各生成一个最大矩形，彼此允许重叠
+
+    Args:
+        free_rect: 空闲区域
+        used_rect: 已放置的矩形区域
+
+    Returns:
+        list: 剩余的空闲矩形列表，两者不相交时返回None
+    """
+    free_right = free_rect.x + free_rect.w
+    free_bottom = free_rect.y + free_rect.h
+    used_right = used_rect.x + used_rect.w
+    used_bottom = used_rect.y + used_rect.h
+
+    # 不相交则无需分割
+    if (
+        used_rect.x >= free_right
+        or used_right <= free_rect.x
+        or used_rect.y >= free_bottom
+        or used_bottom <= free_rect.y
+    ):
+        return None
+
+    new_rects = []
+
+    # 上方剩余空间
+    if used_rect.y > free_rect.y:
+        new_rects.append(
+            Rectangle(free_rect.x, free_rect.y, free_rect.w, used_rect.y - free_rect.y)
+        )
+
+    # 下方剩余空间
+    if used_bottom < free_bottom:
+        new_rects.append(
+            Rectangle(free_rect.x, used_bottom, free_rect.w, free_bottom - used_bottom)
+        )
+
+    # 左侧剩余空间
+    if used_rect.x > free_rect.x:
+        new_rects.append(
+            Rectangle(free_rect.x, free_rect.y, used_rect.x - free_rect.x, free_rect.h)
+        )
+
+    # 右侧剩余空间
+    if used_right < free_right:
+        new_rects.append(
+            Rectangle(used_right, free_rect.y, free_right - used_right, free_rect.h)
+        )
+
+    return new_rects
+
+
+def is_contained_in(rect1, rect2):
+    """判断rect1是否完全位于rect2内部"""
+    return (
+        rect1.x >= rect2.x
+        and rect1.y >= rect2.y
+        and rect1.x + rect1.w <= rect2.x + rect2.w
+        and rect1.y + rect1.h <= rect2.y + rect2.h
+    )
+
+
+def maxrects_place_rectangle(free_rectangles, used_rect):
+    """
+    放置矩形并更新MaxRects空闲区域列表
+
+    Args:
+        free_rectangles: 当前空闲区域列表
+        used_rect: 已放置的矩形区域
+
+    Returns:
+        list: 更新后的空闲区域列表
+    """
+    kept_rects = []
+    new_rects = []
+
+    for free_rect in free_rectangles:
+        split_rects = maxrects_split_free_rectangle(free_rect, used_rect)
+
+        if split_rects is None:
+            kept_rects.append(free_rect)
+        else:
+            new_rects.extend(split_rects)
+
+    # 剔除被其他空闲矩形包含的新矩形（原有矩形之间互不包含，无需再检查）
+    pruned_new_rects = []
+    for i, new_rect in enumerate(new_rects):
+        contained = any(
+            is_contained_in(new_rect, other)
+            and (not is_contained_in(other, new_rect) or j < i)
+            for j, other in enumerate(new_rects)
+            if j != i
+        ) or any(is_contained_in(new_rect, kept) for kept in kept_rects)
+
+        if not contained:
+            pruned_new_rects.append(new_rect)
+
+    # 剔除被新矩形包含的原有矩形
+    kept_rects = [
+        kept
+        for kept in kept_rects
+        if not any(is_contained_in(kept, new_rect) for new_rect in pruned_new_rects)
+    ]
+
+    return kept_rects + pruned_new_rects
+
+
+def maxrects_packing(rectangles, atlas_size, rule=BEST_SHORT_SIDE):
+    """
+    使用MaxRects算法在指定尺寸的画布上排列矩形
+
+    每次放置后保留所有最大空闲矩形，空间利用率通常高于Guillotine
+
+    Args:
+        rectangles: 待排列的矩形列表，格式为[(id, name, Size), ...]
+        atlas_size: 画布尺寸
+        rule: 放置规则，可选BEST_SHORT_SIDE、BEST_AREA、BOTTOM_LEFT
+
+    Returns:
+        list: 排列结果列表，格式为[(rect_id, rect_name, Rectangle), ...]，
+            矩形宽高与输入相反时表示旋转了90°
+    """
+    border = setting_var["border_var"]
+    allow_rotation = setting_var["allow_rotation_var"]
+    result_rectangles = []
+    # 初始化空闲区域为整个画布（考虑边框）
+    free_rectangles = [
+        Rectangle(border, border, atlas_size.w - border, atlas_size.h - border)
+    ]
+
+    for rect_id, rect_name, rect in rectangles:
+        check_deadline()
+
+        used_rect = maxrects_find_position(free_rectangles, rect, rule, allow_rotation)
+
+        if not used_rect:
+            continue
+
+        free_rectangles = maxrects_place_rectangle(free_rectangles, used_rect)
+
+        result_rectangles.append((rect_id, rect_name, used_rect))
+
+    return result_rectangles
+
+
+def pack_rectangles(rectangles, atlas_size, algorithm=None, rule=None):
+    """
+    选择排列算法排列矩形
+
+    Args:
+        rectangles: 待排列的矩形列表
+        atlas_size: 画布尺寸
+        algorithm: 排列算法，默认使用设置中的算法
+        rule: 评分规则，Guillotine默认最小面积，MaxRects默认使用设置中的规则
+
+    Returns:
+        list: 排列结果列表，格式为[(rect_id, rect_name, Rectangle), ...]
+    """
+    if algorithm is None:
+        algorithm = setting_var["packing_algorithm_var"]
+
+    if algorithm == MAXRECTS:
+        return maxrects_packing(
+            rectangles, atlas_size, rule or setting_var["maxrects_rule_var"]
+        )
+
+    return guillotine_packing(rectangles, atlas_size, rule or MIN_AREA)
+
+
+def pack_pages(rectangles, algorithm=None, rule=None):
+    """
+    将矩形排列到一个或多个图集页面中
+
+    每页使用能放下剩余全部矩形的最小尺寸；最大尺寸也放不下时先排满一页最大尺寸的图集，
+    剩余矩形进入下一页。单页占用率低于trigger_several_efficiency时尝试拆分为多页
+
+    Args:
+        rectangles: 待排列的矩形列表
+        algorithm: 排列算法
+        rule: 评分规则
+
+    Returns:
+        list: 每页的(图集尺寸, 排列结果列表)
+
+    Raises:
+        ValueError: 存在超过最大尺寸、无法放入任何图集的矩形时
+    """
+    pages = []
+
+    while rectangles:
+        page = calculate_optimal_size(rectangles, algorithm, rule)
+
+        if page is None:
+            page = pack_full_page(rectangles, algorithm, rule)
+
+        elif (
+            calculate_occupancy([page]) < setting_var["trigger_several_efficiency_var"]
+        ):
+            split_pages = split_page(rectangles, page[0], algorithm, rule)
+            if split_pages:
+                return pages + split_pages
+
+        pages.append(page)
+
+        # 计算剩余未打包的矩形
+        packed_ids = set(rect[0] for rect in page[1])
+        rectangles = [rect for rect in rectangles if rect[0] not in packed_ids]
+
+    return pages
+
+
+def pack_full_page(rectangles, algorithm=None, rule=None):
+    """
+    在最大尺寸的图集中排列尽可能多的矩形
+
+    Returns:
+        tuple: (图集尺寸, 排列结果列表)
+
+    Raises:
+        ValueError: 一个矩形也放不下时
+    """
+    max_size = setting_var["max_size_var"]
+    atlas_size = Size(max_size, max_size)
+    result_rectangles = pack_rectangles(rectangles, atlas_size, algorithm, rule)
+
+    if not result_rectangles:
+        raise ValueError(
+            f"{len(rectangles)} 个矩形无法放入最大尺寸 {atlas_size} 的图集: "
+            + ", ".join(str(rect[1]) for rect in rectangles[:5])
+        )
+
+    return atlas_size, result_rectangles
+
+
+def split_page(rectangles, atlas_size, algorithm=None, rule=None):
+    """
+    尝试将占用率过低的单页拆分为多页
+
+    将较长边减半排满一页，剩余矩形继续排列，总面积小于原单页时采用
+
+    Args:
+        rectangles: 待排列的矩形列表
+        atlas_size: 能放下全部矩形的单页尺寸
+        algorithm: 排列算法
+        rule: 评分规则
+
+    Returns:
+        list: 拆分后每页的(图集尺寸, 排列结果列表)，拆分不能减少面积时返回None
+    """
+    if atlas_size.w >= atlas_size.h:
+        half_size = Size(align_to_4(atlas_size.w // 2), atlas_size.h)
+    else:
+        half_size = Size(atlas_size.w, align_to_4(atlas_size.h // 2))
+
+    result_rectangles = pack_rectangles(rectangles, half_size, algorithm, rule)
+    if not result_rectangles:
+        return None
+
+    packed_ids = set(rect[0] for rect in result_rectangles)
+    rest = [rect for rect in rectangles if rect[0] not in packed_ids]
+
+    try:
+        pages = [(half_size, result_rectangles)] + pack_pages(rest, algorithm, rule)
+    except ValueError:
+        return None
+
+    if sum(size.area() for size, _ in pages) < atlas_size.area():
+        return pages
 
-def guillotine_packing(rectangles, atlas_size):
+    return None
+
+
+def assign_pages(rectangles, algorithm=None, rule=None):
     """
-    使用Guillotine算法在指定尺寸的画布上排列矩形
+    将矩形排列到一个或多个图集页面中，开启多页统一分配时使用pack_pages_multi_bin
+
+    Returns:
+        list: 每页的(图集尺寸, 排列结果列表)
+    """
+    if setting_var["multi_bin_var"]:
+        return pack_pages_multi_bin(rectangles, algorithm, rule)
+
+    return pack_pages(rectangles, algorithm, rule)
+
+
+def pack_pages_multi_bin(rectangles, algorithm=None, rule=None):
+    """
+    多页统一分配：需要多页时把矩形组一次分配到各页，再分别排列
+
+    贪心排列先排满第一页，剩余矩形才进入下一页，较大的矩形可能被挤到最后一页，
+    同一动画的帧也可能分散在多页中。以贪心排列第一页的占用率估计每页能容纳的面积，
+    按首次适应递减分配矩形组，再以相同页数按面积均衡分配；
+    与贪心排列比较，依次选择拆散的动画少、总面积小、页数少的方案
 
     Args:
-        rectangles: 待排列的矩形列表，格式为[(id, width, height), ...]
-        width: 画布宽度
-        height: 画布高度
+        rectangles: 待排列的矩形列表
+        algorithm: 排列算法
+        rule: 评分规则
 
     Returns:
-        list: 排列结果列表，格式为[(rect_id, Rectangle), ...]
+        list: 每页的(图集尺寸, 排列结果列表)
+
+    Raises:
+        ValueError: 存在超过最大尺寸、无法放入任何图集的矩形时
     """
-    border = setting_var["border_var"]
-    result_rectangles = []
-    # 初始化空闲区域为整个画布（考虑边框）
-    free_rectangles = [
-        Rectangle(border, border, atlas_size.w - border, atlas_size.h - border)
+    greedy = pack_pages(rectangles, algorithm, rule)
+    if len(greedy) < 2:
+        return greedy
+
+    max_size = setting_var["max_size_var"]
+    groups = group_rectangles(rectangles)
+    order = {rect[0]: idx for idx, rect in enumerate(rectangles)}
+    capacity = max_size * max_size * calculate_occupancy(greedy[:1])
+
+    first_fit = first_fit_decreasing(groups, capacity)
+    candidates = [greedy]
+    for bins in (first_fit, balance_bins(groups, len(first_fit))):
+        candidates.append(pack_bins(bins, order, algorithm, rule))
+
+    return min(
+        candidates,
+        key=lambda pages: (
+            count_split_groups(pages, groups),
+            sum(atlas_size.area() for atlas_size, _ in pages),
+            len(pages),
+        ),
+    )
+
+
+def get_animation_name(name):
+    """去掉图片名称末尾的帧序号，得到所属动画的名称"""
+    return ANIMATION_FRAME_REGEX.sub("", str(name))
+
+
+def group_rectangles(rectangles):
+    """
+    将矩形分组，开启保持动画完整时同一动画的帧为一组，否则每个矩形单独一组
+
+    Returns:
+        list: [(组内矩形总面积, [矩形, ...]), ...]
+    """
+    if setting_var["keep_animations_var"]:
+        animations = defaultdict(list)
+        for rect in rectangles:
+            animations[get_animation_name(rect[1])].append(rect)
+        groups = animations.values()
+    else:
+        groups = [[rect] for rect in rectangles]
+
+    return [(sum(rect[2].area() for rect in group), group) for group in groups]
+
+
+def first_fit_decreasing(groups, capacity):
+    """
+    按面积从大到小将矩形组放入第一个剩余面积足够的页面
+
+    Returns:
+        list: 每页的矩形组列表
+    """
+    bins = []  # [[已分配面积, [矩形组, ...]], ...]
+
+    for area, group in sorted(groups, key=lambda item: item[0], reverse=True):
+        for page in bins:
+            if page[0] + area <= capacity:
+                break
+        else:
+            page = [0, []]
+            bins.append(page)
+
+        page[0] += area
+        page[1].append(group)
+
+    return [page[1] for page in bins]
+
+
+def balance_bins(groups, count):
+    """
+    按面积从大到小将矩形组放入已分配面积最小的页面，使各页面积接近
+
+    Returns:
+        list: 每页的矩形组列表
+    """
+    bins = [[0, []] for _ in range(count)]
+
+    for area, group in sorted(groups, key=lambda item: item[0], reverse=True):
+        page = min(bins, key=lambda item: item[0])
+        page[0] += area
+        page[1].append(group)
+
+    return [page[1] for page in bins if page[1]]
+
+
+def pack_bins(bins, order, algorithm=None, rule=None):
+    """
+    逐页排列分配好的矩形，每页使用能放下的最小尺寸
+
+    分配时只按面积估计，最大尺寸也放不下的矩形移入下一页
+
+    Args:
+        bins: 每页的矩形组列表
+        order: rect_id -> 矩形在输入中的位置，页面内保持输入的排序
+        algorithm: 排列算法
+        rule: 评分规则
+
+    Returns:
+        list: 每页的(图集尺寸, 排列结果列表)
+    """
+
+    def sort_rects(rects):
+        return sorted(rects, key=lambda rect: order[rect[0]])
+
+    queue = deque(
+        sort_rects(rect for group in groups for rect in group) for groups in bins
+    )
+    pages = []
+
+    while queue:
+        rects = queue.popleft()
+        page = calculate_optimal_size(rects, algorithm, rule)
+
+        if page is None:
+            page = pack_full_page(rects, algorithm, rule)
+            packed_ids = set(rect[0] for rect in page[1])
+            rest = [rect for rect in rects if rect[0] not in packed_ids]
+
+            if queue:
+                queue[0] = sort_rects(rest + queue[0])
+            else:
+                queue.append(rest)
+
+        pages.append(page)
+
+    return pages
+
+
+def count_split_groups(pages, groups):
+    """统计分散在多个页面中的矩形组数量"""
+    page_of = {
+        rect_id: idx
+        for idx, (_, result) in enumerate(pages)
+        for rect_id, _, _ in result
+    }
+
+    return sum(len({page_of[rect[0]] for rect in group}) > 1 for _, group in groups)
+
+
+def calculate_occupancy(pages):
+    """计算所有页面中矩形面积占图集面积的比例"""
+    used_area = sum(rect.area() for _, rects in pages for _, _, rect in rects)
+    atlas_area = sum(atlas_size.area() for atlas_size, _ in pages)
+
+    return used_area / atlas_area if atlas_area else 0
+
+
+def get_max_workers():
+    """获取并行任务的最大进程数，设置为0时使用全部CPU核心"""
+    return setting_var["max_workers_var"] or os.cpu_count() or 1
+
+
+def init_worker(worker_setting_var):
+    """
+    进程池初始化函数
+
+    子进程中没有界面，需要传入主进程的生成参数
+    """
+    global setting_var
+    setting_var = worker_setting_var
+
+
+class SearchTimeout(Exception):
+    """组合搜索的候选方案超过截止时间"""
+
+
+def check_deadline():
+    """候选方案超过截止时间时中止排列，释放子进程"""
+    if search_deadline is not None and time.time() > search_deadline:
+        raise SearchTimeout()
+
+
+def get_portfolio_candidates():
+    """
+    生成组合搜索的候选方案
+
+    Returns:
+        list: [(排序方式, 排列算法, 评分规则), ...]，靠前的方案在结果相同时优先
+    """
+    return [
+        (sort_key, algorithm, rule)
+        for sort_key in SORT_KEYS
+        for algorithm, rules in PORTFOLIO_HEURISTICS
+        for rule in rules
     ]
 
-    # 遍历所有矩形进行排列
-    for rect_id, rect_name, rect in rectangles:
-        # 寻找最佳放置位置
-        rect_data = find_position(free_rectangles, rect)
 
-        if not rect_data:
-            continue
+def run_portfolio_candidate(rects, candidate, deadline=None):
+    """
+    在子进程中执行单个候选方案
+
+    只传递矩形名称和尺寸，不涉及图片像素
 
-        used_rect, in_free_rect, free_rect_idx = rect_data
+    Args:
+        rects: [(rect_id, 名称, 宽, 高), ...]
+        candidate: (排序方式, 排列算法, 评分规则)
+        deadline: 截止时间（time.time()），超过后抛出SearchTimeout
 
-        split_free_rectangle(free_rectangles, in_free_rect, used_rect, free_rect_idx)
-        free_rectangles = merge_free_rectangles(free_rectangles)
+    Returns:
+        list: 每页的((图集宽, 图集高), [(rect_id, x, y, 宽, 高), ...])
+    """
+    global search_deadline
 
-        result_rectangles.append((rect_id, rect_name, used_rect))
+    sort_key, algorithm, rule = candidate
+    key = SORT_KEYS[sort_key]
 
-    return result_rectangles
+    rectangles = [(rect_id, name, Size(w, h)) for rect_id, name, w, h in rects]
+    rectangles.sort(key=lambda r: key(r[2]), reverse=True)
+
+    search_deadline = deadline
+    try:
+        pages = assign_pages(rectangles, algorithm, rule)
+    finally:
+        search_deadline = None
+
+    return [
+        (tuple(atlas_size), [(rect_id, *rect) for rect_id, _, rect in result])
+        for atlas_size, result in pages
+    ]
+
+
+def iter_portfolio_results(rects, candidates, deadline):
+    """
+    执行组合搜索的候选方案，依次产出已完成方案的结果
+
+    只有一个进程时（如并行生成图集的子进程中）在当前进程逐个执行，不创建进程池；
+    否则使用generate_atlases共用的进程池，单独调用时临时创建。
+    超过截止时间时取消未开始的方案，等待已开始的方案中止后抛出TimeoutError
+
+    Args:
+        rects: [(rect_id, 名称, 宽, 高), ...]
+        candidates: 候选方案列表
+        deadline: 截止时间，为None时不限制
+
+    Yields:
+        tuple: (候选方案序号, run_portfolio_candidate的结果)
+    """
+    if get_max_workers() == 1:
+        for idx, candidate in enumerate(candidates):
+            try:
+                raw_pages = run_portfolio_candidate(rects, candidate, deadline)
+            except SearchTimeout:
+                raise concurrent.futures.TimeoutError() from None
+            except Exception as e:
+                log.warning(f"候选方案 {candidate} 失败: {e}")
+                continue
+
+            yield idx, raw_pages
+        return
+
+    executor = portfolio_executor
+    if executor is None:
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=get_max_workers(),
+            initializer=init_worker,
+            initargs=(setting_var,),
+        )
+
+    future_to_idx = {
+        executor.submit(run_portfolio_candidate, rects, candidate, deadline): i
+        for i, candidate in enumerate(candidates)
+    }
+    try:
+        timeout = max(0, deadline - time.time()) if deadline else None
+        for future in concurrent.futures.as_completed(future_to_idx, timeout=timeout):
+            idx = future_to_idx[future]
+            try:
+                raw_pages = future.result()
+            except SearchTimeout:
+                continue
+            except Exception as e:
+                log.warning(f"候选方案 {candidates[idx]} 失败: {e}")
+                continue
+
+            yield idx, raw_pages
+    finally:
+        # 已开始的方案超过截止时间后立即中止，等待它们结束，不占用后续图集的CPU
+        for future in future_to_idx:
+            future.cancel()
+        concurrent.futures.wait(future_to_idx)
+
+        if executor is not portfolio_executor:
+            executor.shutdown()
+
+
+def portfolio_search(rectangles):
+    """
+    尝试多种排序方式和评分策略，每种方案各自搜索图集尺寸，有多个进程时并行执行
+
+    保留页数最少、其次占用率最高的方案，超过时间限制后使用已完成的最佳方案。
+    未完成的方案在子进程中检查截止时间后中止，不会占用后续目录的CPU
+
+    Args:
+        rectangles: 矩形数据列表
+
+    Returns:
+        list: 每页的(图集尺寸, 排列结果列表)，没有任何方案完成时返回None
+    """
+    rects = [(rect_id, name, rect.w, rect.h) for rect_id, name, rect in rectangles]
+    names = {rect_id: rect_name for rect_id, rect_name, _ in rectangles}
+    candidates = get_portfolio_candidates()
+    time_budget = setting_var["portfolio_time_budget_var"] or None
+    deadline = time.time() + time_budget if time_budget else None
+
+    best_score = best_pages = best_candidate = None
+
+    try:
+        for idx, raw_pages in iter_portfolio_results(rects, candidates, deadline):
+            pages = [
+                (
+                    Size(*atlas_size),
+                    [
+                        (rect_id, names[rect_id], Rectangle(x, y, w, h))
+                        for rect_id, x, y, w, h in result
+                    ],
+                )
+                for atlas_size, result in raw_pages
+            ]
+            score = (len(pages), -calculate_occupancy(pages), idx)
+
+            if best_score is None or score < best_score:
+                best_score, best_pages = score, pages
+                best_candidate = candidates[idx]
+
+    except concurrent.futures.TimeoutError:
+        log.warning(f"⏱️ 组合搜索超过 {time_budget} 秒，使用已完成的最佳方案")
+
+    if best_pages:
+        log.info(
+            f"🔍 组合搜索最佳方案: {best_candidate}，{best_score[0]} 页，"
+            f"占用率 {-best_score[1]:.2%}"
+        )
+
+    return best_pages
 
 
 def create_atlas(baisic_atlas_name, rectangles, images):
@@ -628,21 +3048,23 @@ def create_atlas(baisic_atlas_name, rectangles, images):
     Returns:
         list: 所有生成图集的结果信息列表
     """
-    idx = 1
+    pages = None
+    if setting_var["portfolio_search_var"]:
+        pages = portfolio_search(rectangles)
+
+    if not pages:
+        pages = assign_pages(rectangles)
+
     final_results = []
+    remaining_count = len(rectangles)
+    rect_sizes = {rect_id: rect for rect_id, _, rect in rectangles}
 
-    while True:
+    for idx, (atlas_size, result_rectangles) in enumerate(pages, 1):
         # 生成图集名称（多图集时添加序号）
         atlas_name = baisic_atlas_name + f"-{idx}"
 
-        # 计算最优尺寸
-        atlas_size = calculate_optimal_size(rectangles)
-
         log.info(f"🏁 计算{atlas_name}尺寸: {atlas_size}")
 
-        # 使用Guillotine算法进行排列
-        result_rectangles = guillotine_packing(rectangles, atlas_size)
-
         result_rectangles.sort(key=lambda r: r[1])
 
         # 记录打包结果
@@ -654,163 +3076,369 @@ def create_atlas(baisic_atlas_name, rectangles, images):
             }
         )
 
-        # 更新图片位置信息
+        # 更新图片位置信息，宽度与输入不同表示旋转了90°
         for rect_id, _, rect in result_rectangles:
             images[rect_id]["pos"] = Point(rect.x, rect.y)
+            images[rect_id]["rotated"] = rect.w != rect_sizes[rect_id].w
 
-        # 计算剩余未打包的矩形
-        packed_ids = set(rect[0] for rect in result_rectangles)
-        remaining_rects = [rect for rect in rectangles if rect[0] not in packed_ids]
-
-        if not remaining_rects:
-            break
-
-        log.info(f"🔄 还有 {len(remaining_rects)} 个矩形未打包，准备下一轮打包")
-        rectangles = remaining_rects
-        idx += 1
+        remaining_count -= len(result_rectangles)
+        if remaining_count:
+            log.info(f"🔄 还有 {remaining_count} 个矩形未打包，准备下一轮打包")
 
     return final_results
 
 
-def write_atlas(images, result):
+def get_content_bounds(images, result):
     """
-    创建并保存图集图片
+    根据排列结果计算图集内容的范围
+
+    图片均已裁剪掉透明边缘，内容范围即所有图片所占区域的并集
 
     Args:
         images: 图片数据字典
         result: 打包结果数据
+
+    Returns:
+        tuple: (left, top, right, bottom)，没有内容时返回None
     """
-    # 创建空白图集
-    with Image.new("RGBA", tuple(result["atlas_size"]), (0, 0, 0, 0)) as atlas:
-        output_file = config.output_path / f"{result['name']}.png"
-
-        # 将所有图片粘贴到图集上
-        for rect in result["rectangles"]:
-            img_id = rect[0]
-            img_info = images[img_id]
-            img_pos = img_info["pos"]
-
-            if img_pos:
-                atlas.paste(img_info["image"], tuple(img_pos))
-
-        # 在左上角添加白色像素（用于特殊用途，如血条占位）
-        if setting_var["add_white_var"]:
-            draw = ImageDraw.Draw(atlas)
-            draw.rectangle(
-                list(Rectangle(0, 0, 3, 3)),
-                (255, 255, 255, 255),
-                None,
-            )
+    bounds = []
+    for rect_id, _, _ in result["rectangles"]:
+        img_info = images[rect_id]
+        img_pos = img_info["pos"]
+        width, height = img_info["image"].size
+
+        if img_pos and width and height:
+            if img_info.get("rotated"):
+                width, height = height, width
+            bounds.append((img_pos.x, img_pos.y, img_pos.x + width, img_pos.y + height))
+
+    # 左上角的白色像素
+    if setting_var["add_white_var"]:
+        bounds.append((0, 0, 4, 4))
+
+    if not bounds:
+        return None
 
-        # 裁剪图集到实际内容大小
-        bbox = atlas.getbbox()
-        if bbox:
-            border = setting_var["border_var"]
-            left, top, right, bottom = bbox
+    left, top, right, bottom = zip(*bounds)
+    return min(left), min(top), max(right), max(bottom)
 
-            right_alignment = 4 - (right % 4)
-            bottom_alignment = 4 - (bottom % 4)
-            right += right_alignment
-            bottom += bottom_alignment
 
-            right_border = max(0, border - right_alignment)
-            bottom_border = max(0, border - bottom_alignment)
-            right_border += 4 - (right_border % 4)
-            bottom_border += 4 - (bottom_border % 4)
+def write_atlas(images, result, dds_converter=None):
+    """
+    创建并保存图集图片
+
+    内容范围由排列结果直接得出，图集只按裁剪后的尺寸分配一次，
+    图片以数组切片赋值写入，不再整页粘贴后扫描、裁剪
 
-            atlas = atlas.crop(
-                (left, top, right + right_border, bottom + bottom_border)
-            )
+    Args:
+        images: 图片数据字典
+        result: 打包结果数据
+        dds_converter: DDS转换队列，输出DDS格式时使用
+    """
+    output_file = config.output_path / f"{result['name']}.png"
 
-        # 保存PNG文件
-        atlas.save(output_file)
+    with profile_stage("compose"):
+        atlas = compose_atlas(images, result)
 
-        output_format = setting_var["format_var"]
+    output_format = setting_var["format_var"]
 
+    with profile_stage("encode"):
         # 转换为DDS格式（如果需要）
         if output_format == "bc7" or output_format == "bc3":
-            save_to_dds(
-                output_file,
-                config.output_path,
-                output_format,
-                setting_var["delete_temp_var"],
-            )
+            dds_converter.add(atlas, output_file)
         elif output_format == "png":
+            # 保存PNG文件
+            atlas.save(output_file)
             log.info(f"✅ 保存为png: {output_file.name}...")
+            atlas.close()
+
+    return Size(atlas.width, atlas.height)
+
+
+def compose_atlas(images, result):
+    """
+    将排列好的图片合成为图集图片
+
+    Args:
+        images: 图片数据字典
+        result: 打包结果数据
+
+    Returns:
+        Image: 裁剪到内容大小的图集图片
+    """
+    # 裁剪图集到实际内容大小，Lua中的坐标从图集左上角算起，只裁剪右侧和下方
+    bbox = get_content_bounds(images, result)
+    if bbox:
+        border = setting_var["border_var"]
+        right, bottom = bbox[2:]
+
+        right_alignment = 4 - (right % 4)
+        bottom_alignment = 4 - (bottom % 4)
+        right += right_alignment
+        bottom += bottom_alignment
+
+        right_border = max(0, border - right_alignment)
+        bottom_border = max(0, border - bottom_alignment)
+        right_border += 4 - (right_border % 4)
+        bottom_border += 4 - (bottom_border % 4)
+
+        right += right_border
+        bottom += bottom_border
+    else:
+        right, bottom = result["atlas_size"]
+
+    # 创建空白图集
+    pixels = np.zeros((bottom, right, 4), dtype=np.uint8)
+
+    # 将所有图片写入图集
+    for rect_id, _, _ in result["rectangles"]:
+        img_info = images[rect_id]
+        img_pos = img_info["pos"]
+
+        if img_pos:
+            image = np.asarray(img_info["image"])
+            # 旋转的图片顺时针旋转90°存放
+            if img_info.get("rotated"):
+                image = np.rot90(image, -1)
+
+            x, y = img_pos
+            pixels[y : y + image.shape[0], x : x + image.shape[1]] = image
+
+    # 在左上角添加白色像素（用于特殊用途，如血条占位）
+    if setting_var["add_white_var"]:
+        pixels[:4, :4] = 255
+
+    return Image.fromarray(pixels)
+
+
+def get_variant_scales():
+    """
+    获取需要输出的图集变体的缩放比例
+
+    全分辨率图集总是输出，其余比例转为分数以便精确缩放排列结果
+    """
+    scales = []
+    for value in setting_var["variant_scales_var"]:
+        scale = Fraction(value).limit_denominator(64)
+        if scale > 0 and scale != 1 and scale not in scales:
+            scales.append(scale)
+
+    return scales
+
+
+def get_variant_grid():
+    """
+    获取矩形尺寸的取整步长
+
+    矩形尺寸都是各缩放比例分母的倍数时，排列出的位置（相对边框）缩放后都是整数，
+    各变体的图片不会重叠
+    """
+    grid = 1
+    for scale in get_variant_scales():
+        grid = math.lcm(grid, scale.denominator)
+
+    return grid
+
+
+def get_variant_name(name, scale):
+    """获取图集变体的名称，如 name@0.5x"""
+    return f"{name}@{float(scale):g}x"
+
+
+def scale_span(origin, start, length, scaled_length, scale):
+    """
+    缩放一个方向上的原始尺寸和裁剪信息
+
+    缩放后的原始尺寸至少能容纳缩放后的图片，裁剪信息随之调整
+
+    Returns:
+        tuple: (缩放后的原始尺寸, 起始裁剪, 末尾裁剪)
+    """
+    scaled_origin = max(round(origin * scale), scaled_length)
+    scaled_start = min(round(start * scale), scaled_origin - scaled_length)
+
+    return scaled_origin, scaled_start, scaled_origin - scaled_start - scaled_length
+
 
-        return Size(atlas.width, atlas.height)
+def scale_image_data(img_info, scale):
+    """
+    生成图片在图集变体中的数据
+
+    位置相对边框按比例缩放，图片尺寸向上取整，不会超出缩放后的矩形
+
+    Args:
+        img_info: 全分辨率的图片数据
+        scale: 缩放比例
+
+    Returns:
+        dict: 图集变体中的图片数据
+    """
+    image = img_info["image"]
+    width = math.ceil(image.width * scale)
+    height = math.ceil(image.height * scale)
+
+    if width and height:
+        scaled_image = image.resize((width, height), Image.Resampling.LANCZOS)
+    else:
+        scaled_image = image.copy()
+
+    origin_size = img_info["origin_size"]
+    tleft, ttop, tright, tbottom = img_info["trim"]
+    origin_w, tleft, tright = scale_span(
+        origin_size.w, tleft, image.width, width, scale
+    )
+    origin_h, ttop, tbottom = scale_span(
+        origin_size.h, ttop, image.height, height, scale
+    )
+
+    pos = img_info["pos"]
+    if pos:
+        border = setting_var["border_var"]
+        offset = math.ceil(border * scale)
+        pos = Point(
+            offset + int((pos.x - border) * scale),
+            offset + int((pos.y - border) * scale),
+        )
 
+    return {
+        **img_info,
+        "image": scaled_image,
+        "pos": pos,
+        "origin_size": Size(origin_w, origin_h),
+        "trim": (tleft, ttop, tright, tbottom),
+    }
 
-def gen_lua_content(images, results):
-    writer = WriteLua()
-    a, start, end, dict_v, list_v = writer.get_helpers()
-    a(0, "return {")
 
-    # 遍历所有打包结果
+def write_variant(images, results, atlas_stem_name, subdir, scale, dds_converter):
+    """
+    按缩放比例输出图集变体
+
+    直接缩放全分辨率的排列结果，不重新排列，各分辨率的布局保持一致
+
+    Args:
+        images: 图片数据字典
+        results: 全分辨率的打包结果列表
+        atlas_stem_name: 图集名称
+        subdir: 目录的图片数据
+        scale: 缩放比例
+        dds_converter: DDS转换队列，输出DDS格式时使用
+
+    Returns:
+        list: 图集变体的打包结果列表
+    """
+    variant_images = {}
+    variant_results = []
+
     for result in results:
-        for rect in result["rectangles"]:
-            img = images[rect[0]]
+        variant_result = {
+            "name": get_variant_name(result["name"], scale),
+            "rectangles": result["rectangles"],
+            "atlas_size": Size(
+                math.ceil(result["atlas_size"].w * scale),
+                math.ceil(result["atlas_size"].h * scale),
+            ),
+        }
 
-            start(1, img["name"])
+        with profile_stage("compose"):
+            for rect_id, _, _ in result["rectangles"]:
+                variant_images[rect_id] = scale_image_data(images[rect_id], scale)
 
-            # 图集文件名
-            dict_v(
-                2,
-                "a_name",
-                result["name"]
-                + (".png" if setting_var["format_var"] == "png" else ".dds"),
-            )
+        variant_result["atlas_size"] = write_atlas(
+            variant_images, variant_result, dds_converter
+        )
 
-            # 原始尺寸
-            origin_size = img["origin_size"]
-            start(2, "size")
-            list_v(3, origin_size.w)
-            list_v(3, origin_size.h)
-            end(2)
-
-            tleft, ttop, tright, tbottom = img["trim"]
-            # 裁剪信息
-            start(2, "trim")
-            list_v(3, tleft)
-            list_v(3, ttop)
-            list_v(3, tright)
-            list_v(3, tbottom)
-            end(2)
-
-            # 图集尺寸
-            atlas_size = result["atlas_size"]
-            start(2, "a_size")
-            list_v(3, atlas_size.w)
-            list_v(3, atlas_size.h)
-            end(2)
-
-            # 在图集中的位置和尺寸
-            pos = img["pos"]
-            start(2, "f_quad")
-            list_v(3, pos.x)
-            list_v(3, pos.y)
-            list_v(3, img["image"].width)
-            list_v(3, img["image"].height)
-            end(2)
-
-            # 相同图片别名
-            samed_img = img["samed_img"]
-            if len(samed_img) > 0:
-                start(2, "alias")
-                for name in samed_img:
-                    list_v(3, name)
-                end(2)
-            else:
-                a(2, "alias = {}")
+        # 公共图集的变体供其他目录的同比例变体引用
+        for rect_id, _, _ in result["rectangles"]:
+            variant_images[rect_id]["result"] = variant_result
+            images[rect_id].setdefault("variants", {})[scale] = variant_images[rect_id]
+
+        variant_results.append(variant_result)
+
+    write_lua_data(
+        variant_images,
+        variant_results,
+        get_variant_name(atlas_stem_name, scale),
+        resolve_references(subdir, scale),
+    )
+
+    # 公共图集的变体还要随引用传给生成其他目录的子进程，在所有图集生成后释放
+    if not subdir.get("shared"):
+        for img_info in variant_images.values():
+            img_info["image"].close()
+
+    return variant_results
+
+
+def format_lua_alias(samed_img):
+    """格式化相同图片别名列表"""
+    if not samed_img:
+        return "{}"
+
+    names = ",\n".join(f"\t\t\t{value_to_lua(name)}" for name in samed_img)
+    return f"{{\n{names}\n\t\t}}"
+
+
+def write_lua_content(file, images, results, references=()):
+    """
+    将图集数据流式写入Lua文件
+
+    每张图片的数据由LUA_FRAME_FORMAT一次格式化后直接写入文件
 
-            # 结束当前图片数据
-            end(1)
-    end(0, False)
+    Args:
+        file: 文本文件对象
+        images: 图片数据字典
+        results: 打包结果列表
+        references: 引用的公共图集图片，见resolve_references
+    """
+    writer = StreamWriteLua(file)
+    writer.start(0, head="return {")
+
+    # 图集文件名
+    extension = ".png" if setting_var["format_var"] == "png" else ".dds"
+    atlas_files = {}
+
+    # 遍历所有打包结果，引用的公共图集图片写在最后
+    entries = [
+        (images[rect[0]], result) for result in results for rect in result["rectangles"]
+    ]
+    entries.extend(references)
+
+    for img, result in entries:
+        atlas_file = atlas_files.get(id(result))
+        if atlas_file is None:
+            atlas_file = atlas_files[id(result)] = value_to_lua(
+                result["name"] + extension
+            )
+
+        origin_size = img["origin_size"]
+        tleft, ttop, tright, tbottom = img["trim"]
+        atlas_size = result["atlas_size"]
+        pos = img["pos"]
+        image = img["image"]
+
+        writer.write_item(
+            LUA_FRAME_FORMAT(
+                name=key_to_lua(img["name"]),
+                a_name=atlas_file,
+                origin_size=origin_size,
+                tleft=tleft,
+                ttop=ttop,
+                tright=tright,
+                tbottom=tbottom,
+                atlas_size=atlas_size,
+                pos=pos,
+                width=image.width,
+                height=image.height,
+                # 在图集中顺时针旋转了90°，f_quad仍为旋转前的宽高
+                rotated=LUA_ROTATED_LINE if img.get("rotated") else "",
+                alias=format_lua_alias(img["samed_img"]),
+            )
+        )
 
-    return writer.get_content()
+    writer.end(0)
 
 
-def write_lua_data(images, results, atlas_name):
+def write_lua_data(images, results, atlas_name, references=()):
     """
     生成Lua格式的图集数据文件
 
@@ -820,71 +3448,225 @@ def write_lua_data(images, results, atlas_name):
         images: 图片数据字典
         results: 打包结果列表
         atlas_name: 图集名称
+        references: 引用的公共图集图片，见resolve_references
     """
-    lua_content = gen_lua_content(images, results)
-
     file = config.output_path / f"{atlas_name}.lua"
     log.info(f"写入图集数据 {file}")
 
-    with open(file, "w", encoding="utf-8") as f:
-        f.write(lua_content)
+    with profile_stage("lua"), open(file, "w", encoding="utf-8") as f:
+        write_lua_content(f, images, results, references)
+
+
+@contextmanager
+def profile_stage(stage):
+    """统计当前图集一个阶段的耗时，未开启性能统计时不做任何事"""
+    if stage_times is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_times[stage] += time.perf_counter() - start
+
+
+def timer_decorator(func):
+    """计数并计时的装饰器，结果累计到function_stats"""
+    stats = function_stats.setdefault(func.__name__, [0, 0.0])
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        stats[1] += time.perf_counter() - start
+        stats[0] += 1
 
+        return result
 
-# def add_performance_monitor_decorator():
-#     all_time = {}
+    return wrapper
 
-#     def timer_decorator(func):
-#         """计时装饰器"""
 
-#         @wraps(func)
-#         def wrapper(*args, **kwargs):
-#             start = time.perf_counter()
-#             result = func(*args, **kwargs)
-#             end = time.perf_counter()
+def add_performance_monitor_decorator():
+    """
+    为排列的热点函数添加计数和计时
 
-#             if not all_time.get(func.__name__):
-#                 all_time[func.__name__] = []
+    组合搜索在子进程中排列，其中的调用不计入
+    """
+    global find_position, maxrects_find_position
+    global split_free_rectangle, merge_free_rectangles
 
-#             all_time[func.__name__].append(end - start)
+    find_position = timer_decorator(find_position)
+    maxrects_find_position = timer_decorator(maxrects_find_position)
+    split_free_rectangle = timer_decorator(split_free_rectangle)
+    merge_free_rectangles = timer_decorator(merge_free_rectangles)
 
-#             return result
 
-#         return wrapper
+def remove_performance_monitor_decorator():
+    """移除add_performance_monitor_decorator添加的装饰器"""
+    global find_position, maxrects_find_position
+    global split_free_rectangle, merge_free_rectangles
 
-#     global get_input_subdir
-#     get_input_subdir = timer_decorator(get_input_subdir)
-#     global find_position
-#     find_position = timer_decorator(find_position)
-#     global calculate_optimal_size
-#     calculate_optimal_size = timer_decorator(calculate_optimal_size)
-#     global merge_free_rectangles
-#     merge_free_rectangles = timer_decorator(merge_free_rectangles)
-#     global split_free_rectangle
-#     split_free_rectangle = timer_decorator(split_free_rectangle)
+    find_position = find_position.__wrapped__
+    maxrects_find_position = maxrects_find_position.__wrapped__
+    split_free_rectangle = split_free_rectangle.__wrapped__
+    merge_free_rectangles = merge_free_rectangles.__wrapped__
 
-#     return all_time
 
+def report_performance(result):
+    """
+    输出性能统计表格并保存JSON报告
 
-# def print_performance_info(all_time):
-#     sum_time = 0
-#     calculated_sum = []
+    Args:
+        result: generate_atlases的生成结果
+    """
+    log.info(f"\n=====总运行时长: {result['seconds']:.3f} 秒=====")
 
-#     for fn_name, time_list in all_time.items():
-#         s = sum([t for t in time_list])
+    header = "".join(f"{name:>8}" for name in PROFILE_STAGES.values())
+    log.info(f"{'图集':<20}{header}{'占用率':>8}{'页数':>6}")
 
-#         count = len(time_list)
+    for atlas in result["atlases"]:
+        stages = "".join(
+            f"{int(atlas['stages'][stage] * 1000):>8}" for stage in PROFILE_STAGES
+        )
+        log.info(
+            f"{atlas['name']:<20}{stages}"
+            f"{atlas['occupancy']:>8.1%}{len(atlas['pages']):>6}"
+        )
 
-#         calculated_sum.append((fn_name, s, count))
-#         sum_time += s
+    # 排列热点函数的调用汇总
+    for name in function_stats:
+        count = sum(atlas["calls"][name]["count"] for atlas in result["atlases"])
+        seconds = sum(atlas["calls"][name]["seconds"] for atlas in result["atlases"])
+        log.info(f"{name:<25}: {int(seconds * 1000)} ms, {count:>8} 次")
+
+    save_output_json(
+        PERFORMANCE_REPORT_FILE,
+        {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "seconds": result["seconds"],
+            "skipped": result["skipped"],
+            "atlases": result["atlases"],
+        },
+    )
+    log.info(f"性能统计已保存到 {config.output_path / PERFORMANCE_REPORT_FILE}")
+
+
+# 命令行参数 -> 生成参数
+CLI_OPTIONS = {
+    "format": "format_var",
+    "jobs": "max_workers_var",
+    "border": "border_var",
+    "padding": "padding_var",
+    "max_size": "max_size_var",
+    "algorithm": "packing_algorithm_var",
+    "rule": "maxrects_rule_var",
+    "rotate": "allow_rotation_var",
+    "portfolio": "portfolio_search_var",
+    "incremental": "incremental_var",
+    "parallel": "parallel_atlases_var",
+    "multi_bin": "multi_bin_var",
+    "alpha_threshold": "trim_alpha_var",
+    "mipmaps": "mipmaps_var",
+    "mipmap_filter": "mipmap_filter_var",
+}
+
+
+def parse_args(argv=None):
+    """解析命令行参数，未指定的参数使用setting.json中的设置"""
+    parser = argparse.ArgumentParser(
+        prog="python -m tools.generate_atlas",
+        description="无界面生成图集，未指定的参数使用setting.json中的设置",
+    )
+    parser.add_argument("--headless", action="store_true", help="不打开界面直接生成")
+    parser.add_argument("--input", type=Path, help="输入目录，每个子目录生成一个图集")
+    parser.add_argument("--output", type=Path, help="输出目录")
+    parser.add_argument("--format", choices=["png", "bc3", "bc7"], help="输出格式")
+    parser.add_argument("--jobs", type=int, help="并行进程数，0表示使用全部CPU核心")
+    parser.add_argument("--border", type=int, help="图集边框")
+    parser.add_argument("--padding", type=int, help="图片间距")
+    parser.add_argument("--max-size", type=int, help="图集最大尺寸")
+    parser.add_argument("--algorithm", choices=[GUILLOTINE, MAXRECTS], help="排列算法")
+    parser.add_argument(
+        "--rule", choices=[BEST_SHORT_SIDE, BEST_AREA, BOTTOM_LEFT], help="MaxRects规则"
+    )
+    parser.add_argument(
+        "--alpha-threshold", type=int, help="裁剪时透明度不超过该值的像素视为透明"
+    )
+    parser.add_argument(
+        "--rotate", action=argparse.BooleanOptionalAction, help="允许旋转图片"
+    )
+    parser.add_argument(
+        "--multi-bin", action=argparse.BooleanOptionalAction, help="多页统一分配"
+    )
+    parser.add_argument(
+        "--portfolio", action=argparse.BooleanOptionalAction, help="组合搜索排列方案"
+    )
+    parser.add_argument(
+        "--incremental", action=argparse.BooleanOptionalAction, help="跳过未变化的图集"
+    )
+    parser.add_argument(
+        "--parallel", action=argparse.BooleanOptionalAction, help="多个图集并行生成"
+    )
+    parser.add_argument(
+        "--mipmaps", action=argparse.BooleanOptionalAction, help="DDS输出完整的mipmap链"
+    )
+    parser.add_argument(
+        "--mipmap-filter", choices=list(MIPMAP_FILTERS), help="生成mipmap的缩小滤波器"
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="在标准输出打印JSON格式的生成结果"
+    )
+
+    args = parser.parse_args(argv)
+    if args.input and not args.input.is_dir():
+        parser.error(f"输入目录不存在: {args.input}")
+
+    return args
+
+
+def cli(argv=None):
+    """
+    命令行入口
 
-#     calculated_sum.sort(key=lambda x: x[1], reverse=True)
+    Returns:
+        int: 退出码，生成成功为0，出错、有图集生成失败、没有图片或DDS转换失败为1
+    """
+    args = parse_args(argv)
+
+    if args.input:
+        config.input_path = args.input
+    if args.output:
+        config.output_path = args.output
+        config.output_path.mkdir(parents=True, exist_ok=True)
+
+    settings = get_setting_vars(config.setting["generate_atlas"])
+    for option, key in CLI_OPTIONS.items():
+        value = getattr(args, option)
+        if value is not None:
+            settings[key] = value
+
+    try:
+        result = generate_atlases(settings)
+    except Exception:
+        log.error(traceback.format_exc())
+        return 1
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+
+    for atlas in result["atlases"]:
+        for page in atlas["pages"]:
+            log.info(
+                f"📊 {page['name']}: {page['width']}x{page['height']}, "
+                f"{page['sprites']} 张图片, 占用率 {page['occupancy']:.1%}"
+            )
 
-#     log.info(f"\n=====总运行时长: {sum_time:.3f} 秒=====")
+    if not result["atlases"] and not result["skipped"] and not result["failed"]:
+        log.error("未找到任何图像")
+        return 1
 
-#     for fn_name, s, count in calculated_sum:
-#         log.info(
-#             f"{fn_name:<25}: {int(s * 1000)} ms, {count:>5} 次 ({s/sum_time*100:<6.2f}%)"
-#         )
+    return 1 if result["failed"] or result["dds_failures"] else 0
 
 
 def main(root=None):
@@ -894,4 +3676,8 @@ def main(root=None):
 
 
 if __name__ == "__main__":
+    # 带命令行参数时不打开界面
+    if len(sys.argv) > 1:
+        sys.exit(cli())
+
     main()
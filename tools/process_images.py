@@ -4,7 +4,8 @@ from PIL import Image, ImageFilter, ImageEnhance
 import tkinter as tk
 from tkinter import ttk
 import lib.config as config
-from lib.utils import save_to_dds, run_app
+from lib.utils import DDSConverter, run_app
+from lib.dds import MIPMAP_FILTERS
 from lib.classes import Size
 import lib.log as log
 
@@ -222,6 +223,30 @@ class ImageProcessor:
         )
         self.delete_png_check.grid(row=0, column=2, padx=20, pady=5, sticky="w")
 
+        # mipmap选项，只对DDS输出有效
+        self.mipmaps_var = tk.BooleanVar(value=setting["mipmaps"])
+        self.mipmaps_check = ttk.Checkbutton(
+            self.output_format_frame,
+            text="生成Mipmap",
+            variable=self.mipmaps_var,
+        )
+        self.mipmaps_check.grid(row=1, column=0, padx=5, pady=5, sticky="w")
+
+        self.mipmap_filter_label = ttk.Label(
+            self.output_format_frame, text="Mipmap滤波:"
+        )
+        self.mipmap_filter_label.grid(row=1, column=1, padx=5, pady=5, sticky="w")
+
+        self.mipmap_filter_var = tk.StringVar(value=setting["mipmap_filter"])
+        self.mipmap_filter_combo = ttk.Combobox(
+            self.output_format_frame,
+            textvariable=self.mipmap_filter_var,
+            values=list(MIPMAP_FILTERS),
+            state="readonly",
+            width=10,
+        )
+        self.mipmap_filter_combo.grid(row=1, column=2, padx=20, pady=5, sticky="w")
+
     def create_control_buttons_section(self):
         """创建控制按钮部分"""
         # 创建框架
@@ -268,6 +293,11 @@ class ImageProcessor:
             "merge_var": self.merge_var.get(),
             "output_format_var": self.output_format_var.get(),
             "delete_temp_var": self.delete_temp_var.get(),
+            "dds_encoder_var": setting["dds_encoder"],
+            "max_workers_var": setting["max_workers"],
+            "mipmaps_var": self.mipmaps_var.get(),
+            "mipmap_filter_var": self.mipmap_filter_var.get(),
+            "mipmap_dilate_var": setting["mipmap_dilate"],
         }
 
     def start_process(self):
@@ -407,18 +437,11 @@ def save_img(img, in_dir, name):
     # 保存图片
     output_format = setting_var["output_format_var"]
 
-    # 先保存为PNG临时文件
-    img.save(output_img)
-
     if output_format == "png":
+        img.save(output_img)
         log.info(f"✅ 保存为PNG: {name}")
     elif output_format == "bc3" or output_format == "bc7":
-        save_to_dds(
-            output_img,
-            config.output_path,
-            output_format,
-            setting_var["delete_temp_png"],
-        )
+        dds_converter.add(img, output_img)
 
 
 def process_img(name, img, in_dir):
@@ -465,23 +488,46 @@ def merge_images(groups):
 
 def process_images():
     """处理所有图片"""
+    global dds_converter
+
     input_subdir = get_input_files()
     groups = {}
 
-    # 处理所有图片
-    for dir_name, (dir_list) in input_subdir.items():
-        if dir_name != "imgs":
-            groups[dir_name] = dir_list
+    # DDS格式收集所有图片后并行转换
+    dds_converter = None
+    if setting_var["output_format_var"] in ("bc3", "bc7"):
+        dds_converter = DDSConverter(
+            config.output_path,
+            setting_var["output_format_var"],
+            setting_var["dds_encoder_var"],
+            setting_var["delete_temp_var"],
+            setting_var["max_workers_var"],
+            setting_var["mipmaps_var"],
+            setting_var["mipmap_filter_var"],
+            setting_var["mipmap_dilate_var"],
+        )
+
+    try:
+        # 处理所有图片
+        for dir_name, (dir_list) in input_subdir.items():
+            if dir_name != "imgs":
+                groups[dir_name] = dir_list
+
+            for filename, img in dir_list:
+                process_img(
+                    filename,
+                    img,
+                    dir_name if dir_name != "imgs" else None,
+                )
 
-        for filename, img in dir_list:
-            process_img(
-                filename,
-                img,
-                dir_name if dir_name != "imgs" else None,
-            )
+        if setting_var["merge_var"]:
+            merge_images(groups)
 
-    if setting_var["merge_var"]:
-        merge_images(groups)
+        if dds_converter:
+            dds_converter.finish()
+    finally:
+        if dds_converter:
+            dds_converter.shutdown()
 
     log.info("\n✅ 所有图片处理完成！")
 
@@ -1,5 +1,7 @@
-import re, traceback, subprocess, math
+import re, traceback, subprocess, math, os, logging
+import concurrent.futures
 import lib.config as config
+from multiprocessing import shared_memory
 from PIL import Image
 from plistlib import load as load_plist
 from pathlib import Path
@@ -259,18 +261,20 @@ def write_plists(lua_data):
 
 def process_lua(item_file):
     """
-    处理.lua文件：反编译、解析并生成.plist文件
+    处理.lua文件：反编译并解析出各图集的帧数据
 
     处理流程：
     1. 反编译.lua文件（如果已加密或编译过）
     2. 读取并解析Lua数据
-    3. 转换为标准格式并生成.plist文件
+    3. 不删除临时Plist时，额外导出.plist文件
+
+    解析出的帧数据直接用于拆分，不再写入.plist后重新读取和解析
 
     Args:
         item_file (Path): .lua文件路径对象
 
     Returns:
-        list: 生成的.plist文件路径列表
+        dict: get_lua_data()返回的图集数据字典，解析失败时为空字典
 
     Raises:
         FileNotFoundError: 当.lua文件不存在时
@@ -285,102 +289,129 @@ def process_lua(item_file):
             lua_data = get_lua_data(f.read())
     except UnicodeDecodeError:
         log.error(f"❌ 文件编码错误: {item_file}")
-        return []
+        return {}
 
-    # 如果解析到数据，生成.plist文件
-    if lua_data:
-        plist_paths = write_plists(lua_data)
-        return plist_paths
-    else:
+    if not lua_data:
         log.warning(f"⚠️ 未解析到有效数据: {item_file}")
-        return []
+        return {}
 
+    # Plist只作为可选的导出结果，拆分不依赖它
+    if not setting.get("delete_temporary_plist", False):
+        write_plists(lua_data)
 
-def get_input_items():
+    return lua_data
+
+
+def load_plist_atlas(plist_file):
     """
-    扫描输入目录，获取所有需要处理的.lua和.plist文件
+    读取.plist文件中的图集文件名和帧数据
 
-    处理策略：
-    1. 查找所有.lua和.plist文件
-    2. .lua文件：处理并转换为.plist文件
-    3. .plist文件：直接添加到处理列表
-    4. 返回所有需要处理的.plist文件路径
+    Args:
+        plist_file (Path): .plist文件路径
 
     Returns:
-        list: 需要处理的.plist文件路径列表
+        tuple: (图集文件名, 帧数据字典)，文件格式无效时返回None
+    """
+    with open(plist_file, "rb") as file:
+        plist_data = load_plist(file)
 
-    Note:
-        处理后的.plist文件将保存在输出目录中
+    # 验证.plist文件格式（必须包含metadata部分）
+    if not plist_data.get("metadata"):
+        log.warning(f"⚠️ 无效的Plist文件格式，跳过: {plist_file.name}")
+        return None
+
+    # 获取图集文件名（从metadata中）
+    atlas_file_name = plist_data["metadata"].get(
+        "realTextureFileName",
+        plist_data["metadata"].get("textureFileName", ""),
+    )
+
+    if not atlas_file_name:
+        log.warning(f"⚠️ 无法获取图集文件名，跳过: {plist_file.name}")
+        return None
+
+    return atlas_file_name, plist_data.get("frames", {})
+
+
+def get_input_items():
     """
-    plist_files = []
+    扫描输入目录，获取所有需要处理的.lua和.plist文件
 
-    # 获取所有.lua和.plist文件（不递归搜索子目录）
+    Returns:
+        list: .lua和.plist文件路径列表（不递归搜索子目录）
+    """
     item_files = list(config.input_path.glob("*.*"))
-    item_files = [f for f in item_files if f.suffix.lower() in {".lua", ".plist"}]
+    return [f for f in item_files if f.suffix.lower() in {".lua", ".plist"}]
 
-    # 处理每个文件
-    for item_file in item_files:
-        if item_file.suffix.lower() == ".lua":
-            # 处理.lua文件并获取生成的.plist文件
-            try:
-                plist_paths = process_lua(item_file)
-                if plist_paths:
-                    plist_files.extend(plist_paths)
-            except Exception as e:
-                log.error(f"❌ 处理Lua文件失败: {item_file} - {str(e)}")
-                traceback.print_exc()
-        else:
-            # 直接添加.plist文件到处理列表
-            plist_files.append(item_file)
 
-    return plist_files
+def get_item_atlases(item_file):
+    """
+    获取一个输入文件中需要拆分的所有图集
+
+    .lua文件可能包含多个图集，.plist文件对应一个图集
+
+    Args:
+        item_file (Path): .lua或.plist文件路径
+
+    Returns:
+        list: [(图集名称, 图集文件名, 帧数据字典), ...]，图集名称用于确定输出目录；
+            .plist文件格式无效时返回None
+    """
+    if item_file.suffix.lower() == ".lua":
+        return [
+            (Path(atlas_file_name).stem, atlas_file_name, atlas_data["images_data"])
+            for atlas_file_name, atlas_data in process_lua(item_file).items()
+        ]
+
+    plist_atlas = load_plist_atlas(item_file)
+    if plist_atlas is None:
+        return None
 
+    return [(item_file.stem, *plist_atlas)]
 
-def gen_png_from_plist(plist_path, plist_data, png_path):
+
+def to_geometry(cls, value):
     """
-    根据.plist配置从图集大图中提取并生成单个精灵图片
+    将帧数据中的几何值转换为整数坐标的几何对象
 
-    处理流程：
-    1. 加载图集大图
-    2. 遍历.plist中的所有帧配置
-    3. 根据配置裁剪、旋转、定位精灵
-    4. 保存为单个.png文件
+    .plist中为"{{x, y}, {w, h}}"形式的字符串，Lua数据中已经是几何对象
+    """
+    if isinstance(value, str):
+        return cls(value)
 
-    Args:
-        plist_path (Path): .plist文件路径
-        plist_data (dict): 已加载的.plist数据字典
-        png_path (Path): 图集大图文件路径
+    return value.to_int()
 
-    Raises:
-        FileNotFoundError: 当图集文件不存在时
-        KeyError: 当.plist数据中缺少必要的键时
-        IOError: 当图片保存失败时
 
-    Note:
-        输出目录结构：输出路径/图集名称（不含序号）/精灵名称.png
-        例如：output/atlas-0.plist -> output/atlas/精灵1.png
+def get_max_workers():
+    """获取拆分图集的最大进程数，设置为0时使用全部CPU核心"""
+    return setting.get("max_workers", 0) or os.cpu_count() or 1
+
+
+def extract_frames(atlas_image, frames, output_dir):
     """
-    # 打开图集大图，确保使用RGBA模式以支持透明度
-    try:
-        atlas_image = Image.open(png_path).convert("RGBA")
-    except FileNotFoundError:
-        log.error(f"❌ 图集文件不存在: {png_path}")
-        return
+    从图集大图中提取一批精灵并分别保存为.png文件
 
-    frames = plist_data.get("frames", {})
-    if not frames:
-        log.warning(f"⚠️ Plist文件中没有帧数据: {plist_path}")
-        return
+    可在主进程中直接调用，也可在子进程中处理共享内存中的图集
+
+    Args:
+        atlas_image (Image): RGBA模式的图集大图
+        frames (list): [(帧名称, 帧数据), ...]
+        output_dir (Path): 精灵图片的输出目录
+
+    Returns:
+        list: 每个精灵的处理日志 [(日志级别, 日志内容), ...]，由主进程按顺序输出
+    """
+    records = []
 
     # 处理每个帧（精灵）
-    for frame_key, frame_data in frames.items():
+    for frame_key, frame_data in frames:
         # 清理帧名称，移除.png后缀（如果有）
         framename = frame_key.replace(".png", "")
 
-        # 解析帧数据，使用自定义对象包装原始数据
-        sprite_size = Size(frame_data["spriteSourceSize"])  # 精灵原始尺寸
-        texture_rect = Rectangle(frame_data["textureRect"])  # 在图集中的位置和尺寸
-        offset = Point(frame_data["spriteOffset"])  # 偏移量
+        # 解析帧数据：精灵原始尺寸、在图集中的位置和尺寸、偏移量
+        sprite_size = to_geometry(Size, frame_data["spriteSourceSize"])
+        texture_rect = to_geometry(Rectangle, frame_data["textureRect"])
+        offset = to_geometry(Point, frame_data["spriteOffset"])
         texture_rotated = frame_data.get("textureRotated", False)  # 是否旋转
 
         # 计算在图集中的裁剪框 [left, top, right, bottom]
@@ -401,7 +432,9 @@ def gen_png_from_plist(plist_path, plist_data, png_path):
         try:
             rect_on_big = atlas_image.crop(tuple(result_box))
         except ValueError as e:
-            log.error(f"❌ 裁剪区域超出图像范围: {result_box} - {str(e)}")
+            records.append(
+                (logging.ERROR, f"❌ 裁剪区域超出图像范围: {result_box} - {str(e)}")
+            )
             continue
 
         # 如果精灵被旋转，执行逆时针90度旋转恢复原始方向
@@ -423,19 +456,131 @@ def gen_png_from_plist(plist_path, plist_data, png_path):
         # 使用精灵本身作为遮罩，保留透明度
         result_image.paste(rect_on_big, tuple(position), rect_on_big)
 
-        # 创建输出目录（按图集名称分组）
-        # 例如：atlas-0.plist -> atlas（移除序号部分）
-        atlas_base_name = plist_path.stem.split("-")[0]
-        output_dir = config.output_path / atlas_base_name
-        output_dir.mkdir(exist_ok=True)  # 确保目录存在
-
         # 保存精灵图片，使用PNG格式保留透明度
         output_file = output_dir / f"{framename}.png"
         try:
             result_image.save(output_file, "PNG")
-            log.info(f"🖼️ 生成图像: {output_file.name}")
+            records.append((logging.INFO, f"🖼️ 生成图像: {output_file.name}"))
         except IOError as e:
-            log.error(f"❌ 保存图像失败: {output_file} - {str(e)}")
+            records.append(
+                (logging.ERROR, f"❌ 保存图像失败: {output_file} - {str(e)}")
+            )
+
+    return records
+
+
+def extract_shared_frames(shm_name, atlas_size, frames, output_dir):
+    """
+    在子进程中从共享内存里的图集提取一批精灵
+
+    图集只在主进程中解码一次，子进程直接读取共享内存，不复制整张图集
+
+    Args:
+        shm_name (str): 存放图集RGBA像素的共享内存名称
+        atlas_size (tuple): 图集尺寸 (宽, 高)
+        frames (list): [(帧名称, 帧数据), ...]
+        output_dir (Path): 精灵图片的输出目录
+
+    Returns:
+        list: 每个精灵的处理日志，见extract_frames
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        atlas_image = Image.frombuffer("RGBA", atlas_size, shm.buf, "raw", "RGBA", 0, 1)
+        records = extract_frames(atlas_image, frames, output_dir)
+
+        # 释放对共享内存的引用后才能关闭
+        del atlas_image
+        return records
+    finally:
+        shm.close()
+
+
+def gen_png_from_frames(atlas_name, frames, png_path, executor=None):
+    """
+    根据帧数据从图集大图中提取并生成单个精灵图片
+
+    处理流程：
+    1. 加载图集大图（只解码一次）
+    2. 将所有帧分批
+    3. 根据配置裁剪、旋转、定位精灵（有进程池时在子进程中并行处理）
+    4. 保存为单个.png文件
+
+    Args:
+        atlas_name (str): 图集名称，如atlas-0，用于确定输出目录
+        frames (dict): 帧名称到帧数据的字典，来自.plist文件或get_lua_data()
+        png_path (Path): 图集大图文件路径
+        executor (ProcessPoolExecutor, optional): 进程池，为None时在当前进程中处理
+
+    Raises:
+        FileNotFoundError: 当图集文件不存在时
+        KeyError: 当帧数据中缺少必要的键时
+        IOError: 当图片保存失败时
+
+    Note:
+        输出目录结构：输出路径/图集名称（不含序号）/精灵名称.png
+        例如：atlas-0 -> output/atlas/精灵1.png
+    """
+    # 打开图集大图，确保使用RGBA模式以支持透明度
+    try:
+        atlas_image = Image.open(png_path).convert("RGBA")
+    except FileNotFoundError:
+        log.error(f"❌ 图集文件不存在: {png_path}")
+        return
+
+    if not frames:
+        log.warning(f"⚠️ 图集中没有帧数据: {atlas_name}")
+        return
+
+    # 创建输出目录（按图集名称分组）
+    # 例如：atlas-0 -> atlas（移除序号部分）
+    atlas_base_name = atlas_name.split("-")[0]
+    output_dir = config.output_path / atlas_base_name
+    output_dir.mkdir(exist_ok=True)  # 确保目录存在
+
+    frames = list(frames.items())
+
+    # 单进程时直接处理
+    if executor is None:
+        records = extract_frames(atlas_image, frames, output_dir)
+        for level, message in records:
+            log.log(level, message)
+        return
+
+    # 图集像素放入共享内存，供所有子进程只读访问，主进程中的图集随即释放
+    atlas_size = atlas_image.size
+    atlas_bytes = atlas_image.tobytes()
+    atlas_image.close()
+    shm = shared_memory.SharedMemory(create=True, size=max(len(atlas_bytes), 1))
+    futures = []
+    try:
+        shm.buf[: len(atlas_bytes)] = atlas_bytes
+        del atlas_bytes
+
+        # 每个进程分到多批任务，使各进程的负载更均衡
+        batch_size = math.ceil(len(frames) / (get_max_workers() * 4))
+        futures = [
+            executor.submit(
+                extract_shared_frames,
+                shm.name,
+                atlas_size,
+                frames[i : i + batch_size],
+                output_dir,
+            )
+            for i in range(0, len(frames), batch_size)
+        ]
+
+        # 按帧的顺序输出日志
+        for future in futures:
+            for level, message in future.result():
+                log.log(level, message)
+    finally:
+        # 确保子进程不再使用后才释放共享内存
+        for future in futures:
+            future.cancel()
+        concurrent.futures.wait(futures)
+        shm.close()
+        shm.unlink()
 
 
 def main():
@@ -444,9 +589,8 @@ def main():
 
     完整处理流程：
     1. 获取输入文件（.lua和.plist）
-    2. 处理每个.plist文件（包括从.lua转换来的）
+    2. 解析每个文件中的图集和帧数据（.lua直接解析，不经过.plist）
     3. 从图集中提取精灵并保存为.png文件
-    4. 清理临时文件（根据配置）
 
     异常处理：
     - 捕获并记录处理过程中的异常
@@ -466,65 +610,50 @@ def main():
 
     success_count = 0
     error_count = 0
+    executor = None
 
     try:
-        # 步骤1: 获取所有需要处理的.plist文件
-        plist_files = get_input_items()
+        # 步骤1: 获取所有需要处理的.lua和.plist文件
+        item_files = get_input_items()
 
-        if not plist_files:
+        if not item_files:
             log.warning("⚠️ 未找到需要处理的文件")
             return False
 
-        log.info(f"📋 找到 {len(plist_files)} 个Plist文件待处理")
-
-        # 步骤2: 处理每个.plist文件
-        for plist_file in plist_files:
-            try:
-                log.info(f"🔧 处理Plist文件: {plist_file.name}")
-
-                # 加载.plist文件
-                with open(plist_file, "rb") as file:
-                    plist_data = load_plist(file)
+        log.info(f"📋 找到 {len(item_files)} 个文件待处理")
 
-                # 验证.plist文件格式（必须包含metadata部分）
-                if not plist_data.get("metadata"):
-                    log.warning(f"⚠️ 无效的Plist文件格式，跳过: {plist_file.name}")
-                    error_count += 1
-                    continue
+        # 多进程时所有图集共用一个进程池
+        if get_max_workers() > 1:
+            executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=get_max_workers()
+            )
 
-                # 获取图集文件名（从metadata中）
-                atlas_file_name = plist_data["metadata"].get(
-                    "realTextureFileName",
-                    plist_data["metadata"].get("textureFileName", ""),
-                )
-
-                if not atlas_file_name:
-                    log.warning(f"⚠️ 无法获取图集文件名，跳过: {plist_file.name}")
-                    error_count += 1
-                    continue
+        # 步骤2: 处理每个文件
+        for item_file in item_files:
+            try:
+                log.info(f"🔧 处理文件: {item_file.name}")
 
-                # 检查图集文件是否存在
-                atlas_image_path = config.input_path / atlas_file_name
-                if not atlas_image_path.exists():
-                    log.warning(f"⚠️ 图集文件不存在: {atlas_file_name}，跳过")
+                # 解析出文件中的图集和帧数据
+                atlases = get_item_atlases(item_file)
+                if atlases is None:
                     error_count += 1
                     continue
 
-                # 步骤3: 从图集中提取精灵
-                gen_png_from_plist(plist_file, plist_data, atlas_image_path)
-                success_count += 1
-                log.info(f"✅ 图集拆分完毕: {atlas_file_name}\n")
+                for atlas_name, atlas_file_name, frames in atlases:
+                    # 检查图集文件是否存在
+                    atlas_image_path = config.input_path / atlas_file_name
+                    if not atlas_image_path.exists():
+                        log.warning(f"⚠️ 图集文件不存在: {atlas_file_name}，跳过")
+                        error_count += 1
+                        continue
 
-                # 步骤4: 根据设置删除临时.plist文件
-                if setting.get("delete_temporary_plist", False):
-                    try:
-                        plist_file.unlink()
-                        log.info(f"🗑️  已删除临时文件: {plist_file.name}")
-                    except Exception as e:
-                        log.warning(f"⚠️ 删除临时文件失败: {plist_file.name} - {str(e)}")
+                    # 步骤3: 从图集中提取精灵
+                    gen_png_from_frames(atlas_name, frames, atlas_image_path, executor)
+                    success_count += 1
+                    log.info(f"✅ 图集拆分完毕: {atlas_file_name}\n")
 
             except Exception as e:
-                log.error(f"❌ 处理失败: {plist_file.name} - {str(e)}")
+                log.error(f"❌ 处理失败: {item_file.name} - {str(e)}")
                 error_count += 1
                 traceback.print_exc()
                 continue  # 继续处理下一个文件
@@ -534,6 +663,10 @@ def main():
         traceback.print_exc()
         return False
 
+    finally:
+        if executor:
+            executor.shutdown()
+
     # 输出处理结果汇总
     log.info("=" * 50)
     log.info("图集拆分流程完成")
@@ -1,3 +1,3 @@
-pip3 install Pillow lupa jinja2
+pip3 install Pillow lupa jinja2 numpy
 
 pause
\ No newline at end of file